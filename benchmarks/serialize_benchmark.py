@@ -0,0 +1,69 @@
+# Compares the response serializer with the row by row version it replaced.
+# usage: python benchmarks/serialize_benchmark.py [rows]
+import sys
+import os
+import timeit
+from datetime import datetime, timedelta
+import polars as pl
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.serialize import df_to_list_of_dicts
+from src.database import FactTable
+
+
+def legacy_df_to_list_of_dicts(df):
+    # the previous api.df_to_list_of_dicts, kept here only as the baseline
+    new_df_dict = {}
+    all_records = []
+    df_columns = df.columns
+    for row in df.iter_rows():
+        num = 0
+        for col in df.columns:
+            new_df_dict[col] = row[df_columns.index(col)]
+            num += 1
+            if num % len(df_columns) == 0:
+                all_records.append(new_df_dict.copy())
+
+    return all_records
+
+
+def fact_table_frame(rows: int) -> pl.DataFrame:
+    # a frame shaped like the fact table: 24 columns of strings, ints, floats and timestamps
+    data = {}
+    start = datetime(2017, 1, 1)
+    for column in FactTable.__table__.columns:
+        type_name = type(column.type).__name__
+        if type_name == 'Integer':
+            data[column.name] = pl.int_range(0, rows, eager=True)
+        elif type_name == 'Float':
+            data[column.name] = pl.int_range(0, rows, eager=True).cast(pl.Float64) / 3
+        elif type_name == 'DateTime':
+            data[column.name] = pl.datetime_range(start, start + timedelta(minutes=rows - 1),
+                                                  interval='1m', eager=True)
+        else:
+            data[column.name] = pl.int_range(0, rows, eager=True).cast(pl.Utf8)
+    return pl.DataFrame(data)
+
+
+def best_of(func, repeat=5):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    df = fact_table_frame(rows)
+    assert df_to_list_of_dicts(df) == legacy_df_to_list_of_dicts(df)
+
+    cases = [
+        (f"whole frame, {rows} rows x {len(df.columns)} columns",
+         lambda: legacy_df_to_list_of_dicts(df), lambda: df_to_list_of_dicts(df)),
+        #what a loader used to do with a whole upload versus the 5 rows it returns
+        ("response body of a load (5 rows echoed back)",
+         lambda: legacy_df_to_list_of_dicts(df)[:5], lambda: df_to_list_of_dicts(df, limit=5)),
+    ]
+    for name, legacy, current in cases:
+        legacy_seconds = best_of(legacy, repeat=3)
+        current_seconds = best_of(current)
+        print(f"{name}: legacy {legacy_seconds * 1000:.2f} ms, "
+              f"columnar {current_seconds * 1000:.2f} ms, {legacy_seconds / current_seconds:.1f}x faster")
@@ -1,16 +1,37 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, make_response
 import polars
 import pandas as pd
 import numpy as np
 import sys
 import os
+import time
+import uuid
+import zipfile
+import shutil
+import threading
+import gzip
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from werkzeug.utils import secure_filename
+from werkzeug.wsgi import LimitedStream
+from werkzeug.exceptions import HTTPException, BadRequest, RequestEntityTooLarge
 from flask_swagger_ui import get_swaggerui_blueprint
-from src.processing import (load_data,transform__df,process_fact_table,process_dim_table_df,get_top_sellers)
+from src.processing import (load_data_batched,process_fact_table)
+from sqlalchemy import func, or_, and_
 from sqlalchemy.orm import Session
-from src.database import (get_db, Sellers,Customers,Orders,Order_Items,Products,Product_Category,FactTable,Order_Payments,Top_Sellers)
+from src.database import (get_db, init_db, get_raw_connection, query_to_arrow, TABLE_MODELS, Sellers,Customers,Orders,Order_Items,Products,Product_Category,FactTable,Order_Payments,Top_Sellers)
+from src.ingest import (LOAD_MODES, UPLOAD_TABLES, UPLOAD_EXTENSIONS, upload_extension, ingest_batches,
+                        file_digest, stream_digest, find_ingest, record_ingest, InvalidUploadError)
+from src.warehouse import (build_fact_table_sql, build_fact_table_incremental, build_fact_table_streaming,
+                           build_top_sellers, empty_dimension_tables, check_integrity,
+                           rebuild_table_from_frame, rollback_table, read_fact_table_sources, REBUILT_TABLES)
+from src.serialize import df_to_list_of_dicts
+from src.keys import NATURAL_IDS, visible_columns, decode_keys, decode_records
+from src.pipeline import ArchiveTooLargeError, extract_zip, table_for_file, parse_files, load_tables
+from src.validation import validate_file
+from src.schemas import TABLE_SCHEMAS
+from src.export import ARROW_FORMATS, EXPORT_FORMATS, stream_table, encode_arrow_table
+from src.jobs import JobQueue, NoJobProgress, get_job, fail_interrupted_jobs
 
 import polars as pl
 import logging
@@ -22,8 +43,60 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+
+class GzipRequestMiddleware:
+    # Request bodies sent with Content-Encoding: gzip are decompressed as flask reads them,
+    # so a gzipped multipart upload is parsed like a plain one without being expanded first.
+    # The body is bounded by its compressed length, the decompressed length is unknown, so
+    # the decompressed stream is cut off at MAX_DECOMPRESSED_LENGTH: reading past it raises
+    # RequestEntityTooLarge (413) instead of inflating a gzip bomb onto disk or into memory.
+
+    def __init__(self, wsgi_app, config):
+        self.wsgi_app = wsgi_app
+        self.config = config
+
+    def __call__(self, environ, start_response):
+        if environ.get('HTTP_CONTENT_ENCODING', '').strip().lower() == 'gzip':
+            body = environ['wsgi.input']
+            content_length = environ.pop('CONTENT_LENGTH', '')
+            if content_length.isdigit():
+                body = LimitedStream(body, int(content_length))
+            environ['wsgi.input'] = LimitedStream(gzip.GzipFile(fileobj=body, mode='rb'),
+                                                  self.config['MAX_DECOMPRESSED_LENGTH'], is_max=True)
+            environ['wsgi.input_terminated'] = True
+            del environ['HTTP_CONTENT_ENCODING']
+        return self.wsgi_app(environ, start_response)
+
+
+app.wsgi_app = GzipRequestMiddleware(app.wsgi_app, app.config)
+#most bytes a gzip encoded request body, or the Olist files of a zip sent to /api/load_pipeline,
+#may decompress to
+app.config['MAX_DECOMPRESSED_LENGTH'] = int(os.environ.get('MAX_DECOMPRESSED_LENGTH', 1 << 30))
+
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_entity_too_large(e):
+    return jsonify({'status': 'error', 'error': 'The request body is too large'}), 413
+
+
+#a request the client got wrong, e.g. a body sent with Content-Encoding: gzip that is not gzip
+@app.errorhandler(BadRequest)
+def bad_request(e):
+    return jsonify({'status': 'error', 'error': f'Bad request: {e.description}'}), 400
+
 #configuring upload folder
 app.config['UPLOAD_FOLDER'] = 'uploads'
+#number of rows read, validated and written at a time by the loaders
+app.config['INGEST_BATCH_SIZE'] = int(os.environ.get('INGEST_BATCH_SIZE', 100000))
+#threads parsing the files of a pipeline upload, by default one per file up to the cpu count
+app.config['PIPELINE_WORKERS'] = int(os.environ.get('PIPELINE_WORKERS', 0)) or None
+#threads reading the source tables of the in-python fact build, by default one per table
+#up to the cpu count
+app.config['READ_WORKERS'] = int(os.environ.get('READ_WORKERS', 0)) or None
+#number of rows encoded and sent at a time by the export endpoint
+app.config['EXPORT_BATCH_SIZE'] = int(os.environ.get('EXPORT_BATCH_SIZE', 50000))
+#threads running the background jobs queued with ?async=true
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
 
 #ensuring upload folder exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -38,1203 +111,751 @@ swaggerui_blueprint = get_swaggerui_blueprint(
 )
 app.register_blueprint(swaggerui_blueprint, url_prefix=SWAGGER_URL)
 
+job_queue = JobQueue(workers=app.config['JOB_WORKERS'])
 
-def df_to_list_of_dicts(df):
-    new_df_dict = {}
-    all_records = []
-    df_columns = df.columns
-    for row in df.iter_rows():
-        num = 0
-        for col in df.columns:
-            new_df_dict[col] = row[df_columns.index(col)]
-            num += 1
-            if num % len(df_columns) == 0:
-                all_records.append(new_df_dict.copy()) #get the dataframe records into a list of dictionaries,
-    
-    return all_records
-
-# list_dicts_df = df_to_list_of_dicts(df)
-# json_df = jsonify(list_dicts_df)
-# print(json_df)
 
-@app.route('/api/load_sellers_data', methods=['POST'])
-def api_load_sellers_data(
-):
+def async_requested() -> bool:
+    # ?async=true queues the work as a background job instead of running it in the request
+    return request.args.get('async', 'false').lower() == 'true'
+
+
+def run_as_job(job_type, job_key, work, cleanup=None):
+    # Runs work(progress) in the request, or with ?async=true queues it and answers 202 with
+    # the job id straight away. work returns the endpoint's usual response, a queued job
+    # stores its body and status code as the job result. job_key may be a function, it is
+    # only called when the work is queued. cleanup runs once the work is done, or at once
+    # when an identical job is already running and the work is dropped.
+    if not async_requested():
+        try:
+            return work(NoJobProgress())
+        finally:
+            if cleanup is not None:
+                cleanup()
+
+    def run(progress):
+        try:
+            with app.app_context():
+                response = make_response(work(progress))
+                return response.get_json(), response.status_code
+        finally:
+            if cleanup is not None:
+                cleanup()
+
+    job_id, coalesced = job_queue.submit(job_type, job_key() if callable(job_key) else job_key, run)
+    if coalesced and cleanup is not None:
+        cleanup()
+    return jsonify({
+        'status': 'accepted',
+        'job_id': job_id,
+        'coalesced': coalesced,
+        'status_url': f'/api/jobs/{job_id}'
+    }), 202
+
+
+def load_table_from_upload(count_key):
+    # shared body of every /api/load_*_data endpoint: save the upload, validate it, then
+    # stream it into the database batch by batch, each batch bulk inserted with a single
+    # statement. Every load is recorded in the ingest manifest by the hash of the file, the
+    # same file sent again to the same table and mode gets the first load's answer back
+    # (force=true loads it again)
+    upload_table = UPLOAD_TABLES[count_key]
+    model = upload_table['model']
+    table_label = upload_table['label']
+    required_columns = upload_table['columns']
     try:
         if 'file' not in request.files:
             return jsonify({'error': 'No file part'})
         file = request.files['file']
         if file.filename == '':
             return jsonify({'error': 'No selected file'})
-        if file and file.filename.endswith('.csv'):
-            filename = secure_filename(file.filename)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
-            
+        if not file.filename.endswith(UPLOAD_EXTENSIONS):
+            return jsonify({'status': 'error',
+                            'error': f'Invalid file format, Kindly provide the {table_label} csv (optionally gz, bz2, zst '
+                                     f'or zip compressed), parquet or arrow file'}), 400
+        mode = request.args.get('mode', 'append')
+        if mode not in LOAD_MODES:
+            return jsonify({'status': 'error',
+                            'error': f'mode must be one of {", ".join(LOAD_MODES)}'}), 400
+
+        #hashed as it is read, an upload already loaded is answered without saving or parsing it
+        content_hash = stream_digest(file.stream)
+        file.stream.seek(0)
+        if request.args.get('force', 'false').lower() != 'true':
+            with get_db() as db:
+                previous = find_ingest(db, model.__tablename__, content_hash, mode)
+            if previous is not None:
+                logger.info(f"{table_label} upload {content_hash} was loaded at {previous['ingested_at']}, skipped")
+                return jsonify({**previous['summary'], 'skipped': True,
+                                'ingested_at': previous['ingested_at']}), 200
+
+        filename = secure_filename(file.filename)
+        cleanup = None
+        if async_requested():
+            #a queued load reads its own copy of the upload, removed once it is loaded
+            filename = f"{uuid.uuid4().hex}_{filename}"
+        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        file.save(file_path)
+        if async_requested():
+            cleanup = lambda: os.remove(file_path)
+        batch_size = app.config['INGEST_BATCH_SIZE']
+
+        def work(progress):
             try:
-                df = load_data(file_path)
-                # df = df.head(15000)
-                df = transform__df(df)
-                print("df", df.head())
-                list_dicts_df = df_to_list_of_dicts(df)
-                #if list_dicts_df do not have specific columns, return error
-                sellers_df_columns = ['seller_id', 'seller_zip_code_prefix', 'seller_city', 'seller_state']
-                if not all(col in list_dicts_df[0] for col in sellers_df_columns):
-                    return jsonify({'error': 'Invalid file, Kindly provide the Sellers csv file'
-                                    }), 400
-
-                with get_db() as db:
+                #the whole file is checked before a row is typed or written, a bad upload is
+                #turned away with the report of what is wrong with it
+                with progress.stage('validate'):
+                    validation = validate_file(count_key, file_path, batch_size=batch_size)
+                if not validation['valid']:
+                    logger.error(f"Invalid {table_label} upload: {'; '.join(validation['errors'])}")
+                    error = (f'Invalid file, Kindly provide the {table_label} csv file'
+                             if validation['missing_columns']
+                             else f"Invalid {table_label} file: {'; '.join(validation['errors'])}")
+                    return jsonify({'status': 'error', 'error': error, 'validation': validation}), 400
+
+                df_batches = load_data_batched(file_path, batch_size=batch_size,
+                                               schema=TABLE_SCHEMAS[model.__tablename__])
+                if isinstance(df_batches, str):
+                    raise ValueError(df_batches)
+
+                with get_db(write=True) as db:
                     try:
-                        # Convert list of dictionaries to a list of tuples for better performance
-                        seller_ids = tuple(record['id'] for record in list_dicts_df)
-                        # Use a single query to check for existing sellers
-                        existing_sellers = db.query(Sellers).filter(Sellers.id.in_(seller_ids)).all()
-                        print("existing_sellers", existing_sellers)
-                        logger.info(f"Found {len(existing_sellers)} existing sellers")
-                        # Create a set of existing seller IDs for faster lookup
-                        existing_seller_ids = {seller.id for seller in existing_sellers}
-                        # Insert only new sellers
-                        new_sellers = []
-                        for record in list_dicts_df:
-                            if record['id'] not in existing_seller_ids:
-                                seller = Sellers(
-                                    id = record['id'],
-                                    seller_id=record['seller_id'],
-                                    seller_zip_code_prefix=record['seller_zip_code_prefix'],
-                                    seller_city=record['seller_city'],
-                                    seller_state=record['seller_state']
-                                )
-                                new_sellers.append(seller)
-                                db.add(seller)
-                                db.commit()
-                                db.refresh(seller)
-                        
-                        sellers_list = []
-                        
-                        for seller in new_sellers:
-                            sellers_dict = {}
-                            sellers_dict['id'] = seller.id
-                            sellers_dict['seller_id'] = seller.seller_id
-                            sellers_dict['seller_zip_code_prefix'] = seller.seller_zip_code_prefix
-                            sellers_dict['seller_city'] = seller.seller_city
-                            sellers_dict['seller_state'] = seller.seller_state
-                            sellers_list.append(sellers_dict)
-
-                        return jsonify({
+                        with progress.stage('ingest'):
+                            result = ingest_batches(db, model, df_batches, required_columns, mode=mode,
+                                                    commit=False, progress=progress.progress)
+                        summary = {
                             'status': 'success',
                             'message': 'Data processed successfully',
-                            'body': sellers_list[:5],
-                            'new_sellers_count': len(new_sellers),
-                            'existing_sellers_count': len(existing_sellers)
-                        }), 200
+                            'body': df_to_list_of_dicts(decode_keys(get_raw_connection(db), result['preview'])),
+                            f'new_{count_key}_count': result['new_count'],
+                            f'existing_{count_key}_count': result['existing_count'],
+                            'rows_read': result['rows_read'],
+                            'ingest_seconds': result['ingest_seconds'],
+                            'rows_per_second': result['rows_per_second'],
+                            'mode': mode,
+                            'validation': validation
+                        }
+                        record_ingest(db, model.__tablename__, content_hash, mode, filename, result, summary)
+                        db.commit()
+                        invalidate_counts(model.__tablename__)
+
+                        return jsonify(summary), 200
+                    except InvalidUploadError as invalid_error:
+                        logger.error(f"Invalid {table_label} upload: {str(invalid_error)}")
+                        #if the file does not have the specific columns, return error
+                        return jsonify({'status': 'error',
+                                        'error': f'Invalid file, Kindly provide the {table_label} csv file'
+                                        }), 400
                     except Exception as db_error:
                         db.rollback()
                         logger.error(f"Database operation failed: {str(db_error)}")
-                        return jsonify({'error': 'Database operation failed', 'details': str(db_error)}), 500
+                        return jsonify({'status': 'error',
+                                        'error': 'Database operation failed', 'details': str(db_error)}), 500
             except Exception as e:
-                logger.error(f"Error loading the dataset, kindly provide the valid sellers dataset: {str(e)}")
-                return jsonify({'status':'error',
-                                'error': str(e)}), 500
-                    
+                logger.error(f"Error loading the dataset, kindly provide the valid {table_label.lower()} dataset: {str(e)}")
+                return jsonify({'status': 'error', 'error': str(e)}), 500
+
+        return run_as_job(f'load_{count_key}', f'load_{count_key}:{mode}:{content_hash}', work, cleanup=cleanup)
+
+    except HTTPException:
+        #answered by the error handlers, a body the client got wrong is not a server error
+        raise
     except Exception as e:
         logger.error(f"An error occurred: {str(e)}")
-        return jsonify({'status':'error',
-                        'error': str(e)}), 500
-    
+        return jsonify({'status': 'error', 'error': str(e)}), 500
+
+#rows returned by the get endpoints when no limit is asked for, and the most they return
+app.config['GET_DEFAULT_LIMIT'] = int(os.environ.get('GET_DEFAULT_LIMIT', 5))
+app.config['GET_MAX_LIMIT'] = int(os.environ.get('GET_MAX_LIMIT', 1000))
+#how long a table's row count is reused by the get endpoints, loads clear it straight away
+app.config['COUNT_CACHE_SECONDS'] = float(os.environ.get('COUNT_CACHE_SECONDS', 30))
+
+_count_cache = {}
+_count_cache_lock = threading.Lock()
+
+
+def count_rows(db, model):
+    # COUNT(*) for the table, cached per table for COUNT_CACHE_SECONDS
+    table_name = model.__tablename__
+    now = time.monotonic()
+    with _count_cache_lock:
+        cached = _count_cache.get(table_name)
+    if cached is not None and now - cached[1] < app.config['COUNT_CACHE_SECONDS']:
+        return cached[0]
+
+    count = db.query(func.count(model.id)).scalar()
+    with _count_cache_lock:
+        _count_cache[table_name] = (count, now)
+    return count
+
+
+def invalidate_counts(*table_names):
+    # called after every write so the next get reports the new row count
+    with _count_cache_lock:
+        if not table_names:
+            _count_cache.clear()
+        for table_name in table_names:
+            _count_cache.pop(table_name, None)
+
+
+def parse_page_args(model):
+    # limit, after_id and order_by query parameters shared by the get endpoints,
+    # order_by is a column of the table, prefixed with '-' for descending order
+    limit = request.args.get('limit', str(app.config['GET_DEFAULT_LIMIT']))
+    limit = int(limit) if limit.isdigit() else 0
+    if limit < 1 or limit > app.config['GET_MAX_LIMIT']:
+        raise ValueError(f"limit must be a number between 1 and {app.config['GET_MAX_LIMIT']}")
+
+    after_id = None
+    if request.args.get('after_id') is not None:
+        after_id = request.args.get('after_id', type=int)
+        if after_id is None:
+            raise ValueError("after_id must be the id of a row")
+
+    order_by = request.args.get('order_by', 'id')
+    descending = order_by.startswith('-')
+    order_column = order_by.lstrip('-')
+    if order_column not in model.__table__.columns.keys():
+        raise ValueError(f"Cannot order by {order_column}, it is not a column of {model.__tablename__}")
+
+    return limit, after_id, order_column, descending
+
+
+def page_query(db, model, limit, after_id=None, order_column='id', descending=False):
+    # Keyset pagination: the page starts right after the row whose id is after_id in the
+    # requested order, so the database seeks to it instead of reading and skipping the rows
+    # before it. Ties and nulls in the order column are broken by id, nulls sort last.
+    column = getattr(model, order_column)
+    query = db.query(model)
+
+    if after_id is not None:
+        if order_column == 'id':
+            query = query.filter(model.id < after_id if descending else model.id > after_id)
+        else:
+            cursor = db.query(column).filter(model.id == after_id).first()
+            if cursor is None:
+                raise LookupError(f"No {model.__tablename__} row with id {after_id}")
+            cursor_value = cursor[0]
+            after_in_ties = model.id < after_id if descending else model.id > after_id
+            if cursor_value is None:
+                query = query.filter(column.is_(None), after_in_ties)
+            else:
+                query = query.filter(or_(
+                    column < cursor_value if descending else column > cursor_value,
+                    and_(column == cursor_value, after_in_ties),
+                    column.is_(None)))
+
+    if order_column == 'id':
+        ordering = [model.id.desc() if descending else model.id]
+    else:
+        ordering = [(column.desc() if descending else column.asc()).nullslast(),
+                    model.id.desc() if descending else model.id]
+    return query.order_by(*ordering).limit(limit)
+
+
+#formats the get endpoints can answer in, picked with ?format= or the Accept header
+PAGE_FORMATS = {'json': 'application/json', **ARROW_FORMATS}
+
+
+def negotiate_format(formats, default):
+    # an explicit ?format= wins over the Accept header, None when it is not one of formats
+    requested = request.args.get('format')
+    if requested is not None:
+        return requested if requested in formats else None
+    mimetype = request.accept_mimetypes.best_match(list(formats.values()), default=formats[default])
+    return next(name for name, value in formats.items() if value == mimetype)
+
+
+def arrow_page_response(db, model, query, response_format, count_key, limit):
+    # the page as an Arrow IPC stream or a Parquet file, built from the Arrow result of the
+    # query without going through python objects; the paging details move to headers
+    table = query_to_arrow(db, query)
+    table = table.rename_columns(model.__table__.columns.keys())
+    table = table.select(visible_columns(table.column_names))
+    if any(col in NATURAL_IDS for col in table.column_names):
+        table = decode_keys(get_raw_connection(db), pl.from_arrow(table)).to_arrow()
+    ids = table.column('id')
+    next_after_id = ids[len(ids) - 1].as_py() if len(ids) == limit else None
+    headers = {f'X-{count_key.replace("_", "-").title()}': str(count_rows(db, model)),
+               'X-Limit': str(limit),
+               'X-Next-After-Id': '' if next_after_id is None else str(next_after_id)}
+    return Response(encode_arrow_table(table, response_format),
+                    mimetype=PAGE_FORMATS[response_format], headers=headers)
+
+
+def get_table_page(model, table_label, count_key='count_records'):
+    # shared body of every /api/get_* endpoint: one page of rows read with LIMIT and
+    # the table's row count, without loading the rest of the table
+    try:
+        limit, after_id, order_column, descending = parse_page_args(model)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 400
+
+    response_format = negotiate_format(PAGE_FORMATS, 'json')
+    if response_format is None:
+        return jsonify({'status': 'error',
+                        'error': f'format must be one of {", ".join(PAGE_FORMATS)}'}), 400
 
-@app.route('/api/get_sellers', methods=['GET'])
-def api_get_sellers():
     with get_db() as db:
         try:
-            sellers = db.query(Sellers).all()
-            sellers_filtered= sellers[:5]
-            print("all sellers, ", sellers_filtered)
-            sellers_list = []
-            if sellers_filtered:
-                for seller in sellers_filtered:
-                    sellers_list.append({
-                        'id': seller.id,
-                        'seller_id': seller.seller_id,
-                        'seller_zip_code_prefix': seller.seller_zip_code_prefix,
-                        'seller_city': seller.seller_city,
-                        'seller_state': seller.seller_state
-                    })
-
-                return jsonify({"status": "success",
-                                "message": "Sellers data retrieved successfully",
-                                "body":  sellers_list,
-                                "count_records": len(sellers) }), 200
-            else:
-                return jsonify({"status": "success",
-                                "message": "No Sellers data available",
-                                "body":  sellers_list
-                            }), 200
-        
+            query = page_query(db, model, limit, after_id, order_column, descending)
+            if response_format in ARROW_FORMATS:
+                return arrow_page_response(db, model, query, response_format, count_key, limit)
+
+            rows = query.all()
+            columns = visible_columns(model.__table__.columns.keys())
+            rows_list = [{col: getattr(row, col) for col in columns} for row in rows]
+            rows_list = decode_records(get_raw_connection(db), rows_list)
+
+            response = {"status": "success",
+                        "message": f"{table_label} data retrieved successfully",
+                        "body": rows_list,
+                        count_key: count_rows(db, model),
+                        "limit": limit,
+                        "next_after_id": rows_list[-1]['id'] if len(rows_list) == limit else None}
+            if not rows_list:
+                response["message"] = f"No {table_label} data available"
+            return jsonify(response), 200
+
+        except LookupError as e:
+            return jsonify({'status': 'error', 'error': str(e)}), 404
         except Exception as e:
-            logger.error(f"An error occurred retrieving all brands: {str(e)}")
-            
-            return jsonify({'status':  'error',
-                            'error': f'retrieving sellers data: {str(e)}'}), 500
+            logger.error(f"An error occurred retrieving {table_label.lower()}: {str(e)}")
+            return jsonify({'status': 'error',
+                            'error': f'error retrieving {table_label} data: {str(e)}'}), 500
+
+
+@app.route('/api/load_sellers_data', methods=['POST'])
+def api_load_sellers_data():
+    return load_table_from_upload('sellers')
+
+
+@app.route('/api/get_sellers', methods=['GET'])
+def api_get_sellers():
+    return get_table_page(Sellers, 'Sellers')
 
 
 @app.route('/api/load_customers_data', methods=['POST'])
-def api_load_customers_data(
-):
-    try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file part'})
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'error': 'No selected file'})
-        if file and file.filename.endswith('.csv'):
-            filename = secure_filename(file.filename)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
-            
-            try:
-                df = load_data(file_path)
-                df = df.head(10000)
-                df = transform__df(df)
-                print("df", df.head())
-                list_dicts_df = df_to_list_of_dicts(df)
-                #if list_dicts_df do not have specific columns, return error
-                customers_df_columns = ['customer_id', 'customer_unique_id', 
-                                      'customer_zip_code_prefix', 'customer_city',
-                                      'customer_state']
-                
-                if not all(col in list_dicts_df[0] for col in customers_df_columns):
-                    return jsonify({'error': 'Invalid file, Kindly provide the Customers csv file'
-                                    }), 400
-
-                with get_db() as db:
-                    try:
-                        # Convert list of dictionaries to a list of tuples for better performance
-                        customer_ids = tuple(record['id'] for record in list_dicts_df)
-                        # Use a single query to check for existing sellers
-                        existing_customers = db.query(Customers).filter(Customers.id.in_(customer_ids)).all()
-                        # print("existing_customers", existing_customers)
-                        logger.info(f"Found {len(existing_customers)} existing existing_customers")
-                        # Create a set of existing seller IDs for faster lookup
-                        existing_customer_ids = {customer.id for customer in existing_customers}
-                        # Insert only new sellers
-                        new_customers = []
-                        for record in list_dicts_df:
-                            if record['id'] not in existing_customer_ids:
-                                customer = Customers(
-                                    id = record['id'],
-                                    customer_id=record['customer_id'],
-                                    customer_unique_id=record['customer_unique_id'],
-                                    customer_zip_code_prefix=record['customer_zip_code_prefix'],
-                                    customer_city=record['customer_city'],
-                                    customer_state = record['customer_state']
-                                )
-                                new_customers.append(customer)
-                                db.add(customer)
-                                db.commit()
-                                db.refresh(customer)
-                        
-                        customers_list = []
-                        
-                        for customer in new_customers:
-                            customers_dict = {}
-                            customers_dict['id'] = customer.id
-                            customers_dict['customer_id'] = customer.customer_id
-                            customers_dict['customer_unique_id'] = customer.customer_unique_id
-                            customers_dict['customer_zip_code_prefix'] = customer.customer_zip_code_prefix
-                            customers_dict['customer_city'] = customer.customer_city
-                            customers_dict['customer_state'] = customer.customer_state
-                            customers_list.append(customers_dict)
-                        
-                        return jsonify({
-                            'status': 'success',
-                            'message': 'Data processed successfully',
-                            'body': customers_list[:5],
-                            'new_customers_count': len(new_customers),
-                            'existing_customers_count': len(existing_customers)
-                        }), 200
-                    except Exception as db_error:
-                        db.rollback()
-                        logger.error(f"Database operation failed: {str(db_error)}")
-                        return jsonify({'error': 'Database operation failed', 'details': str(db_error)}), 500
-            except Exception as e:
-                logger.error(f"Error loading the dataset, kindly provide the valid customers dataset: {str(e)}")
-                return jsonify({'status':'error','error': str(e)}), 500
-                    
-    except Exception as e:
-        logger.error(f"An error occurred: {str(e)}")
-        return jsonify({'error': str(e)}), 500
-                    
+def api_load_customers_data():
+    return load_table_from_upload('customers')
+
+
 @app.route('/api/get_customers', methods=['GET'])
 def api_get_customers():
-    with get_db() as db:
-        try:
-            customers = db.query(Customers).all()
-            customers_fitered= customers[:5]
-            # print("all customers, ", customers_fitered)
-            customers_list = []
-            if customers_fitered:
-                for customer in customers_fitered:
-                    customers_list.append({
-                        'id': customer.id,
-                        'customer_id': customer.customer_id,
-                        'customer_unique_id': customer.customer_unique_id,
-                        'customer_zip_code_prefix': customer.customer_zip_code_prefix,
-                        'customer_city': customer.customer_city,
-                        'customer_state': customer.customer_state
-                    })
-
-                return jsonify({"status": "success",
-                                "message": "Customers data retrieved successfully",
-                                "body":  customers_list,
-                                "count": len(customers)
-                            }), 200
-            else:
-                return jsonify({"status": "success",
-                                "message": "No Customers data available",
-                                "body":  customers_list
-                            }), 200
-        
-        except Exception as e:
-            logger.error(f"An error occurred retrieving all customers: {str(e)}")
-            return jsonify({'status': 'error',
-                            'error':f' retrieving Customers data: {str(e)}'}), 500
+    return get_table_page(Customers, 'Customers', count_key='count')
 
 
 @app.route('/api/load_orders_data', methods=['POST'])
-def api_load_orders_data(
-):
-    try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file part'})
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'error': 'No selected file'})
-        if file and file.filename.endswith('.csv'):
-            filename = secure_filename(file.filename)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
-            
-            try:
-                df = load_data(file_path)
-                df = df.head(10000)
-                df = transform__df(df)
-                print("df", df.head())
-                list_dicts_df = df_to_list_of_dicts(df)
-                #if list_dicts_df do not have specific columns, return error
-                orders_df_columns = ['order_id', 'order_status', 
-                                      'order_purchase_timestamp',
-                                      'order_approved_at', 'order_delivered_carrier_date',
-                                      'order_delivered_customer_date', 'order_estimated_delivery_date']
-                
-                if not all(col in list_dicts_df[0] for col in orders_df_columns):
-                    return jsonify({'status':'error', 
-                    'error': 'Invalid file, Kindly provide the Orders csv file'
-                                    }), 400
-
-                with get_db() as db:
-                    try:
-                        # Convert list of dictionaries to a list of tuples for better performance
-                        order_ids = tuple(record['id'] for record in list_dicts_df)
-                        # Use a single query to check for existing sellers
-                        existing_orders = db.query(Orders).filter(Orders.id.in_(order_ids)).all()
-                        # print("existing_orders", existing_orders)
-                        logger.info(f"Found {len(existing_orders)} existing existing_orders")
-                        # Create a set of existing seller IDs for faster lookup
-                        existing_order_ids = {order.id for order in existing_orders}
-                        # Insert only new sellers
-                        new_orders = []
-                        for record in list_dicts_df:
-                            if record['id'] not in existing_order_ids:
-                                order = Orders(
-                                    id = record['id'],
-                                    order_id=record['order_id'],
-                                    customer_id=record['customer_id'],
-                                    order_status=record['order_status'],
-                                    order_purchase_timestamp=record['order_purchase_timestamp'],
-                                    order_approved_at = record['order_approved_at'],
-                                    order_delivered_carrier_date = record['order_delivered_carrier_date'],
-                                    order_delivered_customer_date = record['order_delivered_customer_date'],
-                                    order_estimated_delivery_date = record['order_estimated_delivery_date']
-                                )
-                                new_orders.append(order)
-                                db.add(order)
-                                db.commit()
-                                db.refresh(order)
-
-                        order_list = []
-                        for order in new_orders:
-                            order_dict = {}
-                            order_dict['id'] = order.id
-                            order_dict['order_id'] = order.order_id
-                            order_dict['customer_id'] = order.customer_id
-                            order_dict['order_status'] = order.order_status
-                            order_dict['order_purchase_timestamp'] = order.order_purchase_timestamp
-                            order_dict['order_approved_at'] = order.order_approved_at
-                            order_dict['order_delivered_carrier_date'] = order.order_delivered_carrier_date
-                            order_dict['order_delivered_customer_date'] = order.order_delivered_customer_date
-                            order_dict['order_estimated_delivery_date'] = order.order_estimated_delivery_date
-                            order_list.append(order_dict)
-
-                        return jsonify({
-                            'status': 'success',
-                            'message': 'Data processed successfully',
-                            'body': order_list[:5],
-                            'new_orders_count': len(new_orders),
-                            'existing_orders_count': len(existing_orders),
-                            
-                        }), 200
-                    
-                    except Exception as db_error:
-                        db.rollback()
-                        logger.error(f"Database operation failed: {str(db_error)}")
-                        return jsonify({'status': 'error',
-                                        'error': f'Database operation failed details {str(db_error)}'}), 500
-                    
-            except Exception as e:
-                logger.error(f"Error loading the dataset, kindly provide the valid orders dataset: {str(e)}")
-                return jsonify({'status': 'error', 'error': str(e)}), 500
-    
-    except Exception as e:
-        logger.error(f"An error occurred: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+def api_load_orders_data():
+    return load_table_from_upload('orders')
 
 
 @app.route('/api/get_orders', methods=['GET'])
 def api_get_orders():
-    with get_db() as db:
-        try:
-            orders = db.query(Orders).all()
-            orders_filtered= orders[:5]
-            orders_list = []
-            if orders_filtered:
-                for order in orders_filtered:
-                    orders_list.append({
-                        'id': order.id,
-                        'order_id': order.order_id,
-                        'order_status': order.order_status,
-                        'order_purchase_timestamp': order.order_purchase_timestamp,
-                        'order_approved_at': order.order_approved_at,
-                        'order_delivered_carrier_date': order.order_delivered_carrier_date,
-                        'order_delivered_customer_date': order.order_delivered_customer_date,
-                        'order_estimated_delivery_date': order.order_estimated_delivery_date
-                    })
-
-                return jsonify({"status": "success",
-                                "message": "Orders data retrieved successfully",
-                                "body":  orders_list,
-                                "count_records": len(orders)
-                            }), 200
-            else:
-                return jsonify({"status": "success",
-                                "message": "No Orders data available",
-                                "body":  orders_list
-                            }), 200
-            
-        except Exception as e:
-            logger.error(f"An error occurred retrieving all orders: {str(e)}")
-            return jsonify({f'status': 'error', 'error': f'error retrieving Orders data: {str(e)}'}), 500
-        
+    return get_table_page(Orders, 'Orders')
+
 
 @app.route('/api/load_order_items_data', methods=['POST'])
-def api_load_order_items_data(
-):
-    try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file part'})
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'error': 'No selected file'})
-        if file and file.filename.endswith('.csv'):
-            filename = secure_filename(file.filename)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
-            
-            try:
-                df = load_data(file_path)
-                df = df.head(10000)
-                df = transform__df(df)
-                print("df", df.head())
-                list_dicts_df = df_to_list_of_dicts(df)
-                #if list_dicts_df do not have specific columns, return error
-                order_items_df_columns = ['order_id', 'order_item_id', 'product_id', 
-                                      'seller_id', 'shipping_limit_date', 'price', 'freight_value']
-                
-                if not all(col in list_dicts_df[0] for col in order_items_df_columns):
-                    return jsonify({'status':'error','error': 'Invalid file, Kindly provide the Order Items csv file'
-                                    }), 400
-
-                with get_db() as db:
-                    try:
-                        # Convert list of dictionaries to a list of tuples for better performance
-                        order_ids = tuple(record['id'] for record in list_dicts_df)
-                        # Use a single query to check for existing orders
-                        existing_order_items = db.query(Order_Items).filter(Order_Items.id.in_(order_ids)).all()
-                        print("existing_order_items", existing_order_items)
-                        logger.info(f"Found {len(existing_order_items)} existing existing_order_items")
-                        # Create a set of existing order IDs for faster lookup
-                        existing_order_ids = {order_item.id for order_item in existing_order_items}
-                        # Insert only new orders
-                        new_order_items = []
-                        for record in list_dicts_df:
-                            if record['id'] not in existing_order_ids:
-                                order_item = Order_Items(
-                                    id = record['id'],
-                                    order_id=record['order_id'],
-                                    order_item_id=record['order_item_id'],
-                                    product_id=record['product_id'],
-                                    seller_id = record['seller_id'],
-                                    shipping_limit_date = record['shipping_limit_date'],
-                                    price = record['price'],
-                                    freight_value = record['freight_value']
-                                )
-                                new_order_items.append(order_item)
-                                db.add(order_item)
-                                db.commit()
-                                db.refresh(order_item)
-
-                        order_items_list = []
-                        
-                        for order_item in new_order_items:
-                            order_items_dict = {}
-                            order_items_dict['id'] = order_item.id
-                            order_items_dict['order_id'] = order_item.order_id
-                            order_items_dict['order_item_id'] = order_item.order_item_id
-                            order_items_dict['product_id'] = order_item.product_id
-                            order_items_dict['seller_id'] = order_item.seller_id
-                            order_items_dict['shipping_limit_date'] = order_item.shipping_limit_date
-                            order_items_dict['price'] = order_item.price
-                            order_items_dict['freight_value'] = order_item.freight_value
-                            order_items_list.append(order_items_dict)
-
-                        return jsonify({
-                            'status': 'success',
-                            'message': 'Data processed successfully',
-                            'body': order_items_list[:5],
-                            'new_order_items_count': len(new_order_items),
-                            'existing_order_items_count': len(existing_order_items)
-                        }), 200
-                    except Exception as db_error:
-                        db.rollback()
-                        logger.error(f"Database operation failed: {str(db_error)}")
-                        return jsonify({'status':'error', 'error': 'Database operation failed', 'details': str(db_error)}), 500
-            
-            except Exception as e:
-                logger.error(f"Error loading the dataset, kindly provide the valid order items dataset: {str(e)}")
-                return jsonify({'status':'error', 
-                
-                            'error': str(e)}), 500
-    
-    except Exception as e:
-        logger.error(f"An error occurred: {str(e)}")
-        return jsonify({'status': 'error', 
-        
-            'error': str(e)}), 500
+def api_load_order_items_data():
+    return load_table_from_upload('order_items')
 
 
 @app.route('/api/get_order_items', methods=['GET'])
 def api_get_order_items():
-    with get_db() as db:
-        try:
-            order_items = db.query(Order_Items).all()
-            order_items_filtered= order_items[:5]
-            order_items_list = []
-            if order_items_filtered:
-                for order_item in order_items_filtered:
-                    order_items_list.append({
-                        'id': order_item.id,
-                        'order_id': order_item.order_id,
-                        'order_item_id': order_item.order_item_id,
-                        'product_id': order_item.product_id,
-                        'seller_id': order_item.seller_id,
-                        'shipping_limit_date': order_item.shipping_limit_date,
-                        'price': order_item.price,
-                        'freight_value': order_item.freight_value
-                    })
-
-                return jsonify({"status": "success",
-                                "message": "Order Items data retrieved successfully",
-                                "body":  order_items_list,
-                                "count_records": len(order_items)
-                            }), 200
-            else:
-                return jsonify({"status": "success",
-                                "message": "No Order Items data available",
-                                "body":  order_items_list
-                            }), 200
-            
-        except Exception as e:
-            logger.error(f"An error occurred retrieving all order items: {str(e)}")
-        return jsonify({'status':'error', 
-                        
-                        'error':f'error retrieving Order Items data: {str(e)}'}), 500
+    return get_table_page(Order_Items, 'Order Items')
 
 
 @app.route('/api/load_order_payments_data', methods=['POST'])
-def api_load_order_payments_data(
-):
-    try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file part'})
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'error': 'No selected file'})
-        if file and file.filename.endswith('.csv'):
-            filename = secure_filename(file.filename)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
-            
-            try:
-                df = load_data(file_path)
-                df = df.head(10000)
-                df = transform__df(df)
-                print("df", df.head())
-                list_dicts_df = df_to_list_of_dicts(df)
-                #if list_dicts_df do not have specific columns, return error
-                order_payments_df_columns = ['order_id', 'payment_sequential', 'payment_type', 
-                                      'payment_installments', 'payment_value']
-                
-                if not all(col in list_dicts_df[0] for col in order_payments_df_columns):
-                    return jsonify({'error': 'Invalid file, Kindly provide the Order Payments csv file'
-                                    }), 400
-
-                with get_db() as db:
-                    try:
-                        # Convert list of dictionaries to a list of tuples for better performance
-                        order_ids = tuple(record['id'] for record in list_dicts_df)
-                        # Use a single query to check for existing orders
-                        existing_order_payments = db.query(Order_Payments).filter(Order_Payments.id.in_(order_ids)).all()
-                        print("existing_order_payments", existing_order_payments)
-                        logger.info(f"Found {len(existing_order_payments)} existing existing_order_payments")
-                        # Create a set of existing order IDs for faster lookup
-                        existing_order_ids = {order_payment.id for order_payment in existing_order_payments}
-                        # Insert only new orders
-                        new_order_payments = []
-                        for record in list_dicts_df:
-                            if record['id'] not in existing_order_ids:
-                                order_payment = Order_Payments(
-                                    id = record['id'],
-                                    order_id=record['order_id'],
-                                    payment_sequential=record['payment_sequential'],
-                                    payment_type=record['payment_type'],
-                                    payment_installments = record['payment_installments'],
-                                    payment_value = record['payment_value']
-                                )
-                                new_order_payments.append(order_payment)
-                                db.add(order_payment)
-                                db.commit()
-                                db.refresh(order_payment)
-
-                        order_payments_list = []
-                        
-                        for order_payment in new_order_payments:
-                            order_payments_dict = {}
-                            order_payments_dict['id'] = order_payment.id
-                            order_payments_dict['order_id'] = order_payment.order_id
-                            order_payments_dict['payment_sequential'] = order_payment.payment_sequential
-                            order_payments_dict['payment_type'] = order_payment.payment_type
-                            order_payments_dict['payment_installments'] = order_payment.payment_installments
-                            order_payments_dict['payment_value'] = order_payment.payment_value
-                            order_payments_list.append(order_payments_dict)
-
-                        return jsonify({
-                            'status': 'success',
-                            'message': 'Data processed successfully',
-                            'body': order_payments_list[:5],
-                            'new_order_payments_count': len(new_order_payments),
-                            'existing_order_payments_count': len(existing_order_payments)
-                        }), 200
-                    
-                    except Exception as db_error:
-                        db.rollback()
-                        logger.error(f"Database operation failed: {str(db_error)}")
-                        return jsonify({'status':'error', 'error': f'Database operation failed details: {str(db_error)}'}), 500
-                    
-            except Exception as e:
-                logger.error(f"Error loading the dataset, kindly provide the valid order payments dataset: {str(e)}")
-                return jsonify({'status':'error', 'error': str(e)}), 500
-    
-    except Exception as e:
-        logger.error(f"An error occurred: {str(e)}")
-        return jsonify({'status':'error', 'error': str(e)}), 500
+def api_load_order_payments_data():
+    return load_table_from_upload('order_payments')
 
 
 @app.route('/api/get_order_payments', methods=['GET'])
 def api_get_order_payments():
-    with get_db() as db:
-        try:
-            order_payments = db.query(Order_Payments).all()
-            order_payments_filtered = order_payments[:5]
-            order_payments_list = []
-            if order_payments_filtered:
-                for order_payment in order_payments_filtered:
-                    order_payments_list.append({
-                        'id': order_payment.id,
-                        'order_id': order_payment.order_id,
-                        'payment_sequential': order_payment.payment_sequential,
-                        'payment_type': order_payment.payment_type,
-                        'payment_installments': order_payment.payment_installments,
-                        'payment_value': order_payment.payment_value
-                    })
-
-                return jsonify({"status": "success",
-                                "message": "Order Payments data retrieved successfully",
-                                "body":  order_payments_list,
-                                "count_records": len(order_payments)
-                            }), 200
-            else:
-                return jsonify({"status": "success",
-                                "message": "No Order Payments data available",
-                                "body":  order_payments_list
-                            }), 200
-            
-        except Exception as e:
-            logger.error(f"An error occurred retrieving all order payments: {str(e)}")
-            return jsonify({'status':'error', 'error':f'error retrieving Order Payments data {str(e)}'}), 500
+    return get_table_page(Order_Payments, 'Order Payments')
 
 
 @app.route('/api/load_products_data', methods=['POST'])
-def api_load_products_data(
-):
-    try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file part'})
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'error': 'No selected file'})
-        if file and file.filename.endswith('.csv'):
-            filename = secure_filename(file.filename)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
-            
-            try:
-                df = load_data(file_path)
-                df = df.head(10000)
-                df = transform__df(df)
-                print("df", df.head())
-                list_dicts_df = df_to_list_of_dicts(df)
-                #if list_dicts_df do not have specific columns, return error
-                products_df_columns = ['product_id', 'product_category_name', 'product_name_lenght', 
-                                      'product_description_lenght', 'product_photos_qty', 'product_weight_g',
-                                      'product_length_cm', 'product_height_cm', 'product_width_cm']
-                
-                if not all(col in list_dicts_df[0] for col in products_df_columns):
-                    return jsonify({'error': 'Invalid file, Kindly provide the Products csv file'
-                                    }), 400
-
-                with get_db() as db:
-                    try:
-                        # Convert list of dictionaries to a list of tuples for better performance
-                        product_ids = tuple(record['id'] for record in list_dicts_df)
-                        # Use a single query to check for existing products
-                        existing_products = db.query(Products).filter(Products.id.in_(product_ids)).all()
-                        print("existing_products", existing_products)
-                        logger.info(f"Found {len(existing_products)} existing existing_products")
-                        # Create a set of existing product IDs for faster lookup
-                        existing_product_ids = {product.id for product in existing_products}
-                        # Insert only new products
-                        new_products = []
-                        for record in list_dicts_df:
-                            if record['id'] not in existing_product_ids:
-                                product = Products(
-                                    id = record['id'],
-                                    product_id=record['product_id'],
-                                    product_category_name=record['product_category_name'],
-                                    product_name_lenght=record['product_name_lenght'],
-                                    product_description_lenght = record['product_description_lenght'],
-                                    product_photos_qty = record['product_photos_qty'],
-                                    product_weight_g = record['product_weight_g'],
-                                    product_length_cm = record['product_length_cm'],
-                                    product_height_cm = record['product_height_cm'],
-                                    product_width_cm = record['product_width_cm']
-                                )
-
-                                new_products.append(product)
-                                db.add(product)
-                                db.commit()
-                                db.refresh(product)
-
-                        products_list = []
-                        
-                        for product in new_products:
-                            products_dict = {}
-                            products_dict['id'] = product.id
-                            products_dict['product_id'] = product.product_id
-                            products_dict['product_category_name'] = product.product_category_name
-                            products_dict['product_name_lenght'] = product.product_name_lenght
-                            products_dict['product_description_lenght'] = product.product_description_lenght
-                            products_dict['product_photos_qty'] = product.product_photos_qty
-                            products_dict['product_weight_g'] = product.product_weight_g
-                            products_dict['product_length_cm'] = product.product_length_cm
-                            products_dict['product_height_cm'] = product.product_height_cm
-                            products_dict['product_width_cm'] = product.product_width_cm
-                            products_list.append(products_dict)
-                        # print("products_list", products_list)           
-                        return jsonify({
-                            'status': 'success',
-                            'message': 'Data processed successfully',
-                            'body': products_list[:5],
-                            'new_products_count': len(new_products),
-                            'existing_products_count': len(existing_products)
-                        }), 200
-
-                    except Exception as db_error:
-                        db.rollback()
-                        logger.error(f"Database operation failed: {str(db_error)}")
-                        return jsonify({'error': 'Database operation failed', 'details': str(db_error)}), 500
-            except Exception as e:
-                logger.error(f"Error loading the dataset, kindly provide the valid products dataset: {str(e)}")
-                return jsonify({'error': str(e)}), 500
-        
-    except Exception as e:
-        logger.error(f"An error occurred: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+def api_load_products_data():
+    return load_table_from_upload('products')
 
 
 @app.route('/api/get_products', methods=['GET'])
 def api_get_products():
-    with get_db() as db:
-        try:
-            products = db.query(Products).all()
-            products_filtered= products[:5]
-            products_list = []
-            if products_filtered:
-                for product in products_filtered:
-                    products_list.append({
-                        'id': product.id,
-                        'product_id': product.product_id,
-                        'product_category_name': product.product_category_name,
-                        'product_name_lenght': product.product_name_lenght,
-                        'product_description_lenght': product.product_description_lenght,
-                        'product_photos_qty': product.product_photos_qty,
-                        'product_weight_g': product.product_weight_g,
-                        'product_length_cm': product.product_length_cm,
-                        'product_height_cm': product.product_height_cm,
-                        'product_width_cm': product.product_width_cm
-                    })
-
-                return jsonify({"status": "success",
-                                "message": "Products data retrieved successfully",
-                                "body":  products_list,
-                                "count_records": len(products)
-                            }), 200
-            else:
-                return jsonify({"status": "success",
-                                "message": "No Products data available",
-                                "body":  products_list,
-                                "count_records": len(products)
-                            }), 200
-            
-        except Exception as e:
-            logger.error(f"An error occurred retrieving all products: {str(e)}")
-            return jsonify({'error retrieving Products data': str(e)}), 500
+    return get_table_page(Products, 'Products')
 
 
 @app.route('/api/load_products_category', methods=['POST'])
 def api_load_products_category():
+    return load_table_from_upload('product_categories')
+
+
+@app.route('/api/get_products_category', methods=['GET'])
+def api_get_products_category():
+    return get_table_page(Product_Category, 'Product Categories')
+
+
+def process_fact_table_polars(db, integrity=None):
+    # the in-python build: read every table from duckdb as arrow, join them with polars
+    # and bulk insert the new rows, kept for tests and for comparing with the sql build.
+    # The hex ids are left in the database, the tables are read and joined on their keys
+    # Get all the tables, read at the same time on cursors of their own
+    load_start = time.perf_counter()
+    list_of_tables, fetch_seconds = read_fact_table_sources(db, workers=app.config['READ_WORKERS'])
+    load_seconds = round(time.perf_counter() - load_start, 4)
+
+    # Check if the tables are not empty
+    if any(df.is_empty() for df in list_of_tables):
+        return jsonify({'error': 'One or more of the dimension tables are empty'}), 404
+
+    fact_table = process_fact_table(list_of_tables)
+
+    if not isinstance(fact_table, pl.DataFrame):
+        return jsonify({'status': 'error',
+                        'message': 'fact_table didnt yield a valid polars dataframe'}), 400
+
+    #process_fact_table already kept one row per (order, order_item_id)
+    logger.debug(f"fact_table {fact_table}")
+
+    #staged and swapped in whole, readers see the previous fact table until it is committed
+    result = rebuild_table_from_frame(db, FactTable, fact_table)
+    invalidate_counts(FactTable.__tablename__)
+    logger.info(f"Found {result['existing_count']} existing fact_table")
+
+    return jsonify({
+        'status': 'success',
+        'message': 'Data processed successfully',
+        'body': df_to_list_of_dicts(decode_keys(get_raw_connection(db), result['preview'])),
+        'new_fact_table_count': result['new_count'],
+        'existing_fact_table_count': result['existing_count'],
+        'engine': 'polars',
+        'load_seconds': load_seconds,
+        'fetch_seconds': fetch_seconds,
+        'integrity': integrity
+    }), 200
+
+
+@app.route('/api/load_pipeline', methods=['POST'])
+def api_load_pipeline():
+    # Loads several Olist tables in one request, from a zip archive and/or a set of csv,
+    # parquet or arrow files. A file is matched to its table by its form field name
+    # (e.g. sellers=...) or its Olist file name. All files are parsed and checked in parallel before the tables are
+    # written in one transaction, then the fact table and the top sellers can be rebuilt.
+    mode = request.args.get('mode', 'append')
+    if mode not in LOAD_MODES:
+        return jsonify({'status': 'error', 'error': f'mode must be one of {", ".join(LOAD_MODES)}'}), 400
+    build_fact = request.args.get('process_fact_table', 'false').lower() == 'true'
+    build_top = request.args.get('load_top_sellers', 'false').lower() == 'true'
+    if not request.files:
+        return jsonify({'status': 'error', 'error': 'No file part'}), 400
+
+    start = time.perf_counter()
+    upload_dir = os.path.join(app.config['UPLOAD_FOLDER'], f"pipeline_{uuid.uuid4().hex}")
+    os.makedirs(upload_dir)
+    cleanup = lambda: shutil.rmtree(upload_dir, ignore_errors=True)
     try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file part'})
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'error': 'No selected file'})
-        if file and file.filename.endswith('.csv'):
+        zip_paths = []
+        file_paths = {}
+        for field_name, file in request.files.items(multi=True):
             filename = secure_filename(file.filename)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
-            
-            try:
-                df = load_data(file_path)
-                df = df.head(10000)
-                df = transform__df(df)
-                print("df", df.head())
-                list_dicts_df = df_to_list_of_dicts(df)
-                #if list_dicts_df do not have specific columns, return error
-                product_category_df_columns = ['product_category_name', 'product_category_name_english']
-                
-                if not all(col in list_dicts_df[0] for col in product_category_df_columns):
-                    return jsonify({'error': 'Invalid file, Kindly provide the Product Category csv file'
-                                    }), 400
-
-                with get_db() as db:
-                    try:
-                        # Convert list of dictionaries to a list of tuples for better performance
-                        product_category_ids = tuple(record['id'] for record in list_dicts_df)
-
-                        print("product_category_ids", product_category_ids)
-                        # Use a single query to check for existing product categories
-                        existing_product_categories = db.query(Product_Category).filter(Product_Category.id.in_(product_category_ids)).all()
-                        print("existing_product_categories", existing_product_categories)
-                        logger.info(f"Found {len(existing_product_categories)} existing existing_product_categories")
-                        # Create a set of existing product category names for faster lookup
-                        existing_product_category_names = {product.id for product in existing_product_categories}
-                        # print("existing_product_category_names", existing_product_category_names)
-                        # Insert only new product categories
-                        new_product_categories = []
-                        for record in list_dicts_df:
-                            if record['id'] not in existing_product_category_names:
-                                product_category = Product_Category(
-                                    id = record['id'],
-                                    product_category_name=record['product_category_name'],
-                                    product_category_name_english=record['product_category_name_english']
-                                )
-                                new_product_categories.append(product_category)
-                                db.add(product_category)
-                                db.commit()
-                                db.refresh(product_category)
-                        
-                        print("new_product_categories", new_product_categories)
-
-                        product_category_list = []
-                        for product_category in new_product_categories:
-                            product_category_dict = {}
-                            product_category_dict['id'] = product_category.id
-                            product_category_dict['product_category_name'] = product_category.product_category_name
-                            product_category_dict['product_category_name_english'] = product_category.product_category_name_english
-                            product_category_list.append(product_category_dict)
-
-                        return jsonify({
-                            'status': 'success',
-                            'message': 'Data processed successfully',
-                            'body': product_category_list[:5],
-                            'new_product_categories_count': len(new_product_categories),
-                            'existing_product_categories_count': len(existing_product_categories)
-                        }), 200
-
-                    except Exception as db_error:
-                        db.rollback()
-                        logger.error(f"Database operation failed: {str(db_error)}")
-                        return jsonify({'error': 'Database operation failed', 'details': str(db_error)}), 500   
-            except Exception as e:
-                logger.error(f"Error loading the dataset, kindly provide the valid product category dataset: {str(e)}")
-                return jsonify({'error': str(e)}), 500
-            
+            if filename.endswith('.zip'):
+                zip_paths.append(os.path.join(upload_dir, filename))
+                file.save(zip_paths[-1])
+                continue
+
+            table = field_name if field_name in UPLOAD_TABLES else table_for_file(filename)
+            if table is None or not filename.endswith(UPLOAD_EXTENSIONS):
+                cleanup()
+                return jsonify({'status': 'error',
+                                'error': f'Cannot tell which table {file.filename} is for, name the field '
+                                         f'after one of {", ".join(UPLOAD_TABLES)} or keep the Olist file name'}), 400
+            file_paths[table] = os.path.join(upload_dir, f"{table}{upload_extension(filename)}")
+            file.save(file_paths[table])
     except Exception as e:
+        cleanup()
         logger.error(f"An error occurred: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        return jsonify({'status': 'error', 'error': str(e)}), 500
 
+    def job_key():
+        uploads = sorted(file_digest(path) for path in zip_paths + list(file_paths.values()))
+        return f"load_pipeline:{mode}:{build_fact}:{build_top}:{':'.join(uploads)}"
 
-@app.route('/api/get_products_category', methods=['GET'])
-def api_get_products_category():
-    with get_db() as db:
+    def work(progress):
         try:
-            product_categories = db.query(Product_Category).all()
-            product_categories_filtered= product_categories[:5]
-            product_categories_list = []
-            if product_categories_filtered:
-                for product_category in product_categories_filtered:
-                    product_categories_list.append({
-                        'id': product_category.id,
-                        'product_category_name': product_category.product_category_name,
-                        'product_category_name_english': product_category.product_category_name_english
-                    })
-
-                return jsonify({"status": "success",
-                                "message": "Product Categories data retrieved successfully",
-                                "body":  product_categories_list,
-                                "count_records": len(product_categories)
-                            }), 200
-            else:
-                return jsonify({"status": "success",
-                                "message": "No Product Categories data available",
-                                "body":  product_categories_list,
-                                "count_records": len(product_categories)
-                            }), 200
-            
+            for zip_path in zip_paths:
+                file_paths.update(extract_zip(zip_path, upload_dir,
+                                              max_size=app.config['MAX_DECOMPRESSED_LENGTH']))
+            if not file_paths:
+                return jsonify({'status': 'error', 'error': 'No Olist files found in the upload'}), 400
+
+            #timed from here, total_seconds also covers receiving the upload and unzipping it
+            parse_start = time.perf_counter()
+            try:
+                with progress.stage('parse'):
+                    frames, parse_seconds = parse_files(file_paths, workers=app.config['PIPELINE_WORKERS'])
+            except InvalidUploadError as invalid_error:
+                logger.error(f"Invalid pipeline upload: {str(invalid_error)}")
+                return jsonify({'status': 'error', 'error': f'Invalid file, {str(invalid_error)}'}), 400
+            parse_time = time.perf_counter() - parse_start
+
+            with get_db(write=True) as db:
+                try:
+                    with progress.stage('load'):
+                        results = load_tables(db, frames, mode=mode, batch_size=app.config['INGEST_BATCH_SIZE'],
+                                              progress=progress.progress)
+                    invalidate_counts(*(UPLOAD_TABLES[table]['model'].__tablename__ for table in results))
+                    response = {
+                        'status': 'success',
+                        'message': 'Data processed successfully',
+                        'mode': mode,
+                        'tables': {table: {'new_count': result['new_count'],
+                                           'existing_count': result['existing_count'],
+                                           'rows_read': result['rows_read'],
+                                           'parse_seconds': parse_seconds[table],
+                                           'ingest_seconds': result['ingest_seconds']}
+                                   for table, result in results.items()},
+                        'parse_seconds': round(parse_time, 4)
+                    }
+
+                    if build_fact:
+                        empty_tables = empty_dimension_tables(get_raw_connection(db))
+                        if empty_tables:
+                            response['fact_table'] = {'error': f'empty tables: {", ".join(empty_tables)}'}
+                        else:
+                            with progress.stage('integrity'):
+                                integrity = check_integrity(get_raw_connection(db))
+                            with progress.stage('fact_table'):
+                                fact_result = build_fact_table_sql(db)
+                            invalidate_counts(FactTable.__tablename__)
+                            response['fact_table'] = {'new_count': fact_result['new_count'],
+                                                      'existing_count': fact_result['existing_count'],
+                                                      'build_seconds': fact_result['build_seconds'],
+                                                      'integrity': integrity}
+                    if build_top:
+                        with progress.stage('top_sellers'):
+                            top_result = build_top_sellers(db)
+                        if top_result is None:
+                            response['top_sellers'] = {'error': 'Fact table to be analyzed not found in the database'}
+                        else:
+                            invalidate_counts(Top_Sellers.__tablename__)
+                            response['top_sellers'] = {'new_count': top_result['new_count'],
+                                                       'existing_count': top_result['existing_count']}
+
+                    response['total_seconds'] = round(time.perf_counter() - start, 4)
+                    return jsonify(response), 200
+
+                except Exception as db_error:
+                    db.rollback()
+                    logger.error(f"Database operation failed: {str(db_error)}")
+                    return jsonify({'status': 'error',
+                                    'error': 'Database operation failed', 'details': str(db_error)}), 500
+
+        except ArchiveTooLargeError as e:
+            logger.error(f"Refused pipeline upload: {str(e)}")
+            return jsonify({'status': 'error', 'error': str(e)}), 413
+        except zipfile.BadZipFile as e:
+            return jsonify({'status': 'error', 'error': f'Invalid zip file: {str(e)}'}), 400
         except Exception as e:
-            logger.error(f"An error occurred retrieving all product categories: {str(e)}")
-            return jsonify({'error retrieving Product Categories data': str(e)}), 500
+            logger.error(f"An error occurred: {str(e)}")
+            return jsonify({'status': 'error', 'error': str(e)}), 500
+
+    return run_as_job('load_pipeline', job_key, work, cleanup=cleanup)
 
 
 @app.route('/api/process_fact_table', methods=['POST'])
 def api_process_fact_table():
-    try:
-        with get_db() as db:
-            try:
-                # Get all the tables
-                sellers = db.query(Sellers).all()
-                customers = db.query(Customers).all()
-                orders = db.query(Orders).all()
-                order_items = db.query(Order_Items).all()
-                order_payments = db.query(Order_Payments).all()
-                products = db.query(Products).all()
-                product_categories = db.query(Product_Category).all()
-                
-                # Check if the tables are not empty
-                if not sellers or not customers or not orders \
-                    or not order_items or not order_payments or not products \
-                        or not product_categories:
-                    return jsonify({'error': 'One or more of the dimension tables are empty'}), 404
-                
-                orders_df = process_dim_table_df(orders)
-                order_items_df = process_dim_table_df(order_items)
-                customers_df = process_dim_table_df(customers)
-                order_payments_df = process_dim_table_df(order_payments)
-                products_df = process_dim_table_df(products)
-                sellers_df = process_dim_table_df(sellers)
-                product_categories_df = process_dim_table_df(product_categories)
-
-                # print("orders", orders)
-
-                list_of_tables = [orders_df, order_items_df, customers_df, 
-                                      order_payments_df,products_df, 
-                                  sellers_df, product_categories_df]  
-                
-
-                for df in list_of_tables:
-                    if not isinstance(df, pl.DataFrame):
-                        return jsonify({'status': 'error',
-                                        'body': {df.head(1).to_dicts()} ,
-                                        'message': f'transformed_data didnt yield a valid polars dataframe'}), 400
+    #engine=sql (default) builds the fact table inside duckdb, engine=polars runs the python build,
+    #engine=streaming the lazy polars build for tables larger than memory
+    engine = request.args.get('engine', 'sql')
+    if engine not in ('sql', 'polars', 'streaming'):
+        return jsonify({'status': 'error',
+                        'error': f'Unknown engine {engine}, use sql, polars or streaming'}), 400
+    #mode=incremental only folds in the rows loaded or changed by an upsert since the last build,
+    #fact rows already built are updated in place (see build_fact_table_incremental)
+    mode = request.args.get('mode', 'full')
+    if mode not in ('full', 'incremental'):
+        return jsonify({'status': 'error',
+                        'error': f'Unknown mode {mode}, use full or incremental'}), 400
+    if mode == 'incremental' and engine != 'sql':
+        return jsonify({'status': 'error',
+                        'error': 'Incremental builds are only available with engine=sql'}), 400
+
+    def work(progress):
+        try:
+            with get_db(write=True) as db:
+                try:
+                    #the rows the inner joins are about to drop, counted before they are lost
+                    with progress.stage('integrity'):
+                        integrity = check_integrity(get_raw_connection(db))
+
+                    if engine == 'polars':
+                        with progress.stage('build'):
+                            return process_fact_table_polars(db, integrity=integrity)
+
+                    # Check if the tables are not empty
+                    if empty_dimension_tables(get_raw_connection(db)):
+                        return jsonify({'error': 'One or more of the dimension tables are empty'}), 404
+
+                    with progress.stage('build'):
+                        if mode == 'incremental':
+                            result = build_fact_table_incremental(db)
+                        elif engine == 'streaming':
+                            result = build_fact_table_streaming(db, work_dir=app.config['UPLOAD_FOLDER'])
+                        else:
+                            result = build_fact_table_sql(db)
+                    invalidate_counts(FactTable.__tablename__)
+                    progress.progress(result['new_count'] + result['existing_count'])
+
+                    response = {
+                        'status': 'success',
+                        'message': 'Data processed successfully',
+                        'body': df_to_list_of_dicts(decode_keys(get_raw_connection(db), result['preview'])),
+                        'new_fact_table_count': result['new_count'],
+                        'existing_fact_table_count': result['existing_count'],
+                        'engine': engine,
+                        'mode': mode,
+                        'build_seconds': result['build_seconds'],
+                        'watermarks': result['watermarks'],
+                        'integrity': integrity
+                    }
+                    if mode == 'incremental':
+                        response['updated_fact_table_count'] = result['updated_count']
+                    return jsonify(response), 200
+
+                except Exception as db_error:
+                    db.rollback()
+                    logger.error(f"Database operation failed: {str(db_error)}")
+                    return jsonify({'error': 'Database operation failed', 'details': str(db_error)}), 500
 
-                fact_table = process_fact_table(list_of_tables)
-                #remove duplicates 
-                fact_table = fact_table.filter(fact_table.is_duplicated() == False)
-                print("fact_table", fact_table)
+        except Exception as e:
+            logger.error(f"An error occurred: {str(e)}")
+            return jsonify({'error': str(e)}), 500
+
+    return run_as_job('process_fact_table', f'process_fact_table:{engine}:{mode}', work)
 
-                if not isinstance(fact_table, pl.DataFrame):
-                    return jsonify({'status': 'error',
-                                    'message': 'fact_table didnt yield a valid polars dataframe'}), 400
-
-                list_dicts_df = df_to_list_of_dicts(fact_table)
-
-                fact_table_ids = [record['id'] for record in list_dicts_df]
-                existing_fact_table = db.query(FactTable).filter(FactTable.id.in_(fact_table_ids)).all()
-                logger.info(f"Found {len(existing_fact_table)} existing fact_table")
-                # Create a set of existing fact_table IDs for faster lookup
-                existing_fact_table_ids = {fact.id for fact in existing_fact_table}
-                # Insert only new fact_table
-                new_fact_table = []
-                for record in list_dicts_df:
-                    if record['id'] not in existing_fact_table_ids:
-                        fact = FactTable(
-                            id = record['id'],
-                            order_id=record['order_id'],
-                            customer_id=record['customer_id'],
-                            order_status=record['order_status'],
-                            order_purchase_timestamp=record['order_purchase_timestamp'],
-                            order_approved_at = record['order_approved_at'],
-                            order_delivered_carrier_date = record['order_delivered_carrier_date'],
-                            order_delivered_customer_date = record['order_delivered_customer_date'],
-                            order_estimated_delivery_date = record['order_estimated_delivery_date'],
-                            customer_unique_id = record['customer_unique_id'],
-                            customer_zip_code_prefix = record['customer_zip_code_prefix'],
-                            customer_city = record['customer_city'],
-                            customer_state = record['customer_state'],
-                            order_item_id = record['order_item_id'],
-                            product_id = record['product_id'],
-                            seller_id = record['seller_id'],
-                            shipping_limit_date = record['shipping_limit_date'],
-                            price = record['price'],
-                            freight_value = record['freight_value'],
-                            product_category_name = record['product_category_name'],
-                            seller_zip_code_prefix = record['seller_zip_code_prefix'],
-                            seller_city = record['seller_city'],
-                            seller_state = record['seller_state'],
-                            product_category_name_english = record['product_category_name_english']
-                        )
-                        new_fact_table.append(fact)
-                        db.add(fact)
-                        db.commit()
-                        db.refresh(fact)
-                    
-                fact_table_list = []
-                for fact in new_fact_table:
-                    fact_dict = {}
-                    fact_dict['id'] = fact.id
-                    fact_dict['order_id'] = fact.order_id
-                    fact_dict['customer_id'] = fact.customer_id
-                    fact_dict['order_status'] = fact.order_status
-                    fact_dict['order_purchase_timestamp'] = fact.order_purchase_timestamp
-                    fact_dict['order_approved_at'] = fact.order_approved_at
-                    fact_dict['order_delivered_carrier_date'] = fact.order_delivered_carrier_date
-                    fact_dict['order_delivered_customer_date'] = fact.order_delivered_customer_date
-                    fact_dict['order_estimated_delivery_date'] = fact.order_estimated_delivery_date
-                    fact_dict['customer_unique_id'] = fact.customer_unique_id
-                    fact_dict['customer_zip_code_prefix'] = fact.customer_zip_code_prefix
-                    fact_dict['customer_city'] = fact.customer_city
-                    fact_dict['customer_state'] = fact.customer_state
-                    fact_dict['order_item_id'] = fact.order_item_id
-                    fact_dict['product_id'] = fact.product_id
-                    fact_dict['seller_id'] = fact.seller_id
-                    fact_dict['shipping_limit_date'] = fact.shipping_limit_date
-                    fact_dict['price'] = fact.price
-                    fact_dict['freight_value'] = fact.freight_value
-                    fact_dict['product_category_name'] = fact.product_category_name
-                    fact_dict['seller_zip_code_prefix'] = fact.seller_zip_code_prefix
-                    fact_dict['seller_city'] = fact.seller_city
-                    fact_dict['seller_state'] = fact.seller_state
-                    fact_dict['product_category_name_english'] = fact.product_category_name_english
-
-                    fact_table_list.append(fact_dict)
-
-                return jsonify({
-                    'status': 'success',
-                    'message': 'Data processed successfully',
-                    'body': fact_table_list[:5],
-                    'new_fact_table_count': len(new_fact_table),
-                    'existing_fact_table_count': len(existing_fact_table)
-                }), 200
-            
-            except Exception as db_error:
-                db.rollback()
-                logger.error(f"Database operation failed: {str(db_error)}")
-                return jsonify({'error': 'Database operation failed', 'details': str(db_error)}), 500
-            
-    except Exception as e:
-        logger.error(f"An error occurred: {str(e)}")
-        return jsonify({'error': str(e)}), 500
-    
 @app.route('/api/get_fact_table', methods=['GET'])
 def api_get_fact_table():
-    with get_db() as db:
-        try:
-            fact_table = db.query(FactTable).all()
-            fact_table_filtered= fact_table[:5]
-            fact_table_list = []
-            if fact_table_filtered:
-                for fact in fact_table_filtered:
-                    fact_table_list.append({
-                        'id': fact.id,
-                        'order_id': fact.order_id,
-                        'customer_id': fact.customer_id,
-                        'order_status': fact.order_status,
-                        'order_purchase_timestamp': fact.order_purchase_timestamp,
-                        'order_approved_at': fact.order_approved_at,
-                        'order_delivered_carrier_date': fact.order_delivered_carrier_date,
-                        'order_delivered_customer_date': fact.order_delivered_customer_date,
-                        'order_estimated_delivery_date': fact.order_estimated_delivery_date,
-                        'customer_unique_id': fact.customer_unique_id,
-                        'customer_zip_code_prefix': fact.customer_zip_code_prefix,
-                        'customer_city': fact.customer_city,
-                        'customer_state': fact.customer_state,
-                        'order_item_id': fact.order_item_id,
-                        'product_id': fact.product_id,
-                        'seller_id': fact.seller_id,
-                        'shipping_limit_date': fact.shipping_limit_date,
-                        'price': fact.price,
-                        'freight_value': fact.freight_value,
-                        'product_category_name': fact.product_category_name,
-                        'seller_zip_code_prefix': fact.seller_zip_code_prefix,
-                        'seller_city': fact.seller_city,
-                        'seller_state': fact.seller_state,
-                        'product_category_name_english': fact.product_category_name_english
-                    })
-
-                return jsonify({"status": "success",
-                                "message": "Fact Table data retrieved successfully",
-                                "body":  fact_table_list,
-                                "count_records": len(fact_table)
-                            }), 200
-            else:
-                return jsonify({"status": "success",
-                                "message": "No Fact Table data available",
-                                "body":  fact_table_list,
-                                "count_records": len(fact_table)
-                            }), 200
-            
-        except Exception as e:
-            logger.error(f"An error occurred retrieving all fact table: {str(e)}")
-            return jsonify({'error retrieving Fact Table data': str(e)}), 500
+    return get_table_page(FactTable, 'Fact Table')
 
-@app.route('/api/load_top_sellers', methods=['POST'])
-def api_load_top_sellers():
+
+@app.route('/api/check_integrity', methods=['GET'])
+def api_check_integrity():
+    # orphan counts and sample keys of every foreign key, without building anything
+    samples = request.args.get('samples', '5')
+    if not samples.isdigit() or not 0 <= int(samples) <= 100:
+        return jsonify({'status': 'error', 'error': 'samples must be a number between 0 and 100'}), 400
     try:
         with get_db() as db:
-            try:
-                # Get all the tables
-                fact_table = db.query(FactTable).all()
+            integrity = check_integrity(get_raw_connection(db), sample_size=int(samples))
+        return jsonify({'status': 'success', **integrity}), 200
+    except Exception as e:
+        logger.error(f"An error occurred: {str(e)}")
+        return jsonify({'status': 'error', 'error': str(e)}), 500
 
-                if not fact_table:
-                    return jsonify({'error': 'Fact table to be analyzed not found in the database'}), 404
-                
-                fact_table = process_dim_table_df(fact_table)
 
-                top_sellers_df = get_top_sellers(fact_table) 
+@app.route('/api/load_top_sellers', methods=['POST'])
+def api_load_top_sellers():
+    def work(progress):
+        try:
+            with get_db(write=True) as db:
+                try:
+                    with progress.stage('build'):
+                        result = build_top_sellers(db)
+
+                    if result is None:
+                        return jsonify({'error': 'Fact table to be analyzed not found in the database'}), 404
+
+                    invalidate_counts(Top_Sellers.__tablename__)
+                    logger.info(f"Found {result['existing_count']} existing top_sellers")
+                    progress.progress(result['rows_read'])
+
+                    return jsonify({
+                        'status': 'success',
+                        'message': 'Data processed successfully',
+                        'body': df_to_list_of_dicts(decode_keys(get_raw_connection(db), result['preview'])),
+                        'new_top_sellers_count': result['new_count'],
+                        'existing_top_sellers_count': result['existing_count']
+                    }), 200
+
+                except Exception as db_error:
+                    db.rollback()
+                    logger.error(f"Database operation failed: {str(db_error)}")
+                    return jsonify({'error': 'Database operation failed', 'details': str(db_error)}), 500
 
-                if not isinstance(top_sellers_df, pl.DataFrame):
-                    return jsonify({'status': 'error',
-                                    'message': 'transformed_data didnt yield a valid polars dataframe'}), 400
-                
-                list_dicts_df = df_to_list_of_dicts(top_sellers_df)
-
-                top_sellers_ids = [record['id'] for record in list_dicts_df]
-                existing_top_sellers = db.query(Top_Sellers).filter(Top_Sellers.id.in_(top_sellers_ids)).all()
-                logger.info(f"Found {len(existing_top_sellers)} existing top_sellers")
-                # Create a set of existing top_sellers IDs for faster lookup
-                existing_top_sellers_ids = {top.id for top in existing_top_sellers}
-                # Insert only new top_sellers
-                new_top_sellers = []
-                for record in list_dicts_df:
-                    if record['id'] not in existing_top_sellers_ids:
-                        top_seller = Top_Sellers(
-                            id = record['id'],
-                            seller_id=record['seller_id'],
-                            total_sales = record['Total_sales'],
-                        )
-                        new_top_sellers.append(top_seller)
-                        db.add(top_seller)
-                        db.commit()
-                        db.refresh(top_seller)
-                
-                top_sellers_list = []
-                for top_seller in new_top_sellers:
-                    top_seller_dict = {}
-                    top_seller_dict['id'] = top_seller.id
-                    top_seller_dict['seller_id'] = top_seller.seller_id
-                    top_seller_dict['total_sales'] = top_seller.total_sales
-
-                    top_sellers_list.append(top_seller_dict)
-                
-                return jsonify({
-                    'status': 'success',
-                    'message': 'Data processed successfully',
-                    'body': top_sellers_list[:5],
-                    'new_top_sellers_count': len(new_top_sellers),
-                    'existing_top_sellers_count': len(existing_top_sellers)
-                }), 200
-            
-            except Exception as db_error:
-                db.rollback()
-                logger.error(f"Database operation failed: {str(db_error)}")
-                return jsonify({'error': 'Database operation failed', 'details': str(db_error)}), 500
-            
-    except Exception as e:
-        logger.error(f"An error occurred: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        except Exception as e:
+            logger.error(f"An error occurred: {str(e)}")
+            return jsonify({'error': str(e)}), 500
+
+    return run_as_job('load_top_sellers', 'load_top_sellers', work)
 
 
 @app.route('/api/get_top_sellers', methods=['GET'])
 def api_get_top_sellers():
-    with get_db() as db:
-        try:
-            top_sellers = db.query(Top_Sellers).all()
-            top_sellers_filtered= top_sellers[:5]
-            top_sellers_list = []
-            if top_sellers_filtered:
-                for top_seller in top_sellers_filtered:
-                    top_sellers_list.append({
-                        'id': top_seller.id,
-                        'seller_id': top_seller.seller_id,
-                        'total_sales': top_seller.total_sales
-                    })
-
-                return jsonify({"status": "success",
-                                "message": "Top Sellers data retrieved successfully",
-                                "body":  top_sellers_list,
-                                "count_records": len(top_sellers)
-                            }), 200
-            else:
-                return jsonify({"status": "success",
-                                "message": "No Top Sellers data available",
-                                "body":  top_sellers_list,
-                                "count_records": len(top_sellers)
-                            }), 200
-            
-        except Exception as e:
-            logger.error(f"An error occurred retrieving all top sellers: {str(e)}")
-            return jsonify({'error retrieving Top Sellers data': str(e)}), 500
+    return get_table_page(Top_Sellers, 'Top Sellers')
+
+
+@app.route('/api/rollback/<table_name>', methods=['POST'])
+def api_rollback_table(table_name):
+    # swaps the version of a rebuilt table that the last rebuild replaced back in
+    model = REBUILT_TABLES.get(table_name)
+    if model is None:
+        return jsonify({'status': 'error',
+                        'error': f'Unknown table {table_name}, tables that can be rolled back: '
+                                 f'{", ".join(REBUILT_TABLES)}'}), 404
+    try:
+        with get_db(write=True) as db:
+            result = rollback_table(db, model)
+        invalidate_counts(table_name)
+        return jsonify({'status': 'success', **result}), 200
+    except ValueError as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 404
+    except Exception as e:
+        logger.error(f"An error occurred: {str(e)}")
+        return jsonify({'status': 'error', 'error': str(e)}), 500
+
+
+@app.route('/api/export/<table_name>', methods=['GET'])
+def api_export_table(table_name):
+    # streams a whole table as ndjson or csv, the response is sent batch by batch
+    # while DuckDB reads the table, so memory does not grow with the table size
+    model = TABLE_MODELS.get(table_name)
+    if model is None:
+        return jsonify({'status': 'error',
+                        'error': f'Unknown table {table_name}, available tables: {", ".join(TABLE_MODELS)}'}), 404
+
+    export_format = negotiate_format(EXPORT_FORMATS, 'ndjson')
+    if export_format is None:
+        return jsonify({'status': 'error',
+                        'error': f'format must be one of {", ".join(EXPORT_FORMATS)}'}), 400
+    batch_size = app.config['EXPORT_BATCH_SIZE']
+
+    def generate():
+        with get_db() as db:
+            # a cursor of its own, so the stream is not tied to the session's transaction
+            cursor = get_raw_connection(db).duplicate()
+            try:
+                yield from stream_table(cursor, model, export_format, batch_size)
+            except Exception as e:
+                #the status line has already been sent, all that can be done is to log and stop
+                logger.error(f"Export of {table_name} failed: {str(e)}")
+                raise
+            finally:
+                cursor.close()
+
+    return Response(generate(), mimetype=EXPORT_FORMATS[export_format],
+                    headers={'Content-Disposition': f'attachment; filename={table_name}.{export_format}'})
+
+
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+def api_get_job(job_id):
+    # state, rows processed, stage timings and, once finished, the result of a queued job
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'error': f'Job {job_id} not found'}), 404
+    return jsonify(job), 200
 
 
 if __name__ == '__main__':
+    init_db()
+    fail_interrupted_jobs()
     app.run(host="0.0.0.0", port=7000)
 
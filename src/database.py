@@ -1,22 +1,117 @@
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Sequence
+from sqlalchemy import create_engine, inspect, Column, Integer, String, Float, DateTime, Sequence, Index
+from sqlalchemy.schema import CreateIndex
 from sqlalchemy.ext.declarative import declarative_base
 from contextlib import contextmanager
+import threading
+import os
 import logging
+import polars as pl
+from src.keys import KEY_DICTIONARY, fill_missing_keys
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-db_path = "customer_orders.duckdb"
+db_path = os.environ.get("DB_PATH", "customer_orders.duckdb")
+#connection pool settings, the pool only applies to file databases
+pool_size = int(os.environ.get("DB_POOL_SIZE", 5))
+max_overflow = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+pool_timeout = int(os.environ.get("DB_POOL_TIMEOUT", 30))
 Base = declarative_base()
 
+_engine = None
+_SessionLocal = None
+_engine_lock = threading.Lock()
+# DuckDB allows a single writer per database file. Every pooled connection opened on the
+# same path inside this process attaches to one shared DuckDB instance (one cursor per
+# session), so readers run concurrently while writers are serialised through this lock
+# instead of failing each other with transaction conflicts.
+write_lock = threading.RLock()
+
+
+def get_engine():
+    # the engine, its pool and the schema are created once per process on first use
+    global _engine, _SessionLocal
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                sql_alchemy_database_url = f"duckdb:///{db_path}"
+                engine_kwargs = {}
+                if db_path != ":memory:":
+                    engine_kwargs = {'pool_size': pool_size,
+                                     'max_overflow': max_overflow,
+                                     'pool_timeout': pool_timeout}
+                engine = create_engine(sql_alchemy_database_url, **engine_kwargs)
+                Base.metadata.create_all(engine)
+                upgrade_tables(engine)
+                create_indexes(engine)
+                logger.info(f"Database engine created for {db_path}")
+                _SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+                _engine = engine
+    return _engine
+
+
+def create_indexes(engine):
+    # create_all only adds indexes together with a new table, database files created
+    # before an index was declared get it here
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+def upgrade_tables(engine):
+    # create_all does not touch a table that already exists either: columns declared after
+    # a database file was created are added here and the surrogate keys of the rows already
+    # in it filled in. DuckDB cannot alter a table that has an index, so its indexes are
+    # dropped first and created again by create_indexes. The keys are filled with DuckDB
+    # SQL, other engines (the tests' sqlite) only get the columns.
+    with engine.begin() as conn:
+        raw_conn = conn.connection.connection
+        inspector = inspect(conn)
+        is_duckdb = engine.dialect.name == 'duckdb'
+        for table in Base.metadata.sorted_tables:
+            existing = [column['name'] for column in inspector.get_columns(table.name)]
+            missing = [column for column in table.columns if column.name not in existing]
+            if missing:
+                if is_duckdb:
+                    for index_name, in raw_conn.execute(
+                            "SELECT index_name FROM duckdb_indexes() WHERE table_name = ?", [table.name]).fetchall():
+                        raw_conn.execute(f"DROP INDEX {index_name}")
+                for column in missing:
+                    raw_conn.execute(f"ALTER TABLE {table.name} ADD COLUMN {column.name} "
+                                     f"{column.type.compile(dialect=engine.dialect)}")
+                    existing.append(column.name)
+                    if column.name == 'load_seq':
+                        #the rows already loaded count as loaded in the order of their ids, so
+                        #watermarks recorded on the ids before the column existed still hold
+                        raw_conn.execute(f"UPDATE {table.name} SET load_seq = id")
+                logger.info(f"Added {', '.join(column.name for column in missing)} to {table.name}")
+            if is_duckdb:
+                fill_missing_keys(raw_conn, table.name, existing)
+
+
+def init_db():
+    # run at startup so the first request does not pay for the schema check
+    return get_engine()
+
+
+def reset_engine():
+    # close every pooled connection and forget the engine, the next get_db() creates a new one
+    global _engine, _SessionLocal
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
+        _engine = None
+        _SessionLocal = None
+
+
 @contextmanager
-def get_db():
-    sql_alchemy_database_url = f"duckdb:///{db_path}"
-    engine = create_engine(sql_alchemy_database_url)
-    Base.metadata.create_all(engine)
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=create_engine(sql_alchemy_database_url))
-    db = SessionLocal()
+def get_db(write: bool = False):
+    get_engine()
+    db = _SessionLocal()
+    if write:
+        write_lock.acquire()
     try:
         logger.info("Database session opened")
         yield db
@@ -26,67 +121,155 @@ def get_db():
     finally:
         logger.info("Closing database session")
         db.close()
+        if write:
+            write_lock.release()
+
+
+def get_raw_connection(db):
+    # the DuckDB connection sitting underneath the SQLAlchemy session, used for
+    # Arrow based bulk reads and writes that should not go through the ORM
+    return db.connection().connection.connection
+
+
+def query_to_arrow(db, query):
+    # runs an ORM query on the DuckDB connection and returns its rows as an Arrow table,
+    # the SQL and its parameters are the ones SQLAlchemy would have sent for query.all()
+    compiled = query.statement.compile(dialect=db.get_bind().dialect)
+    params = [compiled.params[name] for name in compiled.positiontup]
+    return get_raw_connection(db).execute(str(compiled), params).arrow()
+
+
+#comparison operators accepted in read_table filters
+FILTER_OPERATORS = ('=', '!=', '>', '>=', '<', '<=', 'in', 'not in', 'is null', 'is not null')
+
+
+def read_table(db, model, columns: list = None, filters: list = None, conn=None) -> pl.DataFrame:
+    # Reads a table, or the requested columns of it, straight from DuckDB as Arrow and wraps it
+    # in a polars DataFrame without building ORM objects. The projection and the filters are
+    # part of the SQL, so DuckDB only scans the columns and rows that are asked for.
+    # filters is a list of (column, operator, value) tuples that are AND-ed together.
+    table_columns = model.__table__.columns.keys()
+    columns = columns or table_columns
+    for col in list(columns) + [f[0] for f in filters or []]:
+        if col not in table_columns:
+            raise ValueError(f"{col} is not a column of {model.__tablename__}")
+
+    conditions = []
+    params = []
+    for col, operator, *value in filters or []:
+        operator = operator.lower()
+        if operator not in FILTER_OPERATORS:
+            raise ValueError(f"Unsupported filter operator {operator}")
+        if operator in ('is null', 'is not null'):
+            conditions.append(f"{col} {operator}")
+        elif operator in ('in', 'not in'):
+            values = list(value[0])
+            if not values:
+                #an empty IN list matches nothing, an empty NOT IN list matches everything
+                conditions.append("false" if operator == 'in' else "true")
+                continue
+            conditions.append(f"{col} {operator} ({', '.join('?' for _ in values)})")
+            params.extend(values)
+        else:
+            conditions.append(f"{col} {operator} ?")
+            params.append(value[0])
+
+    sql = f"SELECT {', '.join(columns)} FROM {model.__tablename__}"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    conn = conn or get_raw_connection(db)
+    return pl.from_arrow(conn.execute(sql, params).arrow())
 
 
 class Sellers(Base):
     __tablename__ = "sellers"
+    __table_args__ = (Index('ix_sellers_seller_id', 'seller_id'),)
+    #the columns that identify a row across uploads, used by the upsert loads
+    natural_key = ('seller_id',)
 
     id = Column(Integer, Sequence('id'), primary_key=True)
     seller_id = Column(String)
+    seller_key = Column(Integer)
     seller_zip_code_prefix = Column(Integer)
     seller_city = Column(String)
     seller_state = Column(String)
+    #the load that last wrote or changed the row, numbered per table (see src/ingest.py),
+    #the incremental fact build folds in the rows written since its watermarks
+    load_seq = Column(Integer)
 
 class Customers(Base):
     __tablename__ = "customers"
+    __table_args__ = (Index('ix_customers_customer_id', 'customer_id'),)
+    natural_key = ('customer_id',)
 
     id = Column(Integer, Sequence('id'), primary_key=True)
     customer_id = Column(String)
+    customer_key = Column(Integer)
     customer_unique_id = Column(String)
     customer_zip_code_prefix = Column(Integer)
     customer_city = Column(String)
     customer_state = Column(String)
+    load_seq = Column(Integer)
 
 class Order_Items(Base):
     __tablename__ = "order_items"
+    __table_args__ = (Index('ix_order_items_order_id_order_item_id', 'order_id', 'order_item_id'),)
+    natural_key = ('order_id', 'order_item_id')
 
     id = Column(Integer, Sequence('id'), primary_key=True)
     order_id = Column(String)
+    order_key = Column(Integer)
     order_item_id = Column(Integer)
     product_id = Column(String)
+    product_key = Column(Integer)
     seller_id = Column(String)
+    seller_key = Column(Integer)
     shipping_limit_date = Column(DateTime)
     price = Column(Float)
     freight_value = Column(Float)    
+    load_seq = Column(Integer)
 
 class Order_Payments(Base):
     __tablename__ = "order_payments"
+    __table_args__ = (Index('ix_order_payments_order_id_payment_sequential', 'order_id', 'payment_sequential'),)
+    natural_key = ('order_id', 'payment_sequential')
 
     id = Column(Integer, Sequence('id'), primary_key=True)
     order_id = Column(String)
+    order_key = Column(Integer)
     payment_sequential = Column(Integer)
     payment_type = Column(String)
     payment_installments = Column(Integer)
     payment_value = Column(Float)
+    load_seq = Column(Integer)
 
 class Orders(Base):
     __tablename__ = "orders"
+    __table_args__ = (Index('ix_orders_order_id', 'order_id'),)
+    natural_key = ('order_id',)
 
     id = Column(Integer, Sequence('id'), primary_key=True)
     order_id = Column(String)
+    order_key = Column(Integer)
     customer_id = Column(String)
+    customer_key = Column(Integer)
     order_status = Column(String)
     order_purchase_timestamp = Column(DateTime)
     order_approved_at = Column(DateTime)
     order_delivered_carrier_date = Column(DateTime)
     order_delivered_customer_date = Column(DateTime)
     order_estimated_delivery_date = Column(DateTime)
+    load_seq = Column(Integer)
 
 
 class Products(Base):
     __tablename__ = "products"
+    __table_args__ = (Index('ix_products_product_id', 'product_id'),)
+    natural_key = ('product_id',)
+
     id = Column(Integer, Sequence('id'), primary_key=True)
     product_id = Column(String)
+    product_key = Column(Integer)
     product_category_name = Column(String)
     product_name_lenght = Column(String)
     product_description_lenght = Column(String)
@@ -95,21 +278,26 @@ class Products(Base):
     product_length_cm = Column(Integer)
     product_height_cm = Column(Integer)
     product_width_cm = Column(Integer)
+    load_seq = Column(Integer)
 
 class Product_Category(Base):
     __tablename__ = "product_category"
+    __table_args__ = (Index('ix_product_category_product_category_name', 'product_category_name'),)
+    natural_key = ('product_category_name',)
 
     id = Column(Integer, Sequence('id'), primary_key=True)
     product_category_name = Column(String)
     product_category_name_english = Column(String)
+    load_seq = Column(Integer)
 
 
 class FactTable(Base):
     __tablename__ = "fact_table"
 
+    #the hex ids are held as their surrogate keys (see src/keys.py), decoded by the api
     id = Column(Integer, Sequence('id'), primary_key=True)
-    order_id = Column(String)
-    customer_id = Column(String)
+    order_key = Column(Integer)
+    customer_key = Column(Integer)
     order_status = Column(String)
     order_purchase_timestamp = Column(DateTime)
     order_approved_at = Column(DateTime)
@@ -121,8 +309,8 @@ class FactTable(Base):
     customer_city = Column(String)
     customer_state = Column(String)
     order_item_id = Column(Integer)
-    product_id = Column(String)
-    seller_id = Column(String)
+    product_key = Column(Integer)
+    seller_key = Column(Integer)
     shipping_limit_date = Column(DateTime)
     price = Column(Float)
     freight_value = Column(Float)
@@ -137,5 +325,68 @@ class Top_Sellers(Base):
     __tablename__ = "top_sellers"
 
     id = Column(Integer, Sequence('id'), primary_key=True)
-    seller_id = Column(String)
-    total_sales = Column(Float)
\ No newline at end of file
+    seller_key = Column(Integer)
+    total_sales = Column(Float)
+
+
+class Watermarks(Base):
+    __tablename__ = "etl_watermarks"
+
+    #highest source load_seq already folded into a derived table, e.g. fact_table <- orders
+    id = Column(Integer, Sequence('id'), primary_key=True)
+    table_name = Column(String)
+    source_table = Column(String)
+    high_watermark = Column(Integer)
+    updated_at = Column(DateTime)
+
+
+class Jobs(Base):
+    __tablename__ = "etl_jobs"
+
+    #a long running load or build run in the background, see src/jobs.py
+    id = Column(Integer, Sequence('id'), primary_key=True)
+    job_type = Column(String)
+    job_key = Column(String)
+    state = Column(String)
+    rows_processed = Column(Integer)
+    stages = Column(String)
+    result = Column(String)
+    status_code = Column(Integer)
+    error = Column(String)
+    created_at = Column(DateTime)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+
+class IngestManifest(Base):
+    __tablename__ = "etl_ingest_manifest"
+    __table_args__ = (Index('ix_etl_ingest_manifest_table_name_content_hash', 'table_name', 'content_hash'),)
+
+    #one row per upload loaded by the /api/load_* endpoints, keyed by a hash of its content
+    id = Column(Integer, Sequence('id'), primary_key=True)
+    table_name = Column(String)
+    content_hash = Column(String)
+    mode = Column(String)
+    file_name = Column(String)
+    rows_read = Column(Integer)
+    new_count = Column(Integer)
+    existing_count = Column(Integer)
+    ingest_seconds = Column(Float)
+    summary = Column(String)
+    ingested_at = Column(DateTime)
+
+
+class KeyDictionary(Base):
+    __tablename__ = KEY_DICTIONARY
+
+    #the integer surrogate key of every hex id loaded so far, see src/keys.py
+    id = Column(Integer, Sequence('id'), primary_key=True)
+    key_type = Column(String)
+    natural_id = Column(String)
+    surrogate_key = Column(Integer)
+
+
+#every table that can be read through the api, by table name
+TABLE_MODELS = {model.__tablename__: model for model in [
+    Sellers, Customers, Orders, Order_Items, Order_Payments, Products, Product_Category,
+    FactTable, Top_Sellers, Watermarks, Jobs, IngestManifest, KeyDictionary]}
@@ -0,0 +1,126 @@
+import io
+import logging
+import polars as pl
+import pyarrow as pa
+import pyarrow.parquet as pq
+from src.keys import NATURAL_IDS, visible_columns, api_columns, decode_keys
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+#typed binary formats, written straight from the Arrow data DuckDB returns
+ARROW_FORMATS = {
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/parquet',
+}
+
+#content type of each export format
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+    **ARROW_FORMATS,
+}
+
+
+def open_record_batches(cursor, model, batch_size: int = 50000):
+    # DuckDB streams the query result as Arrow record batches, only one batch is held
+    # in memory at a time however large the table is. There is no ORDER BY, sorting would
+    # read the whole table before the first batch; rows come back in insertion order.
+    # Surrogate keys are exported as the hex ids they stand for.
+    columns = ", ".join(visible_columns(model.__table__.columns.keys()))
+    reader = cursor.execute(
+        f"SELECT {columns} FROM {model.__tablename__}"
+    ).fetch_record_batch(batch_size)
+    if not any(col in NATURAL_IDS for col in reader.schema.names):
+        return reader
+
+    #the ids are looked up batch by batch on a cursor of their own, so the streamed read is
+    #not interrupted and the rows keep their order
+    lookup = cursor.cursor()
+
+    def decode(batch):
+        return decode_keys(lookup, pl.from_arrow(batch)).to_arrow()
+
+    schema = decode(reader.schema.empty_table()).schema
+
+    def decoded_batches():
+        try:
+            for batch in reader:
+                yield from decode(batch).cast(schema).to_batches()
+        finally:
+            lookup.close()
+
+    return pa.RecordBatchReader.from_batches(schema, decoded_batches())
+
+
+def iter_record_batches(cursor, model, batch_size: int = 50000):
+    for batch in open_record_batches(cursor, model, batch_size):
+        if batch.num_rows:
+            yield batch
+
+
+def _drain(sink: io.BytesIO) -> bytes:
+    # hands out what a writer has written so far and empties the buffer for the next batch
+    chunk = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return chunk
+
+
+def _stream_arrow(reader, export_format: str):
+    # The Arrow IPC stream and the Parquet file are both written front to back, so each
+    # record batch can be sent as soon as it is encoded: an IPC message per batch, a
+    # Parquet row group per batch with the footer sent last.
+    sink = io.BytesIO()
+    if export_format == 'arrow':
+        writer = pa.ipc.new_stream(sink, reader.schema)
+    else:
+        writer = pq.ParquetWriter(sink, reader.schema)
+    for batch in reader:
+        if batch.num_rows:
+            writer.write_batch(batch)
+            yield _drain(sink), batch.num_rows
+    writer.close()
+    yield _drain(sink), 0
+
+
+def stream_table(cursor, model, export_format: str, batch_size: int = 50000):
+    # Yields the table as encoded chunks, one chunk per record batch, so a response can
+    # start sending the first rows before the rest of the table has been read.
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format {export_format}")
+
+    rows = 0
+    if export_format in ARROW_FORMATS:
+        for chunk, batch_rows in _stream_arrow(open_record_batches(cursor, model, batch_size), export_format):
+            rows += batch_rows
+            yield chunk
+        logger.info(f"Exported {rows} {model.__tablename__} rows as {export_format}")
+        return
+
+    if export_format == 'csv':
+        #the header goes out first, so an empty table still exports its columns
+        yield (",".join(api_columns(model.__table__.columns.keys())) + "\n").encode()
+
+    for batch in iter_record_batches(cursor, model, batch_size):
+        df = pl.from_arrow(batch)
+        if export_format == 'csv':
+            yield df.write_csv(include_header=False).encode()
+        else:
+            yield df.write_ndjson().encode()
+        rows += len(df)
+
+    logger.info(f"Exported {rows} {model.__tablename__} rows as {export_format}")
+
+
+def encode_arrow_table(table: pa.Table, export_format: str) -> bytes:
+    # a whole (small) Arrow table as one Arrow IPC stream or Parquet file
+    if export_format not in ARROW_FORMATS:
+        raise ValueError(f"Unsupported format {export_format}")
+    sink = pa.BufferOutputStream()
+    if export_format == 'arrow':
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        pq.write_table(table, sink)
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,288 @@
+import json
+import time
+import hashlib
+import logging
+from datetime import datetime
+import polars as pl
+from src.database import (get_raw_connection, Sellers, Customers, Orders, Order_Items,
+                          Order_Payments, Products, Product_Category, IngestManifest)
+from src.keys import assign_keys
+from src.processing import transform__df, PARQUET_EXTENSIONS, IPC_EXTENSIONS, COMPRESSED_CSV_EXTENSIONS
+from src.serialize import check_columns
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+#every table that can be loaded from an upload: the model, the label used in messages,
+#the columns the file must have and the name of the file in the Olist dataset.
+#the tables are listed in the order they are written when several are loaded together,
+#lookup tables before the tables that refer to them
+UPLOAD_TABLES = {
+    'product_categories': {
+        'model': Product_Category, 'label': 'Product Category',
+        'columns': ['product_category_name', 'product_category_name_english'],
+        'file_name': 'product_category_name_translation.csv'},
+    'sellers': {
+        'model': Sellers, 'label': 'Sellers',
+        'columns': ['seller_id', 'seller_zip_code_prefix', 'seller_city', 'seller_state'],
+        'file_name': 'olist_sellers_dataset.csv'},
+    'customers': {
+        'model': Customers, 'label': 'Customers',
+        'columns': ['customer_id', 'customer_unique_id', 'customer_zip_code_prefix',
+                    'customer_city', 'customer_state'],
+        'file_name': 'olist_customers_dataset.csv'},
+    'products': {
+        'model': Products, 'label': 'Products',
+        'columns': ['product_id', 'product_category_name', 'product_name_lenght',
+                    'product_description_lenght', 'product_photos_qty', 'product_weight_g',
+                    'product_length_cm', 'product_height_cm', 'product_width_cm'],
+        'file_name': 'olist_products_dataset.csv'},
+    'orders': {
+        'model': Orders, 'label': 'Orders',
+        'columns': ['order_id', 'order_status', 'order_purchase_timestamp',
+                    'order_approved_at', 'order_delivered_carrier_date',
+                    'order_delivered_customer_date', 'order_estimated_delivery_date'],
+        'file_name': 'olist_orders_dataset.csv'},
+    'order_items': {
+        'model': Order_Items, 'label': 'Order Items',
+        'columns': ['order_id', 'order_item_id', 'product_id', 'seller_id',
+                    'shipping_limit_date', 'price', 'freight_value'],
+        'file_name': 'olist_order_items_dataset.csv'},
+    'order_payments': {
+        'model': Order_Payments, 'label': 'Order Payments',
+        'columns': ['order_id', 'payment_sequential', 'payment_type',
+                    'payment_installments', 'payment_value'],
+        'file_name': 'olist_order_payments_dataset.csv'},
+}
+
+#file formats the upload endpoints accept, Parquet and Arrow files skip the csv parse
+UPLOAD_EXTENSIONS = ('.csv',) + COMPRESSED_CSV_EXTENSIONS + PARQUET_EXTENSIONS + IPC_EXTENSIONS
+
+
+def upload_extension(file_name: str):
+    # the upload format of a file name, .csv.gz rather than .gz, None when it is not one
+    matches = [extension for extension in UPLOAD_EXTENSIONS if file_name.endswith(extension)]
+    return max(matches, key=len) if matches else None
+
+
+class InvalidUploadError(ValueError):
+    # raised when an uploaded file does not match the table it is loaded into
+    pass
+
+
+def stream_digest(stream, chunk_size: int = 1 << 20) -> str:
+    # sha256 of what is left in a binary stream, read a chunk at a time
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_digest(file_path: str, chunk_size: int = 1 << 20) -> str:
+    with open(file_path, 'rb') as f:
+        return stream_digest(f, chunk_size)
+
+
+def find_ingest(db, table_name: str, content_hash: str, mode: str):
+    # the last load of the same content into the same table and mode, None if there is none
+    row = get_raw_connection(db).execute(
+        f"SELECT summary, ingested_at FROM {IngestManifest.__tablename__} "
+        f"WHERE table_name = ? AND content_hash = ? AND mode = ? ORDER BY id DESC LIMIT 1",
+        [table_name, content_hash, mode]).fetchone()
+    if row is None:
+        return None
+    return {'summary': json.loads(row[0]), 'ingested_at': row[1]}
+
+
+def record_ingest(db, table_name: str, content_hash: str, mode: str, file_name: str,
+                  result: dict, summary: dict):
+    # Adds an upload to the manifest in the session's transaction, so it is only recorded
+    # when the rows it loaded are committed with it. result is what ingest_batches returned,
+    # summary the response of the load, handed back as is when the file comes again.
+    get_raw_connection(db).execute(
+        f"INSERT INTO {IngestManifest.__tablename__} (id, table_name, content_hash, mode, file_name, "
+        f"rows_read, new_count, existing_count, ingest_seconds, summary, ingested_at) "
+        f"VALUES (nextval('id'), ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [table_name, content_hash, mode, file_name, result['rows_read'], result['new_count'],
+         result['existing_count'], result['ingest_seconds'], json.dumps(summary, default=str),
+         datetime.now()])
+
+
+def _next_load_seq(conn, model):
+    # The load_seq the rows written by a load are stamped with, one more than the table's
+    # highest, or None for a table without the column. Every batch of an upload gets the
+    # next one, so the rows written or changed since a watermark are those above it.
+    if 'load_seq' not in model.__table__.columns:
+        return None
+    return conn.execute(f"SELECT coalesce(max(load_seq), 0) + 1 FROM {model.__tablename__}").fetchone()[0]
+
+
+def _insert_new_rows(conn, model, df: pl.DataFrame, preview_rows: int):
+    # Writes every row of df whose id is not yet in the model's table with a single
+    # INSERT ... SELECT. The frame is handed to DuckDB as an Arrow table, so DuckDB
+    # scans the Polars buffers directly instead of receiving one ORM object per row.
+    table_name = model.__tablename__
+    columns = [col for col in model.__table__.columns.keys() if col in df.columns and col != 'load_seq']
+    column_list = ", ".join(columns)
+    staging_name = f"staging_{table_name}"
+    load_seq = _next_load_seq(conn, model)
+    insert_list, select_list = column_list, column_list
+    if load_seq is not None:
+        insert_list, select_list = f"{column_list}, load_seq", f"{column_list}, {int(load_seq)}"
+
+    conn.register(staging_name, df.select(columns).to_arrow())
+    try:
+        existing_count = conn.execute(
+            f"SELECT count(*) FROM {staging_name} s SEMI JOIN {table_name} t USING (id)"
+        ).fetchone()[0]
+        preview = pl.from_arrow(conn.execute(
+            f"SELECT s.* FROM {staging_name} s ANTI JOIN {table_name} t USING (id) "
+            f"ORDER BY s.id LIMIT {int(preview_rows)}"
+        ).arrow())
+        new_count = conn.execute(
+            f"INSERT INTO {table_name} ({insert_list}) "
+            f"SELECT {select_list} FROM {staging_name} s ANTI JOIN {table_name} t USING (id)"
+        ).fetchone()[0]
+    finally:
+        conn.unregister(staging_name)
+
+    return new_count, existing_count, preview
+
+
+def _upsert_rows(conn, model, df: pl.DataFrame, preview_rows: int):
+    # Upserts on the model's natural key instead of the positional id: rows whose key is
+    # already in the table update it in place, the others are appended with ids after the
+    # table's current maximum. Both steps are joins between the staged batch and the table,
+    # so the existence check is one set based anti-join whatever the size of the upload.
+    # When a key appears more than once in the batch the last row wins, rows with a null
+    # key never match and are always appended. An updated row keeps its id, it gets the
+    # load's load_seq only when one of its values changes, which is how the incremental
+    # fact build finds it.
+    table_name = model.__tablename__
+    key = list(model.natural_key)
+    columns = [col for col in model.__table__.columns.keys()
+               if col in df.columns and col not in ('id', 'load_seq')]
+    column_list = ", ".join(columns)
+    key_match = " AND ".join(f"t.{col} = u.{col}" for col in key)
+    staging_name = f"staging_{table_name}"
+    upsert_name = f"upsert_{table_name}"
+    load_seq = _next_load_seq(conn, model)
+    insert_list, select_list = column_list, column_list
+    if load_seq is not None:
+        insert_list, select_list = f"{column_list}, load_seq", f"{column_list}, {int(load_seq)}"
+
+    conn.register(staging_name, df.select(['id'] + columns).to_arrow())
+    try:
+        conn.execute(
+            f"CREATE OR REPLACE TEMP TABLE {upsert_name} AS SELECT * FROM {staging_name} "
+            f"QUALIFY row_number() OVER (PARTITION BY {', '.join(key)} ORDER BY id DESC) = 1 "
+            f"OR {' OR '.join(f'{col} IS NULL' for col in key)}")
+        value_columns = [col for col in columns if col not in key]
+        if value_columns:
+            updates = ", ".join(f"{col} = u.{col}" for col in value_columns)
+            if load_seq is not None:
+                changed = " OR ".join(f"t.{col} IS DISTINCT FROM u.{col}" for col in value_columns)
+                updates += f", load_seq = CASE WHEN {changed} THEN {int(load_seq)} ELSE t.load_seq END"
+            existing_count = conn.execute(
+                f"UPDATE {table_name} t SET {updates} FROM {upsert_name} u WHERE {key_match}"
+            ).fetchone()[0]
+        else:
+            existing_count = conn.execute(
+                f"SELECT count(*) FROM {upsert_name} u SEMI JOIN {table_name} t USING ({', '.join(key)})"
+            ).fetchone()[0]
+        conn.execute(
+            f"CREATE OR REPLACE TEMP TABLE {upsert_name}_new AS "
+            f"SELECT (SELECT coalesce(max(id), 0) FROM {table_name}) "
+            f"+ row_number() OVER (ORDER BY u.id) AS id, {', '.join(f'u.{col}' for col in columns)} "
+            f"FROM {upsert_name} u ANTI JOIN {table_name} t USING ({', '.join(key)})")
+        new_count = conn.execute(
+            f"INSERT INTO {table_name} (id, {insert_list}) SELECT id, {select_list} FROM {upsert_name}_new"
+        ).fetchone()[0]
+        preview = pl.from_arrow(conn.execute(
+            f"SELECT id, {column_list} FROM {upsert_name}_new ORDER BY id LIMIT {int(preview_rows)}"
+        ).arrow())
+        conn.execute(f"DROP TABLE {upsert_name}")
+        conn.execute(f"DROP TABLE {upsert_name}_new")
+    finally:
+        conn.unregister(staging_name)
+
+    return new_count, existing_count, preview
+
+
+#append skips rows whose id is already loaded, upsert matches rows on the model's natural key
+LOAD_MODES = {
+    'append': _insert_new_rows,
+    'upsert': _upsert_rows,
+}
+
+
+def _ingest_summary(table_name, rows, new_count, existing_count, preview, start) -> dict:
+    elapsed = time.perf_counter() - start
+    rows_per_second = round(rows / elapsed, 2) if elapsed > 0 else float(rows)
+    logger.info(f"Bulk loaded {new_count} new rows into {table_name} "
+                f"({existing_count} already present) in {elapsed:.3f}s, {rows_per_second} rows/s")
+    return {
+        'new_count': new_count,
+        'existing_count': existing_count,
+        'preview': preview,
+        'rows_read': rows,
+        'ingest_seconds': round(elapsed, 4),
+        'rows_per_second': rows_per_second,
+    }
+
+
+def ingest_batches(db, model, batches, required_columns: list, preview_rows: int = 5,
+                   mode: str = 'append', commit: bool = True, progress=None) -> dict:
+    # Streams an upload into the model's table one batch at a time: each batch is checked,
+    # given ids that continue from the previous batch and the surrogate keys of its hex ids,
+    # and written before the next one is read, so memory stays bounded by the batch size.
+    # All batches share one transaction, a bad batch rolls the whole upload back. With
+    # commit=False the caller commits, so several uploads can share the transaction.
+    # progress, when given, is called with the number of rows read so far after every batch.
+    table_name = model.__tablename__
+    write_rows = LOAD_MODES[mode]
+    start = time.perf_counter()
+    conn = get_raw_connection(db)
+    rows_read = 0
+    new_count = 0
+    existing_count = 0
+    previews = []
+    preview_count = 0
+    batch_number = 0
+
+    try:
+        for batch in batches:
+            batch_number += 1
+            try:
+                check_columns(batch, required_columns)
+            except ValueError as e:
+                raise InvalidUploadError(f"batch {batch_number}: {str(e)}")
+            if batch.is_empty():
+                continue
+
+            batch = assign_keys(conn, model, transform__df(batch, offset=rows_read))
+            batch_new, batch_existing, batch_preview = write_rows(
+                conn, model, batch, preview_rows - preview_count)
+            rows_read += len(batch)
+            new_count += batch_new
+            existing_count += batch_existing
+            if preview_count < preview_rows and not batch_preview.is_empty():
+                previews.append(batch_preview)
+                preview_count += len(batch_preview)
+
+            logger.info(f"{table_name}: batch {batch_number} wrote {batch_new} new rows "
+                        f"({rows_read} rows read so far)")
+            if progress is not None:
+                progress(rows_read)
+
+        if rows_read == 0:
+            raise ValueError(f"Error reading file, no {table_name} rows found")
+        if commit:
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    preview = pl.concat(previews, how="diagonal_relaxed") if previews else pl.DataFrame()
+    return _ingest_summary(table_name, rows_read, new_count, existing_count, preview, start)
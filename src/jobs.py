@@ -0,0 +1,150 @@
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from src.database import get_db, get_raw_connection, Jobs
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+#queued -> running -> succeeded | failed
+ACTIVE_STATES = ('queued', 'running')
+
+
+def _update_job(job_id: int, **values):
+    # Job rows are written in short transactions of their own, outside the write lock, so
+    # a job's status can be updated and read while its load holds the lock. DuckDB allows
+    # concurrent transactions as long as they do not touch the same rows.
+    with get_db() as db:
+        get_raw_connection(db).execute(
+            f"UPDATE {Jobs.__tablename__} SET {', '.join(f'{col} = ?' for col in values)} WHERE id = ?",
+            list(values.values()) + [job_id])
+        db.commit()
+
+
+class JobProgress:
+    # handed to the work of a job so it can report the rows processed and time its stages
+
+    def __init__(self, job_id: int):
+        self.job_id = job_id
+        self.rows_processed = 0
+        self.stages = {}
+
+    def progress(self, rows_processed: int):
+        self.rows_processed = rows_processed
+        _update_job(self.job_id, rows_processed=rows_processed)
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = round(time.perf_counter() - start, 4)
+            _update_job(self.job_id, stages=json.dumps(self.stages))
+
+
+class NoJobProgress(JobProgress):
+    # the same interface for work run directly in a request, nothing is recorded
+
+    def __init__(self):
+        super().__init__(None)
+
+    def progress(self, rows_processed: int):
+        self.rows_processed = rows_processed
+
+    @contextmanager
+    def stage(self, name: str):
+        yield
+
+
+class JobQueue:
+    # Runs work in a small thread pool and tracks it in the etl_jobs table. A job submitted
+    # with the key of a job that is still queued or running is not started again, the caller
+    # gets the id of the existing job instead.
+
+    def __init__(self, workers: int = 2):
+        self.workers = workers
+        self._executor = None
+        self._active = {}
+        self._lock = threading.Lock()
+
+    def submit(self, job_type: str, job_key: str, work):
+        # work(progress) returns (result, status_code); returns (job_id, coalesced)
+        with self._lock:
+            if job_key in self._active:
+                return self._active[job_key], True
+
+            with get_db() as db:
+                job = Jobs(job_type=job_type, job_key=job_key, state='queued', rows_processed=0,
+                           stages=json.dumps({}), created_at=datetime.now())
+                db.add(job)
+                db.commit()
+                job_id = job.id
+            self._active[job_key] = job_id
+
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                    thread_name_prefix='etl-job')
+            self._executor.submit(self._run, job_id, job_key, work)
+        logger.info(f"Queued job {job_id} ({job_type})")
+        return job_id, False
+
+    def _run(self, job_id: int, job_key: str, work):
+        progress = JobProgress(job_id)
+        try:
+            _update_job(job_id, state='running', started_at=datetime.now())
+            result, status_code = work(progress)
+            state = 'succeeded' if status_code < 400 else 'failed'
+            _update_job(job_id, state=state, result=json.dumps(result, default=str),
+                        status_code=status_code, finished_at=datetime.now())
+            logger.info(f"Job {job_id} {state}")
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {str(e)}")
+            _update_job(job_id, state='failed', error=str(e), status_code=500,
+                        finished_at=datetime.now())
+        finally:
+            with self._lock:
+                self._active.pop(job_key, None)
+
+    def shutdown(self, wait: bool = True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+def get_job(job_id: int):
+    # the job as a dict for the status endpoint, None when there is no such job
+    with get_db() as db:
+        job = db.query(Jobs).filter(Jobs.id == job_id).first()
+        if job is None:
+            return None
+        return {
+            'job_id': job.id,
+            'job_type': job.job_type,
+            'state': job.state,
+            'rows_processed': job.rows_processed,
+            'stages': json.loads(job.stages) if job.stages else {},
+            'result': json.loads(job.result) if job.result else None,
+            'status_code': job.status_code,
+            'error': job.error,
+            'created_at': job.created_at,
+            'started_at': job.started_at,
+            'finished_at': job.finished_at,
+        }
+
+
+def fail_interrupted_jobs():
+    # jobs still queued or running when the process stopped will never finish
+    with get_db() as db:
+        count = get_raw_connection(db).execute(
+            f"UPDATE {Jobs.__tablename__} SET state = 'failed', error = 'interrupted by a restart', "
+            f"finished_at = now() WHERE state IN ({', '.join('?' for _ in ACTIVE_STATES)})",
+            list(ACTIVE_STATES)).fetchone()[0]
+        db.commit()
+    if count:
+        logger.info(f"Marked {count} interrupted jobs as failed")
+    return count
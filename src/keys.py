@@ -0,0 +1,153 @@
+import logging
+import polars as pl
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+#the 32 character hex ids of the Olist tables and the integer surrogate key each one is
+#stored as. An id gets its key from the key dictionary the first time a load carries it;
+#the fact build joins and the top sellers ranking run on the keys, and the hex ids are
+#looked up again only when rows leave through the api
+SURROGATE_KEYS = {
+    'order_id': 'order_key',
+    'customer_id': 'customer_key',
+    'product_id': 'product_key',
+    'seller_id': 'seller_key',
+}
+#the natural id each surrogate key column stands for
+NATURAL_IDS = {key: natural_id for natural_id, key in SURROGATE_KEYS.items()}
+
+#one row per id: key_type is the natural id column (order_id...), keys count up from 1 per type
+KEY_DICTIONARY = 'etl_key_dictionary'
+
+
+def encoded_columns(model) -> list:
+    # the model's columns without the natural ids it also stores a key for and the
+    # load_seq of the loads, what the joins and aggregations read
+    columns = model.__table__.columns.keys()
+    return [col for col in columns if SURROGATE_KEYS.get(col) not in columns and col != 'load_seq']
+
+
+def register_ids(conn, natural_id: str, source: str) -> int:
+    # Adds the ids of source's natural_id column that are not in the dictionary yet, with
+    # keys after the highest one of their type. source is a table or a registered Arrow
+    # frame, the new ids are found with one anti join whatever their number.
+    return conn.execute(
+        f"INSERT INTO {KEY_DICTIONARY} (id, key_type, natural_id, surrogate_key) "
+        f"SELECT nextval('id'), ?, n.natural_id, "
+        f"(SELECT coalesce(max(surrogate_key), 0) FROM {KEY_DICTIONARY} WHERE key_type = ?) "
+        f"+ row_number() OVER (ORDER BY n.natural_id) "
+        f"FROM (SELECT DISTINCT {natural_id} AS natural_id FROM {source} WHERE {natural_id} IS NOT NULL) n "
+        f"ANTI JOIN (SELECT natural_id FROM {KEY_DICTIONARY} WHERE key_type = ?) d USING (natural_id)",
+        [natural_id, natural_id, natural_id]).fetchone()[0]
+
+
+def assign_keys(conn, model, df: pl.DataFrame) -> pl.DataFrame:
+    # The frame with the surrogate key of every natural id the model stores one for, the ids
+    # new to the dictionary are registered first. Run on each batch of a load before it is
+    # written, in the load's transaction, so the keys are committed with the rows. The keys
+    # are joined on inside DuckDB, rows may come back in another order, their ids are set.
+    columns = model.__table__.columns.keys()
+    id_columns = [col for col in df.columns if col in SURROGATE_KEYS and SURROGATE_KEYS[col] in columns]
+    if not id_columns:
+        return df
+    staging_name = f"keys_{model.__tablename__}"
+    select_list = [f"s.{col}" for col in df.columns if col not in NATURAL_IDS]
+    joins = []
+    for natural_id in id_columns:
+        key = SURROGATE_KEYS[natural_id]
+        select_list.append(f"{key}.surrogate_key AS {key}")
+        joins.append(f"LEFT JOIN {KEY_DICTIONARY} {key} ON {key}.key_type = '{natural_id}' "
+                     f"AND {key}.natural_id = s.{natural_id}")
+
+    conn.register(staging_name, df.to_arrow())
+    try:
+        for natural_id in id_columns:
+            register_ids(conn, natural_id, staging_name)
+        return pl.from_arrow(conn.execute(
+            f"SELECT {', '.join(select_list)} FROM {staging_name} s {' '.join(joins)}").arrow())
+    finally:
+        conn.unregister(staging_name)
+
+
+def fill_missing_keys(conn, table_name: str, table_columns: list) -> int:
+    # Sets the keys of rows that have a natural id but no key yet, i.e. rows loaded before
+    # the table had a key column. table_columns are the columns the table has in the
+    # database, which for an old file may still include ids the model no longer declares.
+    filled = 0
+    for natural_id, key in SURROGATE_KEYS.items():
+        if natural_id not in table_columns or key not in table_columns:
+            continue
+        missing = conn.execute(
+            f"SELECT count(*) FROM {table_name} WHERE {key} IS NULL AND {natural_id} IS NOT NULL"
+        ).fetchone()[0]
+        if not missing:
+            continue
+        register_ids(conn, natural_id, table_name)
+        filled += conn.execute(
+            f"UPDATE {table_name} t SET {key} = d.surrogate_key FROM {KEY_DICTIONARY} d "
+            f"WHERE d.key_type = ? AND d.natural_id = t.{natural_id} AND t.{key} IS NULL",
+            [natural_id]).fetchone()[0]
+    if filled:
+        logger.info(f"Filled {filled} surrogate keys of {table_name}")
+    return filled
+
+
+def natural_ids(conn, key: str, keys: pl.Series) -> pl.DataFrame:
+    # key -> natural id for the given keys of one key column, looked up with a semi join
+    lookup_name = f"lookup_{key}"
+    natural_id = NATURAL_IDS[key]
+    conn.register(lookup_name, keys.cast(pl.Int64).unique().drop_nulls().to_frame('surrogate_key').to_arrow())
+    try:
+        lookup = pl.from_arrow(conn.execute(
+            f"SELECT d.surrogate_key AS {key}, d.natural_id AS {natural_id} FROM {KEY_DICTIONARY} d "
+            f"SEMI JOIN {lookup_name} l USING (surrogate_key) WHERE d.key_type = ?",
+            [natural_id]).arrow())
+    finally:
+        conn.unregister(lookup_name)
+    return lookup.with_columns(pl.col(key).cast(pl.Int64), pl.col(natural_id).cast(pl.String))
+
+
+def decode_keys(conn, df: pl.DataFrame) -> pl.DataFrame:
+    # The frame as the api returns it: each key column is replaced, in place, by the natural
+    # id it stands for, or dropped when the frame already has that id. Only the distinct
+    # keys of the frame are looked up, frames without keys are returned untouched.
+    if not any(col in NATURAL_IDS for col in df.columns):
+        return df
+    columns = []
+    for col in df.columns:
+        natural_id = NATURAL_IDS.get(col)
+        if natural_id is None:
+            columns.append(col)
+        elif natural_id not in df.columns:
+            lookup = natural_ids(conn, col, df[col])
+            df = df.with_columns(pl.col(col).cast(pl.Int64)).join(lookup, on=col, how='left')
+            columns.append(natural_id)
+    return df.select(columns)
+
+
+def decode_records(conn, records: list) -> list:
+    # decode_keys for the records of a json page
+    key_columns = [col for col in (records[0] if records else {}) if col in NATURAL_IDS]
+    if not key_columns:
+        return records
+    lookups = {}
+    for key in key_columns:
+        if NATURAL_IDS[key] in records[0]:
+            continue
+        lookup = natural_ids(conn, key, pl.Series([record[key] for record in records], dtype=pl.Int64))
+        lookups[key] = dict(zip(lookup[key].to_list(), lookup[NATURAL_IDS[key]].to_list()))
+    return [{NATURAL_IDS.get(col, col): lookups[col].get(value) if col in lookups else value
+             for col, value in record.items() if col not in NATURAL_IDS or col in lookups}
+            for record in records]
+
+
+def visible_columns(columns: list) -> list:
+    # the columns of a table the api reads, a key is left out when the table has its natural id
+    # and the load_seq of the loads is left out
+    return [col for col in columns if NATURAL_IDS.get(col) not in columns and col != 'load_seq']
+
+
+def api_columns(columns: list) -> list:
+    # the columns of a table as the api returns them, see decode_keys
+    return [NATURAL_IDS.get(col, col) for col in visible_columns(columns)]
@@ -0,0 +1,151 @@
+import os
+import time
+import zipfile
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import polars as pl
+from src.ingest import UPLOAD_TABLES, InvalidUploadError, ingest_batches, upload_extension
+from src.processing import load_data
+from src.schemas import TABLE_SCHEMAS
+from src.validation import validate_frames, validate_file
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+#bytes of an archive member copied at a time by extract_zip
+ZIP_COPY_CHUNK_SIZE = 1 << 20
+
+#upload table by its Olist file name without the extension
+UPLOAD_FILE_NAMES = {os.path.splitext(upload_table['file_name'])[0]: table
+                     for table, upload_table in UPLOAD_TABLES.items()}
+
+
+def table_for_file(file_name: str):
+    # the upload table a file is loaded into, from its Olist file name in any of the upload
+    # formats (olist_sellers_dataset.csv, olist_sellers_dataset.csv.gz...), None if unknown
+    base_name = os.path.basename(file_name)
+    extension = upload_extension(base_name)
+    if extension is None:
+        return None
+    return UPLOAD_FILE_NAMES.get(base_name[:-len(extension)])
+
+
+class ArchiveTooLargeError(ValueError):
+    # raised when the Olist files of an uploaded archive decompress past the size allowed
+    pass
+
+
+def extract_zip(zip_path: str, target_dir: str, max_size: int = None) -> dict:
+    # Extracts the Olist files of an archive, whatever folder they sit in. Only members
+    # with a known file name are written and always straight into target_dir, so an entry
+    # like ../../x.csv cannot land outside it. With max_size, an archive whose files add up
+    # to more bytes is refused before anything is written, and since the sizes in the zip
+    # directory can lie the bytes are also counted as they are copied: the extraction stops
+    # as soon as they pass max_size, so a zip bomb never fills the disk.
+    members = []
+    file_paths = {}
+    copied = 0
+    with zipfile.ZipFile(zip_path) as archive:
+        for member in archive.infolist():
+            table = table_for_file(member.filename)
+            if not member.is_dir() and table is not None:
+                members.append((member, table))
+        if max_size is not None and sum(member.file_size for member, _ in members) > max_size:
+            raise ArchiveTooLargeError(f"{os.path.basename(zip_path)} decompresses to more than {max_size} bytes")
+
+        for member, table in members:
+            file_path = os.path.join(target_dir, os.path.basename(member.filename))
+            with archive.open(member) as source, open(file_path, 'wb') as target:
+                while True:
+                    chunk = source.read(ZIP_COPY_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    copied += len(chunk)
+                    if max_size is not None and copied > max_size:
+                        raise ArchiveTooLargeError(
+                            f"{os.path.basename(zip_path)} decompresses to more than {max_size} bytes")
+                    target.write(chunk)
+            file_paths[table] = file_path
+    return file_paths
+
+
+def parse_table_file(table: str, file_path: str) -> pl.DataFrame:
+    # Reads and validates one upload, raises InvalidUploadError when it cannot be loaded.
+    # A file that reads cleanly is validated in memory; one whose values do not parse is
+    # scanned again as text, so the error names the columns at fault and how many rows.
+    upload_table = UPLOAD_TABLES[table]
+    try:
+        df = load_data(file_path, schema=TABLE_SCHEMAS[upload_table['model'].__tablename__])
+    except Exception as e:
+        df = e
+    if isinstance(df, pl.DataFrame):
+        report = validate_frames(table, [df])
+    else:
+        report = validate_file(table, file_path)
+    if not report['valid']:
+        raise InvalidUploadError(f"{upload_table['label']}: {'; '.join(report['errors'])}")
+    if not isinstance(df, pl.DataFrame):
+        raise InvalidUploadError(f"{upload_table['label']}: {df}")
+    for warning in report['warnings']:
+        logger.warning(f"{upload_table['label']}: {warning}")
+    return df
+
+
+def parse_files(file_paths: dict, workers: int = None):
+    # Parses and validates every file at the same time on a thread pool, polars releases
+    # the GIL while it reads a csv, so the files are read in about the time of the largest.
+    # Every file is checked before anything is written; the errors of all files are
+    # reported together.
+    start = time.perf_counter()
+    workers = workers or min(len(file_paths), os.cpu_count() or 1) or 1
+
+    def timed_parse(table):
+        table_start = time.perf_counter()
+        df = parse_table_file(table, file_paths[table])
+        return df, round(time.perf_counter() - table_start, 4)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {table: executor.submit(timed_parse, table) for table in file_paths}
+
+    frames = {}
+    parse_seconds = {}
+    errors = []
+    for table, future in futures.items():
+        try:
+            frames[table], parse_seconds[table] = future.result()
+        except InvalidUploadError as e:
+            errors.append(str(e))
+        except Exception as e:
+            errors.append(f"{UPLOAD_TABLES[table]['label']}: {str(e)}")
+    if errors:
+        raise InvalidUploadError("; ".join(errors))
+
+    logger.info(f"Parsed {len(frames)} files in {time.perf_counter() - start:.3f}s "
+                f"with {workers} workers")
+    return frames, parse_seconds
+
+
+def load_tables(db, frames: dict, mode: str = 'append', batch_size: int = 100000,
+                progress=None) -> dict:
+    # Writes the parsed tables in UPLOAD_TABLES order inside one transaction: either every
+    # table of the pipeline is loaded or none is. progress gets the rows written so far
+    # across all the tables.
+    results = {}
+    rows_done = 0
+    table_progress = None
+    try:
+        for table, upload_table in UPLOAD_TABLES.items():
+            if table not in frames:
+                continue
+            if progress is not None:
+                table_progress = lambda rows_read: progress(rows_done + rows_read)
+            results[table] = ingest_batches(db, upload_table['model'],
+                                            frames[table].iter_slices(n_rows=batch_size),
+                                            upload_table['columns'], mode=mode, commit=False,
+                                            progress=table_progress)
+            rows_done += results[table]['rows_read']
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return results
@@ -1,5 +1,11 @@
 import polars as pl
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
 import os
+import time
+import logging
+import zipfile
 import numpy as np
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import create_engine
@@ -9,8 +15,25 @@ from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import inspect
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import DeclarativeMeta
+from src.schemas import csv_read_options, arrow_csv_options, apply_schema
+from src.keys import SURROGATE_KEYS
 
-def load_data(file_path) -> pl.DataFrame:
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+#extensions read as Parquet and as Arrow IPC (Feather v2) files
+PARQUET_EXTENSIONS = ('.parquet',)
+IPC_EXTENSIONS = ('.arrow', '.feather', '.ipc')
+#compressed csv extensions and their codec, and zip archives holding a csv. Both are
+#decompressed as a stream while they are parsed, never expanded on disk
+CSV_COMPRESSIONS = {'.csv.gz': 'gzip', '.csv.bz2': 'bz2', '.csv.zst': 'zstd'}
+ZIP_EXTENSIONS = ('.zip',)
+COMPRESSED_CSV_EXTENSIONS = tuple(CSV_COMPRESSIONS) + ZIP_EXTENSIONS
+#bytes of a compressed csv parsed at a time
+CSV_BLOCK_SIZE = 8 << 20
+
+def load_data(file_path, schema: dict = None) -> pl.DataFrame:
+    #with a schema (see src/schemas.py) only its columns are read, already typed
     try:
         if isinstance(file_path, str):
             csv_format = file_path.endswith(".csv")
@@ -18,17 +41,49 @@ def load_data(file_path) -> pl.DataFrame:
             
             #if the file exists in the working directory
             if csv_format:
-                data_read_csv = pl.read_csv(file_path)
+                if schema is not None:
+                    data_read_csv = pl.read_csv(file_path, **csv_read_options(_csv_header(file_path), schema))
+                else:
+                    data_read_csv = pl.read_csv(file_path)
                 if data_read_csv.is_empty() == False:
                     return data_read_csv
                 else:
                     return "Error reading csv file"
             elif excel_format:
                 data_read_excel = pl.read_excel(file_path)
+                if schema is not None:
+                    data_read_excel = apply_schema(data_read_excel, schema)
                 if data_read_excel.is_empty() == False:
                     return data_read_excel
                 else:
                     return "Error reading excel file"
+            elif file_path.endswith(COMPRESSED_CSV_EXTENSIONS):
+                with _open_compressed_csv(file_path) as stream:
+                    table = pacsv.read_csv(stream, convert_options=_arrow_csv_options(file_path, schema))
+                data_read_csv = _from_arrow(table, schema)
+                if data_read_csv.is_empty() == False:
+                    return data_read_csv
+                else:
+                    return "Error reading csv file"
+            elif file_path.endswith(PARQUET_EXTENSIONS):
+                #scanned, so only the row groups and columns that are selected are read
+                lazy_df = pl.scan_parquet(file_path)
+                columns = _columns_to_read(lazy_df.collect_schema().names(), schema)
+                data_read_parquet = lazy_df.select(columns).collect() if columns is not None else lazy_df.collect()
+                if schema is not None:
+                    data_read_parquet = apply_schema(data_read_parquet, schema)
+                if data_read_parquet.is_empty() == False:
+                    return data_read_parquet
+                else:
+                    return "Error reading parquet file"
+            elif file_path.endswith(IPC_EXTENSIONS):
+                data_read_ipc = _read_ipc(file_path, schema)
+                if schema is not None:
+                    data_read_ipc = apply_schema(data_read_ipc, schema)
+                if data_read_ipc.is_empty() == False:
+                    return data_read_ipc
+                else:
+                    return "Error reading arrow file"
             else:
                 return "File path does not exist or is not in the right format"
         else:
@@ -40,14 +95,166 @@ def load_data(file_path) -> pl.DataFrame:
     
 
 
+def load_data_batched(file_path, batch_size: int = 100000, schema: dict = None):
+    # Returns an iterator of DataFrames of roughly batch_size rows so that large files
+    # can be validated and written one batch at a time instead of being held in memory
+    if isinstance(file_path, str):
+        if file_path.endswith(".csv"):
+            return _iter_csv_batches(file_path, batch_size, schema)
+        elif file_path.endswith(".xlsx"):
+            #excel files cannot be read incrementally, slice the frame instead
+            data_read_excel = pl.read_excel(file_path)
+            if schema is not None:
+                data_read_excel = apply_schema(data_read_excel, schema)
+            return data_read_excel.iter_slices(n_rows=batch_size)
+        elif file_path.endswith(COMPRESSED_CSV_EXTENSIONS):
+            return _iter_compressed_csv_batches(file_path, batch_size, schema)
+        elif file_path.endswith(PARQUET_EXTENSIONS):
+            return _iter_parquet_batches(file_path, batch_size, schema)
+        elif file_path.endswith(IPC_EXTENSIONS):
+            return _iter_ipc_batches(file_path, batch_size, schema)
+        else:
+            return "File path does not exist or is not in the right format"
+    else:
+        return "Invalid file path or format provided"
+
+
+def scan_data(file_path, batch_size: int = 100000):
+    # The values of a file as they are stored, for checking before anything is typed or
+    # written: csv columns are all read as text. A csv, parquet or arrow file is one lazy
+    # scan, read in parallel and only for the columns a query uses, other formats are
+    # read a batch at a time. Returns an iterator of LazyFrames.
+    if isinstance(file_path, str):
+        if file_path.endswith(".csv"):
+            return iter([pl.scan_csv(file_path, infer_schema=False)])
+        elif file_path.endswith(".xlsx"):
+            return iter([pl.read_excel(file_path).lazy()])
+        elif file_path.endswith(COMPRESSED_CSV_EXTENSIONS):
+            return (batch.lazy() for batch in _iter_compressed_csv_batches(
+                file_path, batch_size, convert_options=_arrow_text_options(file_path)))
+        elif file_path.endswith(PARQUET_EXTENSIONS):
+            return iter([pl.scan_parquet(file_path)])
+        elif file_path.endswith(IPC_EXTENSIONS):
+            return iter([pl.scan_ipc(file_path, memory_map=True)])
+        else:
+            return "File path does not exist or is not in the right format"
+    else:
+        return "Invalid file path or format provided"
+
+
+def _columns_to_read(file_columns: list, schema: dict = None):
+    # the columns of the file that are in the schema, None (every column) without a schema
+    if schema is None:
+        return None
+    return [col for col in file_columns if col in schema]
+
+
+def _csv_header(file_path: str) -> list:
+    return pl.read_csv(file_path, n_rows=0).columns
+
+
+def _from_arrow(table, schema: dict = None) -> pl.DataFrame:
+    df = pl.from_arrow(table)
+    return apply_schema(df, schema) if schema is not None else df
+
+
+def _open_compressed_csv(file_path: str):
+    # a binary stream of the csv held in a compressed file, decompressed as it is read
+    if file_path.endswith(ZIP_EXTENSIONS):
+        with zipfile.ZipFile(file_path) as archive:
+            members = [member for member in archive.infolist()
+                       if not member.is_dir() and member.filename.endswith('.csv')]
+            if not members:
+                raise ValueError("No csv file found in the zip archive")
+            #the member keeps the archive's file open until it is closed itself
+            return archive.open(members[0])
+    codec = next(codec for extension, codec in CSV_COMPRESSIONS.items() if file_path.endswith(extension))
+    return pa.CompressedInputStream(pa.OSFile(file_path), codec)
+
+
+def _arrow_csv_options(file_path: str, schema: dict = None):
+    # the header is read from the first block of a stream of its own, so columns missing
+    # from the file are left out of the projection and reported by the column checks
+    if schema is None:
+        return None
+    with _open_compressed_csv(file_path) as stream:
+        header = pacsv.open_csv(stream).schema.names
+    return arrow_csv_options(header, schema)
+
+
+def _arrow_text_options(file_path: str):
+    # every column read as text, empty fields as nulls like polars' csv reader
+    with _open_compressed_csv(file_path) as stream:
+        header = pacsv.open_csv(stream).schema.names
+    return pacsv.ConvertOptions(column_types={col: pa.string() for col in header},
+                                strings_can_be_null=True, quoted_strings_can_be_null=False)
+
+
+def _iter_compressed_csv_batches(file_path: str, batch_size: int, schema: dict = None,
+                                 convert_options=None):
+    # pyarrow decompresses and parses the file a block at a time, the blocks are gathered
+    # into batches of batch_size rows so the batches match the ones of a plain csv
+    if convert_options is None:
+        convert_options = _arrow_csv_options(file_path, schema)
+    with _open_compressed_csv(file_path) as stream:
+        reader = pacsv.open_csv(stream, read_options=pacsv.ReadOptions(block_size=CSV_BLOCK_SIZE),
+                                convert_options=convert_options)
+        pending = None
+        for record_batch in reader:
+            block = pa.Table.from_batches([record_batch])
+            pending = block if pending is None else pa.concat_tables([pending, block])
+            while pending.num_rows >= batch_size:
+                yield _from_arrow(pending.slice(0, batch_size), schema)
+                pending = pending.slice(batch_size)
+        if pending is not None and pending.num_rows:
+            yield _from_arrow(pending, schema)
+
+
+def _read_ipc(file_path: str, schema: dict = None) -> pl.DataFrame:
+    # The file is memory mapped: the columns are views of the mapped file rather than a
+    # copy of it, and pages are only read from disk when they are touched. A compressed
+    # file has to be decompressed and is read into memory instead.
+    columns = _columns_to_read(list(pl.read_ipc_schema(file_path)), schema)
+    return pl.read_ipc(file_path, columns=columns, memory_map=True)
+
+
+def _iter_parquet_batches(file_path: str, batch_size: int, schema: dict = None):
+    # Parquet is read one row group at a time and only the selected column chunks are
+    # decoded, so memory is bounded by the batch size whatever the size of the file
+    parquet_file = pq.ParquetFile(file_path)
+    columns = _columns_to_read(parquet_file.schema_arrow.names, schema)
+    for record_batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        batch = pl.from_arrow(record_batch)
+        yield apply_schema(batch, schema) if schema is not None else batch
+
+
+def _iter_ipc_batches(file_path: str, batch_size: int, schema: dict = None):
+    # slices of the memory mapped frame are views, only the casts of a batch allocate
+    for batch in _read_ipc(file_path, schema).iter_slices(n_rows=batch_size):
+        yield apply_schema(batch, schema) if schema is not None else batch
+
+
+def _iter_csv_batches(file_path: str, batch_size: int, schema: dict = None):
+    options = csv_read_options(_csv_header(file_path), schema) if schema is not None else {}
+    reader = pl.read_csv_batched(file_path, batch_size=batch_size, **options)
+    while True:
+        batches = reader.next_batches(1)
+        if not batches:
+            break
+        yield batches[0]
+
+
 def check_missing_duplcates(df: pl.DataFrame, df_name: str):
-    null_df = df.filter(df.is_empty() == True)
-    null_count = null_df.shape[0]
+    #rows with a null in any column and rows repeating an earlier row, both counted in
+    #one pass over the columns. src/validation.py has the per column report of an upload
+    null_count = df.select(pl.any_horizontal(pl.all().is_null()).sum()).item()
     print(f"{df_name} Null count: {null_count}")
-    unique_count = df.n_unique()
-    filtered_df = df.filter(df.is_duplicated() == False)
-    if unique_count == filtered_df.shape[0]:
+    duplicate_count = df.height - df.n_unique()
+    if duplicate_count == 0:
         print(f"No duplicates found in {df_name}")
+    else:
+        print(f"{duplicate_count} duplicates found in {df_name}")
+    return null_count, duplicate_count
 
 def transform_product_category_df(df) -> pl.DataFrame:
     if isinstance(df, pl.DataFrame):
@@ -61,11 +268,12 @@ def transform_product_category_df(df) -> pl.DataFrame:
     else:
         return "Please provide a valid dataframe"
 
-def transform__df(df) -> pl.DataFrame:
+def transform__df(df, offset: int = 0) -> pl.DataFrame:
+    #offset lets batched loads keep numbering the ids where the previous batch stopped
     if isinstance(df, pl.DataFrame):
         if df.is_empty() == False:
             col_name = "id"
-            df = df.with_columns(pl.Series(col_name, np.arange(1, len(df) + 1)))
+            df = df.with_columns(pl.Series(col_name, np.arange(offset + 1, offset + len(df) + 1)))
             df = df.with_columns(pl.col(col_name).cast(pl.Int64))
             return df
         elif df.is_empty() == True:
@@ -88,6 +296,89 @@ def process_dim_table_df(db_table: list) -> pl.DataFrame:
         return "Please provide a valid sqlalchemy table"
 
         
+def _key_column(df, natural_id: str) -> str:
+    # the integer surrogate key of a hex id when the frame (or lazy frame) has it, see src/keys.py
+    key = SURROGATE_KEYS[natural_id]
+    return key if key in df.collect_schema().names() else natural_id
+
+
+def prune_dimensions(fact_table: pl.DataFrame, dimensions: dict) -> dict:
+    # Keeps only the rows of each dimension whose key is in the fact rows, with a semi join
+    # on the distinct keys. dimensions maps a name to (frame, key, source): the key is read
+    # from the fact rows, or from the pruned source dimension listed before it. Returns
+    # name -> (pruned frame, key, source, number of distinct keys it was pruned on).
+    pruned = {}
+    for name, (df, key, source) in dimensions.items():
+        keys = (pruned[source][0] if source is not None else fact_table).select(pl.col(key).unique())
+        pruned[name] = (df.join(keys, on=key, how="semi"), key, source, len(keys))
+    return pruned
+
+
+def plan_fact_joins(cardinalities: dict, sources: dict) -> list:
+    # The order to join the dimensions in, from their collected cardinalities: name ->
+    # (rows after pruning, distinct keys of the fact rows). rows / keys is the share of the
+    # fact rows' keys a dimension matches, so the joins that drop the most rows run first
+    # and every later join has fewer rows to probe, the smaller dimension first on a tie.
+    # A dimension joins after the one its key comes from (sources, name -> name or None).
+    plan = []
+    while len(plan) < len(cardinalities):
+        ready = [name for name in cardinalities if name not in plan
+                 and (sources.get(name) is None or sources[name] in plan)]
+        plan.append(min(ready, key=lambda name: (cardinalities[name][0] / max(cardinalities[name][1], 1),
+                                                 cardinalities[name][0])))
+    return plan
+
+
+def join_dimensions(fact_table: pl.DataFrame, dimensions: dict) -> pl.DataFrame:
+    # Inner joins the dimensions (see prune_dimensions) onto the fact rows, pruned and in
+    # the order of plan_fact_joins. The plan and the rows left after each join are logged.
+    # The rows come back in the order the joins produce them, callers that need an order
+    # sort on the ids of the source rows (see FACT_TABLE_ROW_IDS).
+    pruned = prune_dimensions(fact_table, dimensions)
+    plan = plan_fact_joins({name: (len(df), keys) for name, (df, _, _, keys) in pruned.items()},
+                           {name: source for name, (_, _, source, _) in pruned.items()})
+    logger.info("Fact join plan: " + " -> ".join(
+        [f"fact rows ({len(fact_table)})"]
+        + [f"{name} ({len(pruned[name][0])} of {len(dimensions[name][0])} rows)" for name in plan]))
+
+    for name in plan:
+        start = time.perf_counter()
+        df, key, _, _ = pruned[name]
+        fact_table = fact_table.join(df, on=key, how="inner")
+        logger.info(f"Joined {name} on {key}: {len(fact_table)} rows in {time.perf_counter() - start:.3f}s")
+    return fact_table
+
+
+#the ids (or positions) of the source rows a fact row is built from: the fact rows are
+#numbered in their order, and of the rows built for one natural key the last in this order
+#is kept. The orders and order items come first, the dimensions only break the ties of a
+#dimension row loaded twice. The lazy build carries them to the file it writes
+FACT_TABLE_ROW_IDS = ['orders_id', 'order_items_id', 'customers_id', 'products_id', 'sellers_id',
+                      'product_category_id']
+
+
+def _with_row_id(df, name: str):
+    # the frame's id column (or lazy frame's) renamed to name, its row positions when it has none
+    if 'id' in df.collect_schema().names():
+        return df.rename({'id': name})
+    return df.with_row_index(name)
+
+
+def deduplicate_fact_table(df: pl.DataFrame, key: list = None, row_hash: bool = False) -> pl.DataFrame:
+    # Keeps one row per key, the last one in build order. The key is the fact table's natural
+    # key (order, order_item_id) by default, only its columns are compared so the cost does
+    # not grow with the width of the rows. row_hash=True keys on a 64-bit hash of every
+    # column but the id instead, computed once per row, to drop rows repeated whole.
+    if row_hash:
+        keys = df.drop('id', strict=False).hash_rows()
+    else:
+        keys = df.select(pl.struct(key or [_key_column(df, "order_id"), "order_item_id"])).to_series()
+    deduplicated = df.filter(keys.is_last_distinct())
+    if len(deduplicated) < len(df):
+        logger.info(f"Removed {len(df) - len(deduplicated)} duplicate fact rows")
+    return deduplicated
+
+
 def process_fact_table(list_of_dfs: list,
                        no_tables = 7) -> pl.DataFrame:
 
@@ -102,32 +393,30 @@ def process_fact_table(list_of_dfs: list,
             orders_df , \
             order_items_df, \
             customers_df,order_payments_df,products_df,sellers_df, product_category_df = list_of_dfs
-            if 'id' in (orders_df.columns
-                        and order_items_df.columns
-                        and customers_df.columns
-                        and order_payments_df.columns
-                        and products_df.columns
-                        and sellers_df.columns
-                        and product_category_df.columns):
-                
-                orders_df = orders_df.drop('id')
-                order_items_df = order_items_df.drop('id')
-                customers_df = customers_df.drop('id')
-                order_payments_df = order_payments_df.drop('id')
-                products_df = products_df.drop('id')
-                sellers_df = sellers_df.drop('id')
-                product_category_df = product_category_df.drop('id')
-
-            fact_table = orders_df.join(
-                order_items_df, on="order_id", how="inner"  
-                        ). \
-                join(customers_df, on="customer_id", how="inner"). \
-                    join(products_df.select(["product_id", "product_category_name"])
-                ,on="product_id", how="inner").\
-                    join(sellers_df, on="seller_id", how="inner"). \
-                join(product_category_df, on=["product_category_name"], how="inner")
-
-            print("fact_table_columns: ", fact_table.columns)
+            #frames read with their surrogate keys are joined on the integers
+            #the rows are put in the order of the source rows they are built from (their ids,
+            #or their positions), whatever order the joins return them in
+            orders_id, order_items_id, customers_id, products_id, sellers_id, product_category_id = \
+                FACT_TABLE_ROW_IDS
+            product_column = _key_column(products_df, "product_id")
+            fact_table = _with_row_id(orders_df, orders_id).join(
+                _with_row_id(order_items_df, order_items_id), on=_key_column(orders_df, "order_id"), how="inner"
+                        )
+            dimensions = {
+                'customers': (_with_row_id(customers_df, customers_id), _key_column(customers_df, "customer_id"), None),
+                'products': (_with_row_id(products_df, products_id).select([product_column, "product_category_name",
+                                                                            products_id]), product_column, None),
+                'sellers': (_with_row_id(sellers_df, sellers_id), _key_column(sellers_df, "seller_id"), None),
+                'product_category': (_with_row_id(product_category_df, product_category_id),
+                                     "product_category_name", 'products'),
+            }
+            columns = fact_table.columns + [col for name in ['customers', 'products', 'sellers', 'product_category']
+                                            for col in dimensions[name][0].columns
+                                            if col != dimensions[name][1]]
+            fact_table = join_dimensions(fact_table, dimensions).select(columns).sort(FACT_TABLE_ROW_IDS)
+            fact_table = deduplicate_fact_table(fact_table).drop(FACT_TABLE_ROW_IDS)
+
+            logger.debug(f"fact_table_columns: {fact_table.columns}")
 
             fact_table = fact_table.with_columns(pl.Series("id", np.arange(1, len(fact_table) + 1)))
             fact_table = fact_table.with_columns(pl.col("id").cast(pl.Int64))
@@ -140,21 +429,85 @@ def process_fact_table(list_of_dfs: list,
         return "Please provide a list of polars dataframes"
 
 
+def scan_table(file_path: str) -> pl.LazyFrame:
+    # a Parquet or Arrow IPC table as a lazy scan, only the columns and row groups a query
+    # uses are read, in batches, when it runs
+    if file_path.endswith(PARQUET_EXTENSIONS):
+        return pl.scan_parquet(file_path)
+    elif file_path.endswith(IPC_EXTENSIONS):
+        return pl.scan_ipc(file_path, memory_map=True)
+    raise ValueError(f"{file_path} is not a parquet or arrow file")
+
+
+def process_fact_table_lazy(list_of_lfs: list, columns: list = None,
+                            no_tables = 6) -> pl.LazyFrame:
+    # The join chain of process_fact_table as a query plan over scans (see scan_table), over
+    # the tables it joins: orders, order_items, customers, products, sellers and
+    # product_category (order_payments is not part of a fact row). Nothing is read until the
+    # plan is collected or sunk, and then only the given columns (every column by default)
+    # and the join keys, plus the FACT_TABLE_ROW_IDS. order_items, the largest table, is the
+    # side that is streamed through the joins, each other table only has to fit in memory as
+    # a hash table.
+    if not isinstance(list_of_lfs, list) or len(list_of_lfs) != no_tables \
+            or not all(isinstance(lf, pl.LazyFrame) for lf in list_of_lfs):
+        raise ValueError("Ensure you have a list of just polars lazyframes")
+
+    orders_lf, order_items_lf, customers_lf, products_lf, sellers_lf, product_category_lf = list_of_lfs
+    orders_id, order_items_id, customers_id, products_id, sellers_id, product_category_id = FACT_TABLE_ROW_IDS
+
+    product_column = _key_column(products_lf, "product_id")
+    fact_table = _with_row_id(order_items_lf, order_items_id).join(
+        _with_row_id(orders_lf, orders_id), on=_key_column(orders_lf, "order_id"), how="inner"). \
+        join(_with_row_id(customers_lf, customers_id), on=_key_column(customers_lf, "customer_id"), how="inner"). \
+        join(_with_row_id(products_lf, products_id).select([product_column, "product_category_name", products_id]),
+             on=product_column, how="inner"). \
+        join(_with_row_id(sellers_lf, sellers_id), on=_key_column(sellers_lf, "seller_id"), how="inner"). \
+        join(_with_row_id(product_category_lf, product_category_id), on=["product_category_name"], how="inner")
+    if columns is not None:
+        fact_table = fact_table.select(FACT_TABLE_ROW_IDS + [col for col in columns if col not in FACT_TABLE_ROW_IDS])
+    return fact_table
+
+
+def sink_fact_table(list_of_lfs: list, file_path: str, columns: list = None) -> str:
+    # Runs process_fact_table_lazy with the streaming engine straight into a Parquet or
+    # Arrow IPC file: the joined rows are written batch by batch and never held in memory
+    # together, so the fact table can be larger than the RAM it is built in. The streaming
+    # engine cannot read Arrow IPC scans yet, a plan over them is collected (streaming
+    # what it can) and written whole instead.
+    if not file_path.endswith(PARQUET_EXTENSIONS + IPC_EXTENSIONS):
+        raise ValueError(f"{file_path} is not a parquet or arrow file")
+    fact_table = process_fact_table_lazy(list_of_lfs, columns=columns)
+    try:
+        if file_path.endswith(PARQUET_EXTENSIONS):
+            fact_table.sink_parquet(file_path)
+        else:
+            fact_table.sink_ipc(file_path)
+    except pl.exceptions.InvalidOperationError as e:
+        logger.warning(f"The fact table plan cannot be streamed, collecting it in memory: {e}")
+        collected = fact_table.collect(streaming=True)
+        if file_path.endswith(PARQUET_EXTENSIONS):
+            collected.write_parquet(file_path)
+        else:
+            collected.write_ipc(file_path)
+    return file_path
+
+
 def get_top_sellers(df: pl.DataFrame) -> pl.DataFrame:
     if isinstance(df, pl.DataFrame) == True:
         if df.is_empty() == False:
-            top_selling_sellers = df.group_by("seller_id").agg([
+            seller_column = _key_column(df, "seller_id")
+            top_selling_sellers = df.group_by(seller_column).agg([
                 pl.sum("price").alias("Total_sales")
-            ]).sort("Total_sales", descending = True).select(["seller_id", "Total_sales"]).head(10)
+            ]).sort("Total_sales", descending = True).select([seller_column, "Total_sales"]).head(10)
 
             top_selling_sellers = top_selling_sellers.with_columns(pl.Series("id",
                                                                             np.arange(1, len(top_selling_sellers) + 1)))
             top_selling_sellers = top_selling_sellers.with_columns(pl.col("id").cast(pl.Int64))
 
             #rearrange the columns
-            top_selling_sellers = top_selling_sellers.select(["id", "seller_id", "Total_sales"])
+            top_selling_sellers = top_selling_sellers.select(["id", seller_column, "Total_sales"])
 
-            print("top sellers: ", top_selling_sellers)
+            logger.debug(f"top sellers: {top_selling_sellers}")
             return top_selling_sellers
         else:
             return "Dataframe is empty, Provide the valid Fact table"
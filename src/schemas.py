@@ -0,0 +1,97 @@
+import polars as pl
+import pyarrow as pa
+import pyarrow.csv as pacsv
+from sqlalchemy import Integer, Float, String, DateTime
+from src.database import (Sellers, Customers, Orders, Order_Items, Order_Payments, Products,
+                          Product_Category)
+from src.keys import NATURAL_IDS
+
+#polars type a column of each model type is parsed as. Integers match DuckDB's INTEGER,
+#floats are parsed at full precision and narrowed by DuckDB when they are written
+MODEL_DTYPES = [
+    (Integer, pl.Int32),
+    (Float, pl.Float64),
+    (DateTime, pl.Datetime('us')),
+    (String, pl.String),
+]
+
+#low cardinality text columns, held as a dictionary of their few distinct values plus
+#small integer codes instead of one string per row
+CATEGORICAL_COLUMNS = {'seller_state', 'customer_state', 'order_status', 'payment_type'}
+
+
+def model_schema(model) -> dict:
+    # column -> polars dtype for every column of the model except the generated id, the
+    # load_seq and the surrogate keys, which the loads set rather than read from the file
+    schema = {}
+    for name, column in model.__table__.columns.items():
+        if name in ('id', 'load_seq') or name in NATURAL_IDS:
+            continue
+        if name in CATEGORICAL_COLUMNS:
+            schema[name] = pl.Categorical
+            continue
+        for column_type, dtype in MODEL_DTYPES:
+            if isinstance(column.type, column_type):
+                schema[name] = dtype
+                break
+        else:
+            raise TypeError(f"No polars dtype for {model.__tablename__}.{name} ({column.type})")
+    return schema
+
+
+#the schema every Olist file is read with, by table name
+TABLE_SCHEMAS = {model.__tablename__: model_schema(model) for model in [
+    Sellers, Customers, Orders, Order_Items, Order_Payments, Products, Product_Category]}
+
+
+def csv_read_options(header: list, schema: dict) -> dict:
+    # Only the columns of the schema are parsed, the rest of the file is skipped by the
+    # reader. Every column of the header is given a dtype, the batched reader needs them
+    # all as soon as it projects, the skipped ones are never read so their dtype is moot.
+    return {
+        'columns': [col for col in header if col in schema],
+        'schema_overrides': {col: schema.get(col, pl.String) for col in header},
+    }
+
+
+def arrow_csv_options(header: list, schema: dict) -> pacsv.ConvertOptions:
+    # The same projection and types for pyarrow's streaming csv reader. Its dictionary
+    # columns must have int32 indices, polars reads them back as Categorical. Empty fields
+    # are nulls and quoted empty strings are kept, as polars' csv reader does.
+    column_types = {}
+    for col in header:
+        if col not in schema:
+            continue
+        if schema[col] == pl.Categorical:
+            column_types[col] = pa.dictionary(pa.int32(), pa.string())
+        else:
+            column_types[col] = pl.Series(col, [], dtype=schema[col]).to_arrow().type
+    return pacsv.ConvertOptions(include_columns=list(column_types), column_types=column_types,
+                                strings_can_be_null=True, quoted_strings_can_be_null=False)
+
+
+#the timestamp layout of the Olist files, tried before letting polars work the format out
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def apply_schema(df: pl.DataFrame, schema: dict) -> pl.DataFrame:
+    # The same projection and types for a frame that was read without them, e.g. from excel
+    # or a parquet file written from an untyped csv. Timestamps held as text are parsed,
+    # with the Olist layout first since a known format parses several times faster than an
+    # inferred one, everything else is cast.
+    try:
+        return df.select(_schema_columns(df, schema, DATETIME_FORMAT))
+    except pl.exceptions.InvalidOperationError:
+        return df.select(_schema_columns(df, schema, None))
+
+
+def _schema_columns(df: pl.DataFrame, schema: dict, datetime_format: str = None) -> list:
+    columns = []
+    for col in df.columns:
+        if col not in schema:
+            continue
+        if isinstance(schema[col], pl.Datetime) and df.schema[col] == pl.String:
+            columns.append(pl.col(col).str.to_datetime(datetime_format, time_unit=schema[col].time_unit))
+        else:
+            columns.append(pl.col(col).cast(schema[col]))
+    return columns
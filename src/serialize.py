@@ -0,0 +1,19 @@
+import polars as pl
+
+def check_columns(df: pl.DataFrame, columns: list):
+    # checks the requested columns against the frame's schema, no rows are touched
+    missing = [col for col in columns if col not in df.schema]
+    if missing:
+        raise ValueError(f"Columns not in the dataframe: {', '.join(missing)}")
+
+
+def df_to_list_of_dicts(df: pl.DataFrame, columns: list = None, limit: int = None) -> list:
+    # Builds the records of a response body. The frame is cut down to the requested
+    # columns and rows first, so only the rows that are returned are ever turned into
+    # python dicts, and polars builds them column by column in one call.
+    if columns is not None:
+        check_columns(df, columns)
+        df = df.select(columns)
+    if limit is not None:
+        df = df.head(limit)
+    return df.to_dicts()
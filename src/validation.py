@@ -0,0 +1,181 @@
+import time
+import logging
+import polars as pl
+from src.ingest import UPLOAD_TABLES
+from src.processing import scan_data
+from src.schemas import TABLE_SCHEMAS, DATETIME_FORMAT
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+#the 26 states and the federal district, the values of seller_state and customer_state
+BRAZIL_STATES = ['AC', 'AL', 'AM', 'AP', 'BA', 'CE', 'DF', 'ES', 'GO', 'MA', 'MG', 'MS', 'MT', 'PA',
+                 'PB', 'PE', 'PI', 'PR', 'RJ', 'RN', 'RO', 'RR', 'RS', 'SC', 'SE', 'SP', 'TO']
+ORDER_STATUSES = ['approved', 'canceled', 'created', 'delivered', 'invoiced', 'processing',
+                  'shipped', 'unavailable']
+PAYMENT_TYPES = ['boleto', 'credit_card', 'debit_card', 'not_defined', 'voucher']
+
+#the values a column may hold, any other value rejects the upload
+VALUE_DOMAINS = {
+    'seller_state': BRAZIL_STATES,
+    'customer_state': BRAZIL_STATES,
+    'order_status': ORDER_STATUSES,
+    'payment_type': PAYMENT_TYPES,
+}
+
+#pairs of timestamps of an upload table where the first should not be later than the second.
+#the Olist data has a few orders handed to the carrier before their payment was approved,
+#so rows out of order are reported as warnings and do not reject the upload
+DATE_ORDER = {
+    'orders': [('order_purchase_timestamp', 'order_approved_at'),
+               ('order_approved_at', 'order_delivered_carrier_date'),
+               ('order_delivered_carrier_date', 'order_delivered_customer_date'),
+               ('order_purchase_timestamp', 'order_estimated_delivery_date')],
+}
+
+
+def _typed(col: str, source_dtype, dtype, datetime_format: str = None) -> pl.Expr:
+    # the column in the model's type, values that do not convert become nulls
+    if isinstance(dtype, pl.Datetime) and source_dtype == pl.String:
+        return pl.col(col).str.to_datetime(datetime_format, time_unit=dtype.time_unit, strict=False)
+    if dtype == pl.Categorical or dtype == pl.String:
+        return pl.col(col).cast(pl.String)
+    return pl.col(col).cast(dtype, strict=False)
+
+
+def _check_exprs(table: str, file_schema: dict, datetime_format: str = None) -> list:
+    # Every count of the report for the columns the upload has, as one row of aggregates
+    # named <column>:<check> so they can be summed over batches and read back. The distinct
+    # hashes of the natural key come along as a list, duplicates are counted from them once
+    # every batch is in.
+    model = UPLOAD_TABLES[table]['model']
+    schema = TABLE_SCHEMAS[model.__tablename__]
+    exprs = [pl.len().alias(':rows')]
+    for col in UPLOAD_TABLES[table]['columns']:
+        if col not in file_schema:
+            continue
+        typed = _typed(col, file_schema[col], schema[col], datetime_format)
+        exprs.append(pl.col(col).null_count().alias(f'{col}:null_count'))
+        exprs.append((typed.is_null() & pl.col(col).is_not_null()).sum().alias(f'{col}:type_errors'))
+        if col in VALUE_DOMAINS:
+            exprs.append((~typed.is_in(VALUE_DOMAINS[col])).sum().alias(f'{col}:domain_errors'))
+    for earlier, later in DATE_ORDER.get(table, []):
+        if earlier in file_schema and later in file_schema:
+            exprs.append((_typed(earlier, file_schema[earlier], schema[earlier], datetime_format)
+                          > _typed(later, file_schema[later], schema[later], datetime_format))
+                         .sum().alias(f'{earlier} > {later}:date_order'))
+    if all(col in file_schema for col in model.natural_key):
+        key = [_typed(col, file_schema[col], schema[col]) for col in model.natural_key]
+        exprs.append(pl.struct(key).hash().unique().implode().alias(':key_hashes'))
+    return exprs
+
+
+def _frame_counts(table: str, frame: pl.LazyFrame, file_schema: dict) -> pl.DataFrame:
+    # One query, one pass over the frame. Timestamps are parsed with the Olist layout, and
+    # again with an inferred format only when that leaves values unparsed, the same
+    # fallback as schemas.apply_schema.
+    schema = TABLE_SCHEMAS[UPLOAD_TABLES[table]['model'].__tablename__]
+    counts = frame.select(_check_exprs(table, file_schema, DATETIME_FORMAT)).collect()
+    datetime_columns = [col for col in counts.columns if col.endswith(':type_errors')
+                        and isinstance(schema[col.split(':')[0]], pl.Datetime)]
+    if any(counts[col].item() for col in datetime_columns):
+        counts = frame.select(_check_exprs(table, file_schema, None)).collect()
+    return counts
+
+
+def validate_frames(table: str, frames) -> dict:
+    # Checks an upload before it is typed or written and reports on every column: whether
+    # the required columns are there, values that do not convert to the model's type, nulls,
+    # natural keys that repeat, values outside their domain and timestamps out of order.
+    # frames are LazyFrames (or DataFrames) of the upload, usually processing.scan_data;
+    # their counts are added up and the key hashes of all of them compared, so a file read
+    # in batches gets the same report as one scanned whole.
+    start = time.perf_counter()
+    upload_table = UPLOAD_TABLES[table]
+    model = upload_table['model']
+    schema = TABLE_SCHEMAS[model.__tablename__]
+
+    file_columns = None
+    counts = []
+    for frame in frames:
+        frame = frame.lazy()
+        if file_columns is None:
+            file_columns = dict(frame.collect_schema())
+            if any(col not in file_columns for col in upload_table['columns']):
+                #the wrong file, rejected from its header without reading the rows
+                counts = None
+                break
+        counts.append(_frame_counts(table, frame, file_columns))
+    totals = {':rows': 0}
+    key_hashes = None
+    if counts:
+        counts = pl.concat(counts)
+        if ':key_hashes' in counts.columns:
+            key_hashes = counts[':key_hashes'].explode()
+            counts = counts.drop(':key_hashes')
+        totals = counts.sum().row(0, named=True)
+    #rows is None when the file was rejected from its header without being read
+    rows = totals[':rows'] if counts is not None else None
+
+    errors = []
+    warnings = []
+    missing_columns = [col for col in upload_table['columns'] if col not in (file_columns or [])]
+    if missing_columns:
+        errors.append(f"Columns not in the file: {', '.join(missing_columns)}")
+    elif rows == 0:
+        errors.append("The file has no rows")
+
+    columns = {}
+    for col in upload_table['columns']:
+        if missing_columns:
+            break
+        report = {
+            'dtype': str(schema[col].base_type()),
+            'null_count': totals[f'{col}:null_count'],
+            'type_errors': totals[f'{col}:type_errors'],
+        }
+        if report['type_errors']:
+            errors.append(f"{col}: {report['type_errors']} values are not {report['dtype']}")
+        if col in model.natural_key and report['null_count']:
+            errors.append(f"{col}: {report['null_count']} rows have no {col}")
+        if col in VALUE_DOMAINS:
+            report['domain_errors'] = totals[f'{col}:domain_errors']
+            if report['domain_errors']:
+                errors.append(f"{col}: {report['domain_errors']} values outside "
+                              f"{', '.join(VALUE_DOMAINS[col])}")
+        columns[col] = report
+
+    duplicate_keys = 0
+    if key_hashes is not None:
+        duplicate_keys = rows - key_hashes.n_unique()
+    if duplicate_keys:
+        errors.append(f"{duplicate_keys} rows repeat the {', '.join(model.natural_key)} of an earlier row")
+
+    date_order = {name[:-len(':date_order')]: count for name, count in totals.items()
+                  if name.endswith(':date_order')}
+    for pair, count in date_order.items():
+        if count:
+            warnings.append(f"{count} rows have {pair}")
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"Validated {rows} {table} rows in {elapsed:.3f}s, {len(errors)} errors")
+    return {
+        'table': table,
+        'valid': not errors,
+        'rows': rows,
+        'errors': errors,
+        'warnings': warnings,
+        'missing_columns': missing_columns,
+        'columns': columns,
+        'duplicate_keys': duplicate_keys,
+        'date_order_violations': date_order,
+        'validation_seconds': round(elapsed, 4),
+    }
+
+
+def validate_file(table: str, file_path: str, batch_size: int = 100000) -> dict:
+    # the report of an uploaded file, read the way processing.scan_data reads its format
+    frames = scan_data(file_path, batch_size=batch_size)
+    if isinstance(frames, str):
+        raise ValueError(frames)
+    return validate_frames(table, frames)
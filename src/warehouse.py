@@ -0,0 +1,482 @@
+import os
+import time
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import polars as pl
+from sqlalchemy import MetaData
+from sqlalchemy.schema import CreateTable
+from src.database import (get_raw_connection, read_table, FactTable, Top_Sellers, Orders, Order_Items,
+                          Customers, Order_Payments, Products, Sellers, Product_Category)
+from src.keys import encoded_columns
+from src.processing import get_top_sellers, scan_table, sink_fact_table, FACT_TABLE_ROW_IDS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+#every column of the fact table except its surrogate id, in the model's order
+FACT_TABLE_COLUMNS = [col for col in FactTable.__table__.columns.keys() if col != 'id']
+#the natural key of a fact row, the builds keep one row per key
+FACT_TABLE_KEY = ['order_key', 'order_item_id']
+
+#where each fact table column comes from in the join chain below
+FACT_TABLE_SOURCES = {
+    'order_key': 'o', 'customer_key': 'o', 'order_status': 'o',
+    'order_purchase_timestamp': 'o', 'order_approved_at': 'o',
+    'order_delivered_carrier_date': 'o', 'order_delivered_customer_date': 'o',
+    'order_estimated_delivery_date': 'o',
+    'customer_unique_id': 'c', 'customer_zip_code_prefix': 'c',
+    'customer_city': 'c', 'customer_state': 'c',
+    'order_item_id': 'oi', 'product_key': 'oi', 'seller_key': 'oi',
+    'shipping_limit_date': 'oi', 'price': 'oi', 'freight_value': 'oi',
+    'product_category_name': 'p',
+    'seller_zip_code_prefix': 's', 'seller_city': 's', 'seller_state': 's',
+    'product_category_name_english': 'pc',
+}
+
+#the same inner join chain as processing.process_fact_table, on the integer surrogate keys:
+#orders -> order_items -> customers -> products -> sellers -> product_category
+FACT_TABLE_JOINS = """
+FROM orders o
+JOIN order_items oi ON oi.order_key = o.order_key
+JOIN customers c ON c.customer_key = o.customer_key
+JOIN products p ON p.product_key = oi.product_key
+JOIN sellers s ON s.seller_key = oi.seller_key
+JOIN product_category pc ON pc.product_category_name = p.product_category_name
+"""
+
+DIMENSION_TABLES = ['sellers', 'customers', 'orders', 'order_items',
+                    'order_payments', 'products', 'product_category']
+
+
+#the table of the join chain each of processing.FACT_TABLE_ROW_IDS is the id of
+FACT_TABLE_ROW_ID_SOURCES = dict(zip(FACT_TABLE_ROW_IDS, ['o', 'oi', 'c', 'p', 's', 'pc']))
+
+#keeps the fact row built last for each FACT_TABLE_KEY, the one processing.deduplicate_fact_table
+#keeps. The row ids together are unique, so the row kept does not depend on the join's order
+LATEST_FACT_ROW = (f"QUALIFY row_number() OVER (PARTITION BY {', '.join(FACT_TABLE_KEY)} "
+                   f"ORDER BY {', '.join(f'{col} DESC' for col in FACT_TABLE_ROW_IDS)}) = 1")
+
+
+def numbered_fact_rows_sql(source: str) -> str:
+    # The fact rows of source (FACT_TABLE_COLUMNS and FACT_TABLE_ROW_IDS) with one row per
+    # FACT_TABLE_KEY (see LATEST_FACT_ROW) and ids numbered in the order the polars join
+    # produces its rows
+    return (f"SELECT row_number() OVER (ORDER BY {', '.join(FACT_TABLE_ROW_IDS)}) AS id, "
+            f"{', '.join(FACT_TABLE_COLUMNS)} FROM (SELECT * FROM {source} {LATEST_FACT_ROW})")
+
+
+def fact_rows_sql(where: str = '') -> str:
+    # the joined fact rows with the ids of the source rows they are built from
+    select_list = ",\n       ".join(
+        [f"{source}.id AS {row_id}" for row_id, source in FACT_TABLE_ROW_ID_SOURCES.items()]
+        + [f"{FACT_TABLE_SOURCES[col]}.{col}" for col in FACT_TABLE_COLUMNS])
+    return f"(SELECT {select_list}{FACT_TABLE_JOINS}{where})"
+
+
+def fact_table_select_sql() -> str:
+    return numbered_fact_rows_sql(fact_rows_sql())
+
+
+def empty_dimension_tables(conn) -> list:
+    counts = conn.execute(
+        "SELECT " + ", ".join(f"(SELECT count(*) FROM {table})" for table in DIMENSION_TABLES)
+    ).fetchone()
+    return [table for table, count in zip(DIMENSION_TABLES, counts) if count == 0]
+
+
+#the foreign keys between the Olist tables: (table, column, referenced table, column)
+FOREIGN_KEYS = [
+    ('order_items', 'order_id', 'orders', 'order_id'),
+    ('order_items', 'product_id', 'products', 'product_id'),
+    ('order_items', 'seller_id', 'sellers', 'seller_id'),
+    ('orders', 'customer_id', 'customers', 'customer_id'),
+    ('products', 'product_category_name', 'product_category', 'product_category_name'),
+    ('order_payments', 'order_id', 'orders', 'order_id'),
+]
+
+
+def check_integrity(conn, sample_size: int = 5) -> dict:
+    # Counts the orphans of every foreign key: rows whose key is null or is not in the
+    # referenced table, which the inner joins of the fact build drop. Each count is one
+    # hash anti join inside DuckDB, only the counts and a few sample keys reach Python.
+    # order_items_dropped is the number of order items no fact row can be built from.
+    start = time.perf_counter()
+    relationships = {}
+    for table, column, referenced_table, referenced_column in FOREIGN_KEYS:
+        orphans = (f"FROM {table} c ANTI JOIN {referenced_table} r "
+                   f"ON c.{column} = r.{referenced_column}")
+        rows, orphan_rows, null_keys, orphan_keys = conn.execute(
+            f"SELECT (SELECT count(*) FROM {table}), count(*), count(*) - count(c.{column}), "
+            f"count(DISTINCT c.{column}) {orphans}").fetchone()
+        sample_keys = []
+        if orphan_keys:
+            sample_keys = [key for key, in conn.execute(
+                f"SELECT DISTINCT c.{column} {orphans} WHERE c.{column} IS NOT NULL "
+                f"ORDER BY 1 LIMIT {int(sample_size)}").fetchall()]
+        relationships[f"{table}.{column}"] = {
+            'references': f"{referenced_table}.{referenced_column}",
+            'rows': rows,
+            'orphan_rows': orphan_rows,
+            'null_keys': null_keys,
+            'orphan_keys': orphan_keys,
+            'sample_keys': sample_keys,
+        }
+
+    #an order item reaches the fact table only when every link of the join chain is there,
+    #followed on the surrogate keys like the build itself
+    order_items_dropped = conn.execute(
+        "SELECT count(*) FROM order_items oi WHERE "
+        "NOT EXISTS (SELECT 1 FROM orders o SEMI JOIN customers c ON c.customer_key = o.customer_key "
+        "WHERE o.order_key = oi.order_key) "
+        "OR NOT EXISTS (SELECT 1 FROM products p SEMI JOIN product_category pc "
+        "ON pc.product_category_name = p.product_category_name WHERE p.product_key = oi.product_key) "
+        "OR NOT EXISTS (SELECT 1 FROM sellers s WHERE s.seller_key = oi.seller_key)").fetchone()[0]
+
+    elapsed = time.perf_counter() - start
+    orphan_rows = sum(relationship['orphan_rows'] for relationship in relationships.values())
+    logger.info(f"Integrity check: {orphan_rows} orphan rows, {order_items_dropped} order items "
+                f"left out of the fact table, in {elapsed:.3f}s")
+    return {
+        'relationships': relationships,
+        'orphan_rows': orphan_rows,
+        'order_items_dropped': order_items_dropped,
+        'check_seconds': round(elapsed, 4),
+    }
+
+
+#a rebuild is written into <table>_staging and swapped in with two renames in the same
+#transaction. Readers keep seeing the live version until the swap is committed, never a
+#half-built table, and the version it replaced stays as <table>_previous for rollback_table
+STAGING_SUFFIX = '_staging'
+PREVIOUS_SUFFIX = '_previous'
+#the tables rebuilt this way. DuckDB cannot rename a table that has an index, they have none
+REBUILT_TABLES = {model.__tablename__: model for model in [FactTable, Top_Sellers]}
+
+
+def create_staging_table(db, model) -> str:
+    # an empty table with the model's columns and primary key to build the next version in
+    staging_name = f"{model.__tablename__}{STAGING_SUFFIX}"
+    conn = get_raw_connection(db)
+    conn.execute(f"DROP TABLE IF EXISTS {staging_name}")
+    staging_table = model.__table__.to_metadata(MetaData(), name=staging_name)
+    conn.execute(str(CreateTable(staging_table).compile(dialect=db.get_bind().dialect)))
+    return staging_name
+
+
+def publish_staging_table(db, model, preview_rows: int = 5) -> dict:
+    # Swaps the staged version of the model's table in: the live table becomes the previous
+    # version (the older previous one is dropped) and the staging table the live one. The
+    # counts compare the two versions by id: rows of the new version whose id was already
+    # live, and the others, previewed. The caller commits, which makes the swap visible.
+    table_name = model.__tablename__
+    staging_name = f"{table_name}{STAGING_SUFFIX}"
+    previous_name = f"{table_name}{PREVIOUS_SUFFIX}"
+    conn = get_raw_connection(db)
+    column_list = ", ".join(model.__table__.columns.keys())
+    built_count = conn.execute(f"SELECT count(*) FROM {staging_name}").fetchone()[0]
+    existing_count = conn.execute(
+        f"SELECT count(*) FROM {staging_name} b SEMI JOIN {table_name} f USING (id)").fetchone()[0]
+    preview = pl.from_arrow(conn.execute(
+        f"SELECT {column_list} FROM {staging_name} b ANTI JOIN {table_name} f USING (id) "
+        f"ORDER BY b.id LIMIT {int(preview_rows)}").arrow())
+
+    conn.execute(f"DROP TABLE IF EXISTS {previous_name}")
+    conn.execute(f"ALTER TABLE {table_name} RENAME TO {previous_name}")
+    conn.execute(f"ALTER TABLE {staging_name} RENAME TO {table_name}")
+    logger.info(f"Swapped in {built_count} {table_name} rows, the replaced version is kept as {previous_name}")
+    return {
+        'new_count': built_count - existing_count,
+        'existing_count': existing_count,
+        'built_count': built_count,
+        'preview': preview,
+    }
+
+
+def rebuild_table_from_frame(db, model, df: pl.DataFrame, preview_rows: int = 5) -> dict:
+    # Replaces the model's table with the rows of a frame, staged and swapped in, committed
+    start = time.perf_counter()
+    conn = get_raw_connection(db)
+    columns = [col for col in model.__table__.columns.keys() if col in df.columns]
+    try:
+        staging_name = create_staging_table(db, model)
+        conn.register('rebuild_frame', df.select(columns).to_arrow())
+        try:
+            conn.execute(f"INSERT INTO {staging_name} ({', '.join(columns)}) "
+                         f"SELECT {', '.join(columns)} FROM rebuild_frame")
+        finally:
+            conn.unregister('rebuild_frame')
+        result = publish_staging_table(db, model, preview_rows)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    result['rows_read'] = len(df)
+    result['build_seconds'] = round(time.perf_counter() - start, 4)
+    return result
+
+
+def rollback_table(db, model) -> dict:
+    # Swaps the previous version of a rebuilt table back in. The version it replaces becomes
+    # the previous one, so a rollback is undone by rolling back again. The fact table's
+    # watermarks are cleared: the next incremental build folds every source row in again.
+    table_name = model.__tablename__
+    previous_name = f"{table_name}{PREVIOUS_SUFFIX}"
+    swap_name = f"{table_name}_swap"
+    conn = get_raw_connection(db)
+    try:
+        if not conn.execute("SELECT count(*) FROM duckdb_tables() WHERE table_name = ?",
+                            [previous_name]).fetchone()[0]:
+            raise ValueError(f"{table_name} has no previous version to roll back to")
+        conn.execute(f"ALTER TABLE {table_name} RENAME TO {swap_name}")
+        conn.execute(f"ALTER TABLE {previous_name} RENAME TO {table_name}")
+        conn.execute(f"ALTER TABLE {swap_name} RENAME TO {previous_name}")
+        conn.execute("DELETE FROM etl_watermarks WHERE table_name = ?", [table_name])
+        rows = conn.execute(f"SELECT count(*) FROM {table_name}").fetchone()[0]
+        previous_rows = conn.execute(f"SELECT count(*) FROM {previous_name}").fetchone()[0]
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    logger.info(f"Rolled {table_name} back to its previous version, {rows} rows")
+    return {'table': table_name, 'rows': rows, 'previous_rows': previous_rows}
+
+
+def build_fact_table_sql(db, preview_rows: int = 5) -> dict:
+    # Builds the fact table entirely inside DuckDB: the join runs with one INSERT ... SELECT
+    # into the staging table, which is then swapped in (see publish_staging_table). Only the
+    # counts and the preview rows ever reach Python.
+    start = time.perf_counter()
+    conn = get_raw_connection(db)
+    try:
+        high_watermarks = current_load_seqs(conn)
+        staging_name = create_staging_table(db, FactTable)
+        conn.execute(f"INSERT INTO {staging_name} (id, {', '.join(FACT_TABLE_COLUMNS)}) {fact_table_select_sql()}")
+        result = publish_staging_table(db, FactTable, preview_rows)
+        set_watermarks(conn, 'fact_table', high_watermarks)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"Built {result['built_count']} fact rows in DuckDB, {result['new_count']} new, in {elapsed:.3f}s")
+    return {
+        **result,
+        'build_seconds': round(elapsed, 4),
+        'watermarks': high_watermarks,
+    }
+
+
+#the source tables of the fact build in the order processing.process_fact_table takes them
+FACT_TABLE_MODELS = [Orders, Order_Items, Customers, Order_Payments, Products, Sellers, Product_Category]
+
+
+def read_fact_table_sources(db, workers: int = None):
+    # Reads the source tables of the in-python build at the same time on a thread pool, each
+    # on a DuckDB cursor of its own. DuckDB releases the GIL while it scans and the Arrow
+    # results are wrapped by polars without a copy, so the reads take about the time of the
+    # largest table. Only the surrogate keys are read, not the hex ids. Returns the frames
+    # in FACT_TABLE_MODELS order and how long each fetch took by table name. The cursors
+    # run their own transactions, they do not see what the session has not committed.
+    start = time.perf_counter()
+    workers = workers or min(len(FACT_TABLE_MODELS), os.cpu_count() or 1)
+    conn = get_raw_connection(db)
+    cursors = [conn.duplicate() for _ in FACT_TABLE_MODELS]
+
+    def timed_read(model, cursor):
+        table_start = time.perf_counter()
+        df = read_table(db, model, columns=encoded_columns(model), conn=cursor)
+        return df, round(time.perf_counter() - table_start, 4)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(timed_read, model, cursor)
+                       for model, cursor in zip(FACT_TABLE_MODELS, cursors)]
+        results = [future.result() for future in futures]
+    finally:
+        for cursor in cursors:
+            cursor.close()
+
+    fetch_seconds = {model.__tablename__: seconds for model, (_, seconds) in zip(FACT_TABLE_MODELS, results)}
+    logger.info(f"Read {len(results)} fact table sources in {time.perf_counter() - start:.3f}s with "
+                f"{workers} workers, the slowest fetch took {max(fetch_seconds.values()):.3f}s")
+    return [df for df, _ in results], fetch_seconds
+
+
+#the source tables of the streaming build in the order processing.process_fact_table_lazy
+#takes them, order_payments has no column in a fact row and is left out
+STREAMING_SOURCE_MODELS = [Orders, Order_Items, Customers, Products, Sellers, Product_Category]
+
+
+def streaming_source_columns(model) -> list:
+    # the columns of a source table the streaming build reads: the ones a fact row is built
+    # from, which include every join key, and the id its rows are ordered by. The rest of a
+    # table (e.g. the product dimensions) is never exported
+    return [col for col in encoded_columns(model) if col in FACT_TABLE_COLUMNS or col == 'id']
+
+
+def export_fact_table_sources(conn, directory: str) -> list:
+    # Writes the columns of every source table the streaming build joins to a Parquet file
+    # of its own with DuckDB's COPY, which streams the table out without loading it, and
+    # returns the files' lazy scans. Only the surrogate keys are written, not the hex ids
+    # they stand for.
+    scans = []
+    for model in STREAMING_SOURCE_MODELS:
+        file_path = os.path.join(directory, f"{model.__tablename__}.parquet")
+        conn.execute(f"COPY (SELECT {', '.join(streaming_source_columns(model))} FROM {model.__tablename__}) "
+                     f"TO '{file_path}' (FORMAT PARQUET)")
+        scans.append(scan_table(file_path))
+    return scans
+
+
+def build_fact_table_streaming(db, work_dir: str = None, preview_rows: int = 5) -> dict:
+    # Builds the fact table with polars' streaming engine, for sources and a fact table larger
+    # than memory: the tables are exported to Parquet (see export_fact_table_sources), joined
+    # lazily by processing.sink_fact_table straight into a Parquet file of fact rows, and
+    # DuckDB numbers the rows of that file like build_fact_table_sql into the staging table.
+    # The files live in a temporary directory under work_dir while the build runs.
+    start = time.perf_counter()
+    conn = get_raw_connection(db)
+    with tempfile.TemporaryDirectory(dir=work_dir) as directory:
+        try:
+            high_watermarks = current_load_seqs(conn)
+            scans = export_fact_table_sources(conn, directory)
+            export_seconds = time.perf_counter() - start
+            fact_path = sink_fact_table(scans, os.path.join(directory, 'fact_table.parquet'),
+                                        columns=FACT_TABLE_COLUMNS)
+            fact_rows = f"read_parquet('{fact_path}')"
+            staging_name = create_staging_table(db, FactTable)
+            conn.execute(f"INSERT INTO {staging_name} (id, {', '.join(FACT_TABLE_COLUMNS)}) "
+                         f"{numbered_fact_rows_sql(fact_rows)}")
+            result = publish_staging_table(db, FactTable, preview_rows)
+            set_watermarks(conn, 'fact_table', high_watermarks)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"Built {result['built_count']} fact rows with the streaming engine, {result['new_count']} new, "
+                f"in {elapsed:.3f}s ({export_seconds:.3f}s exporting the sources)")
+    return {
+        **result,
+        'build_seconds': round(elapsed, 4),
+        'watermarks': high_watermarks,
+    }
+
+
+#the sources whose load_seq drives the incremental fact build, every table of
+#FACT_TABLE_JOINS by its alias. A load stamps the rows it writes or changes with the table's
+#next load_seq (see src/ingest.py), so an upserted row is found again although its id is kept
+FACT_TABLE_WATERMARK_SOURCES = {'orders': 'o', 'order_items': 'oi', 'customers': 'c',
+                                'products': 'p', 'sellers': 's', 'product_category': 'pc'}
+
+
+def current_load_seqs(conn) -> dict:
+    return {source: conn.execute(f"SELECT coalesce(max(load_seq), 0) FROM {source}").fetchone()[0]
+            for source in FACT_TABLE_WATERMARK_SOURCES}
+
+
+def get_watermarks(conn, table_name: str) -> dict:
+    rows = conn.execute(
+        "SELECT source_table, high_watermark FROM etl_watermarks WHERE table_name = ?",
+        [table_name]).fetchall()
+    watermarks = {source: 0 for source in FACT_TABLE_WATERMARK_SOURCES}
+    watermarks.update({source: high_watermark for source, high_watermark in rows})
+    return watermarks
+
+
+def set_watermarks(conn, table_name: str, watermarks: dict):
+    for source_table, high_watermark in watermarks.items():
+        updated = conn.execute(
+            "UPDATE etl_watermarks SET high_watermark = ?, updated_at = now() "
+            "WHERE table_name = ? AND source_table = ?",
+            [high_watermark, table_name, source_table]).fetchone()[0]
+        if updated == 0:
+            conn.execute(
+                "INSERT INTO etl_watermarks (id, table_name, source_table, high_watermark, updated_at) "
+                "VALUES (nextval('id'), ?, ?, ?, now())",
+                [table_name, source_table, high_watermark])
+
+
+def build_fact_table_incremental(db, preview_rows: int = 5) -> dict:
+    # Folds only the fact rows built from a source row written since the last build into
+    # fact_table: the rows of the join where any of the six tables has a load_seq above its
+    # watermark, whether the row is new or an upsert changed it. A changed customer or product
+    # brings in every order item it joins to, and so does a dimension row that arrives after
+    # the order items it completes. The delta is joined inside DuckDB and upserted on the
+    # natural key (order_key, order_item_id): keys already in fact_table are updated in place,
+    # new keys are appended with ids after the current maximum, so ids stay stable between
+    # runs. Nothing is deleted: a fact row whose source rows no longer join (e.g. an order
+    # upserted with an unknown customer) keeps its last values until the next full build.
+    start = time.perf_counter()
+    conn = get_raw_connection(db)
+    column_list = ", ".join(FACT_TABLE_COLUMNS)
+    key_match = " AND ".join(f"f.{col} = d.{col}" for col in FACT_TABLE_KEY)
+    try:
+        watermarks = get_watermarks(conn, 'fact_table')
+        high_watermarks = current_load_seqs(conn)
+        written = " OR ".join(f"({alias}.load_seq > ? AND {alias}.load_seq <= ?)"
+                              for alias in FACT_TABLE_WATERMARK_SOURCES.values())
+        conn.execute(
+            f"CREATE OR REPLACE TEMP TABLE fact_table_delta AS "
+            f"SELECT {column_list} FROM {fact_rows_sql(f'WHERE {written}')} {LATEST_FACT_ROW}",
+            [bound for source in FACT_TABLE_WATERMARK_SOURCES
+             for bound in (watermarks[source], high_watermarks[source])])
+        delta_count = conn.execute("SELECT count(*) FROM fact_table_delta").fetchone()[0]
+
+        updated_count = conn.execute(
+            "UPDATE fact_table f SET "
+            + ", ".join(f"{col} = d.{col}" for col in FACT_TABLE_COLUMNS if col not in FACT_TABLE_KEY)
+            + f" FROM fact_table_delta d WHERE {key_match}"
+        ).fetchone()[0]
+        conn.execute(
+            "CREATE OR REPLACE TEMP TABLE fact_table_new AS "
+            "SELECT (SELECT coalesce(max(id), 0) FROM fact_table) "
+            "+ row_number() OVER (ORDER BY d.order_key, d.order_item_id) AS id, d.* "
+            f"FROM fact_table_delta d WHERE NOT EXISTS (SELECT 1 FROM fact_table f WHERE {key_match})")
+        new_count = conn.execute(
+            f"INSERT INTO fact_table (id, {column_list}) SELECT id, {column_list} FROM fact_table_new"
+        ).fetchone()[0]
+        preview = pl.from_arrow(conn.execute(
+            f"SELECT id, {column_list} FROM fact_table_new ORDER BY id LIMIT {int(preview_rows)}"
+        ).arrow())
+        conn.execute("DROP TABLE fact_table_delta")
+        conn.execute("DROP TABLE fact_table_new")
+        set_watermarks(conn, 'fact_table', high_watermarks)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"Incremental fact build: {delta_count} delta rows since {watermarks}, "
+                f"{new_count} new, {updated_count} updated, in {elapsed:.3f}s")
+    return {
+        'new_count': new_count,
+        'existing_count': updated_count,
+        'updated_count': updated_count,
+        'delta_count': delta_count,
+        'preview': preview,
+        'build_seconds': round(elapsed, 4),
+        'watermarks': high_watermarks,
+    }
+
+
+def build_top_sellers(db, preview_rows: int = 5):
+    # ranks the sellers of the fact table by total sales and swaps in the top ten,
+    # None when there is no fact table to rank yet. Only the columns the ranking
+    # needs are read from the fact table, sellers are grouped on their surrogate key.
+    fact_table = read_table(db, FactTable, columns=['seller_key', 'price'])
+    if fact_table.is_empty():
+        return None
+
+    top_sellers_df = get_top_sellers(fact_table)
+    if not isinstance(top_sellers_df, pl.DataFrame):
+        raise ValueError('transformed_data didnt yield a valid polars dataframe')
+
+    top_sellers_df = top_sellers_df.rename({'Total_sales': 'total_sales'})
+    return rebuild_table_from_frame(db, Top_Sellers, top_sellers_df, preview_rows=preview_rows)
@@ -0,0 +1,69 @@
+import sys
+import os
+import time
+import tempfile
+import unittest
+from unittest.mock import patch
+import polars as pl
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Adding the project root directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database import Base, get_raw_connection
+from src.ingest import LOAD_MODES, _ingest_summary
+from src.keys import assign_keys
+
+
+#what validation.validate_file reports for an upload with nothing wrong with it
+VALID_UPLOAD = {'valid': True, 'errors': [], 'warnings': [], 'missing_columns': [], 'columns': {}}
+
+
+def patch_upload_checks(test_case, validate: bool = True, **return_values):
+    # Stubs the checks the api loads run before writing, for the length of the test: no
+    # upload has been loaded before, so nothing is skipped by the ingest manifest, and with
+    # validate every upload passes validation. Other src.api functions to stub are given as
+    # name=return value.
+    stubs = {'find_ingest': None, 'record_ingest': None}
+    if validate:
+        stubs['validate_file'] = VALID_UPLOAD
+    stubs.update(return_values)
+    for name, value in stubs.items():
+        patcher = patch(f'src.api.{name}', return_value=value)
+        test_case.addCleanup(patcher.stop)
+        patcher.start()
+
+
+class DuckDBTestCase(unittest.TestCase):
+    # a throwaway DuckDB file per test with every table of the models: the bulk loads, the
+    # builds and read_table run as real SQL on the DuckDB connection, so a mock will not do.
+    # Subclasses that add to setUp or tearDown call super() around their own steps.
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.engine = create_engine(f"duckdb:///{os.path.join(self.tmp_dir.name, 'test.duckdb')}")
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+        self.tmp_dir.cleanup()
+
+
+def bulk_insert_df(db, model, df: pl.DataFrame, preview_rows: int = 5, mode: str = 'append') -> dict:
+    # Writes one frame with the ids it already has and commits, the way the tests set up
+    # tables. The api loads go through src.ingest.ingest_batches, which numbers the ids.
+    write_rows = LOAD_MODES[mode]
+    start = time.perf_counter()
+    conn = get_raw_connection(db)
+    try:
+        new_count, existing_count, preview = write_rows(conn, model, assign_keys(conn, model, df),
+                                                        preview_rows)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    return _ingest_summary(model.__tablename__, len(df), new_count, existing_count, preview, start)
@@ -9,38 +9,50 @@ import unittest
 from unittest.mock import patch, MagicMock
 from io import BytesIO
 import json
-from src.api import (app, get_db, Sellers,
+import gzip
+import zipfile
+from werkzeug.test import EnvironBuilder
+import polars as pl
+import pyarrow as pa
+import pyarrow.parquet as pq
+from src.ingest import InvalidUploadError
+from src.jobs import NoJobProgress
+from src.keys import api_columns
+from src.api import (app, get_db, get_raw_connection, invalidate_counts, Sellers, Top_Sellers, FactTable,
                      Customers,
                      Orders,
                         Order_Items,
                         Order_Payments
                      )
+from tests import DuckDBTestCase, patch_upload_checks
+
+#what warehouse.check_integrity reports for tables where every foreign key resolves
+INTEGRITY_REPORT = {'relationships': {}, 'orphan_rows': 0, 'order_items_dropped': 0, 'check_seconds': 0.01}
 
 class TestLoadSellers(unittest.TestCase):
 
     def setUp(self):
         self.app = app.test_client()
         self.app.testing = True
+        patch_upload_checks(self)
 
     @patch('src.api.get_db')
-    @patch('src.api.load_data')
-    @patch('src.api.transform__df')
-    @patch('src.api.df_to_list_of_dicts')
-    def test_with_sample_data(self, mock_df_to_list_of_dicts, mock_transform__df, mock_load_data, mock_get_db):
+    @patch('src.api.load_data_batched')
+    @patch('src.api.ingest_batches')
+    def test_with_sample_data(self, mock_ingest_batches, mock_load_data_batched, mock_get_db):
         #mocking the database funvtions
         mock_session = MagicMock()
         mock_get_db.return_value.__enter__.return_value = mock_session
 
-        # Mocking database query results
-        mock_session.query.return_value.filter.return_value.all.return_value = []
-        
         #Mocking the functions that are called in the api
-        mock_load_data.return_value = mock_session
-        mock_transform__df.return_value = mock_session
-        mock_df_to_list_of_dicts.return_value = [
+        records = [
             {'id': '1', 'seller_id': 'seller1', 'seller_zip_code_prefix': '12345', 'seller_city': 'City1', 'seller_state': 'State1'},
             {'id': '2', 'seller_id': 'seller2', 'seller_zip_code_prefix': '67890', 'seller_city': 'City2', 'seller_state': 'State2'}
         ]
+        mock_load_data_batched.return_value = iter([pl.DataFrame(records).drop('id')])
+        mock_ingest_batches.return_value = {'new_count': 2, 'existing_count': 0, 'rows_read': 2,
+                                              'preview': pl.DataFrame(records),
+                                              'ingest_seconds': 0.01, 'rows_per_second': 200.0}
 
         mock_file = (BytesIO(b'mock,file,content'), 'sellers.csv')
 
@@ -56,6 +68,86 @@ class TestLoadSellers(unittest.TestCase):
         self.assertEqual(data['new_sellers_count'], 2)
         self.assertEqual(data['existing_sellers_count'], 0)
 
+    @patch('src.api.get_db')
+    @patch('src.api.load_data_batched')
+    @patch('src.api.ingest_batches')
+    def test_parquet_upload(self, mock_ingest_batches, mock_load_data_batched, mock_get_db):
+        "Test that a Parquet upload is accepted and read with the sellers schema"
+        mock_get_db.return_value.__enter__.return_value = MagicMock()
+        mock_ingest_batches.return_value = {'new_count': 1, 'existing_count': 0, 'rows_read': 1,
+                                            'preview': pl.DataFrame({'id': [1]}),
+                                            'ingest_seconds': 0.01, 'rows_per_second': 100.0}
+
+        response = self.app.post('/api/load_sellers_data', content_type='multipart/form-data',
+                                 data={'file': (BytesIO(b'PAR1'), 'sellers.parquet')})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(mock_load_data_batched.call_args[0][0].endswith('sellers.parquet'))
+        self.assertIn('seller_id', mock_load_data_batched.call_args[1]['schema'])
+
+    @patch('src.api.get_db')
+    @patch('src.api.ingest_batches')
+    def test_gzip_content_encoding(self, mock_ingest_batches, mock_get_db):
+        "Test that a request body sent with Content-Encoding: gzip is decompressed before it is parsed"
+        mock_get_db.return_value.__enter__.return_value = MagicMock()
+        mock_ingest_batches.return_value = {'new_count': 1, 'existing_count': 0, 'rows_read': 1,
+                                            'preview': pl.DataFrame({'id': [1]}),
+                                            'ingest_seconds': 0.01, 'rows_per_second': 100.0}
+        environ = EnvironBuilder(method='POST', data={'file': (BytesIO(
+            b'seller_id,seller_zip_code_prefix,seller_city,seller_state\nseller1,12345,City1,SP\n'),
+            'sellers.csv')}).get_environ()
+
+        response = self.app.post('/api/load_sellers_data', data=gzip.compress(environ['wsgi.input'].read()),
+                                 content_type=environ['CONTENT_TYPE'], headers={'Content-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, 200)
+        batches = list(mock_ingest_batches.call_args[0][2])
+        self.assertListEqual(batches[0]['seller_id'].to_list(), ['seller1'])
+
+    @patch('src.api.ingest_batches')
+    def test_gzip_content_encoding_too_large(self, mock_ingest_batches):
+        "Test that a gzip body decompressing past MAX_DECOMPRESSED_LENGTH is refused before it is saved"
+        environ = EnvironBuilder(method='POST', data={'file': (BytesIO(
+            b'seller_id,seller_zip_code_prefix,seller_city,seller_state\n' + b'0' * (1 << 20)),
+            'sellers.csv')}).get_environ()
+        body = gzip.compress(environ['wsgi.input'].read())
+
+        with patch.dict(app.config, {'MAX_DECOMPRESSED_LENGTH': 1 << 16}):
+            response = self.app.post('/api/load_sellers_data', data=body,
+                                     content_type=environ['CONTENT_TYPE'], headers={'Content-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, 413)
+        self.assertLess(len(body), 1 << 16)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['status'], 'error')
+        mock_ingest_batches.assert_not_called()
+
+    @patch('src.api.ingest_batches')
+    def test_gzip_content_encoding_invalid(self, mock_ingest_batches):
+        "Test that a body sent as gzip that is not gzip is answered with a 400, not a server error"
+        response = self.app.post('/api/load_sellers_data', data=b'not gzip',
+                                 content_type='multipart/form-data; boundary=x', headers={'Content-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, 400)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['status'], 'error')
+        mock_ingest_batches.assert_not_called()
+
+    @patch('src.api.get_db')
+    @patch('src.api.load_data_batched')
+    @patch('src.api.ingest_batches')
+    def test_compressed_upload(self, mock_ingest_batches, mock_load_data_batched, mock_get_db):
+        "Test that a compressed csv is saved as it was sent and handed to the reader"
+        mock_get_db.return_value.__enter__.return_value = MagicMock()
+        mock_ingest_batches.return_value = {'new_count': 1, 'existing_count': 0, 'rows_read': 1,
+                                            'preview': pl.DataFrame({'id': [1]}),
+                                            'ingest_seconds': 0.01, 'rows_per_second': 100.0}
+        response = self.app.post('/api/load_sellers_data', content_type='multipart/form-data',
+                                 data={'file': (BytesIO(gzip.compress(b'seller_id\nseller1\n')), 'sellers.csv.gz')})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(mock_load_data_batched.call_args[0][0].endswith('sellers.csv.gz'))
+
+    def test_unsupported_format(self):
+        response = self.app.post('/api/load_sellers_data', content_type='multipart/form-data',
+                                 data={'file': (BytesIO(b'a,b'), 'sellers.txt')})
+        self.assertEqual(response.status_code, 400)
+
     def test_api_load_sellers_data_no_file(self):
         response = self.app.post('/api/load_sellers_data')
         self.assertEqual(response.status_code, 200)
@@ -63,11 +155,9 @@ class TestLoadSellers(unittest.TestCase):
         self.assertEqual(data['error'], 'No file part')
 
     @patch('src.api.get_db')
-    @patch('src.api.load_data')
-    @patch('src.api.transform__df')
-    @patch('src.api.df_to_list_of_dicts')
-    def test_with_invalid_data(self, mock_df_to_list_of_dicts, mock_transform__df, mock_load_data, mock_get_db):
-        mock_df_to_list_of_dicts.return_value = [{'invalid_column': 'data'}]
+    @patch('src.api.load_data_batched')
+    def test_with_invalid_data(self, mock_load_data_batched, mock_get_db):
+        mock_load_data_batched.return_value = iter([pl.DataFrame({'invalid_column': ['data']})])
         mock_file = (BytesIO(b'mock,file,content'), 'invalid_sellers.csv')
         response = self.app.post('/api/load_sellers_data',
                                     content_type='multipart/form-data',
@@ -93,7 +183,8 @@ class TestGetSellers(unittest.TestCase):
             Sellers(id=1, seller_id='seller1', seller_zip_code_prefix='12345', seller_city='City1', seller_state='State1'),
             Sellers(id=2, seller_id='seller2', seller_zip_code_prefix='67890', seller_city='City2', seller_state='State2')
         ]
-        mock_session.query.return_value.all.return_value = mock_sellers
+        mock_session.query.return_value.order_by.return_value.limit.return_value.all.return_value = mock_sellers
+        mock_session.query.return_value.scalar.return_value = len(mock_sellers)
 
         response = self.app.get('/api/get_sellers')
         self.assertEqual(response.status_code, 200)
@@ -109,7 +200,8 @@ class TestGetSellers(unittest.TestCase):
         mock_session = MagicMock()
         mock_get_db.return_value.__enter__.return_value = mock_session
 
-        mock_session.query.return_value.all.return_value = []
+        mock_session.query.return_value.order_by.return_value.limit.return_value.all.return_value = []
+        mock_session.query.return_value.scalar.return_value = 0
 
         response = self.app.get('/api/get_sellers')
         self.assertEqual(response.status_code, 200)
@@ -135,26 +227,25 @@ class TestLoadCustomers(unittest.TestCase):
         def setUp(self):
             self.app = app.test_client()
             self.app.testing = True
+            patch_upload_checks(self)
     
         @patch('src.api.get_db')
-        @patch('src.api.load_data')
-        @patch('src.api.transform__df')
-        @patch('src.api.df_to_list_of_dicts')
-        def test_with_sample_data(self, mock_df_to_list_of_dicts, mock_transform__df, mock_load_data, mock_get_db):
+        @patch('src.api.load_data_batched')
+        @patch('src.api.ingest_batches')
+        def test_with_sample_data(self, mock_ingest_batches, mock_load_data_batched, mock_get_db):
             #mocking the database functions
             mock_session = MagicMock()
             mock_get_db.return_value.__enter__.return_value = mock_session
     
-            # Mocking database query results
-            mock_session.query.return_value.filter.return_value.all.return_value = []
-            
             #Mocking the functions that are called in the api
-            mock_load_data.return_value = mock_session
-            mock_transform__df.return_value = mock_session
-            mock_df_to_list_of_dicts.return_value = [
+            records = [
                 {'id': '1', 'customer_id': 'customer1', 'customer_unique_id': 'unique1', 'customer_zip_code_prefix': '12345', 'customer_city': 'City1', 'customer_state': 'State1'},
                 {'id': '2', 'customer_id': 'customer2', 'customer_unique_id': 'unique2', 'customer_zip_code_prefix': '67890', 'customer_city': 'City2', 'customer_state': 'State2'}
             ]  
+            mock_load_data_batched.return_value = iter([pl.DataFrame(records).drop('id')])
+            mock_ingest_batches.return_value = {'new_count': 2, 'existing_count': 0, 'rows_read': 2,
+                                                  'preview': pl.DataFrame(records),
+                                                  'ingest_seconds': 0.01, 'rows_per_second': 200.0}
     
             mock_file = (BytesIO(b'mock,file,content'), 'customers.csv')
     
@@ -177,11 +268,9 @@ class TestLoadCustomers(unittest.TestCase):
             self.assertEqual(data['error'], 'No file part')
     
         @patch('src.api.get_db')
-        @patch('src.api.load_data')
-        @patch('src.api.transform__df')
-        @patch('src.api.df_to_list_of_dicts')
-        def test_with_invalid_data(self, mock_df_to_list_of_dicts, mock_transform__df, mock_load_data, mock_get_db):
-            mock_df_to_list_of_dicts.return_value = [{'invalid_column': 'data'}]
+        @patch('src.api.load_data_batched')
+        def test_with_invalid_data(self, mock_load_data_batched, mock_get_db):
+            mock_load_data_batched.return_value = iter([pl.DataFrame({'invalid_column': ['data']})])
             mock_file = (BytesIO(b'mock,file,content'), 'invalid_customers.csv')
             response = self.app.post('/api/load_customers_data',
                                         content_type='multipart/form-data',
@@ -222,7 +311,8 @@ class TestGetCustomers(unittest.TestCase):
                     Customers(id=1, customer_id='customer1', customer_unique_id='unique1', customer_zip_code_prefix='12345', customer_city='City1', customer_state='State1'),
                     Customers(id=2, customer_id='customer2', customer_unique_id='unique2', customer_zip_code_prefix='67890', customer_city='City2', customer_state='State2')
                 ]
-                mock_session.query.return_value.all.return_value = mock_customers
+                mock_session.query.return_value.order_by.return_value.limit.return_value.all.return_value = mock_customers
+                mock_session.query.return_value.scalar.return_value = len(mock_customers)
         
                 response = self.app.get('/api/get_customers')
                 self.assertEqual(response.status_code, 200)
@@ -238,7 +328,8 @@ class TestGetCustomers(unittest.TestCase):
                 mock_session = MagicMock()
                 mock_get_db.return_value.__enter__.return_value = mock_session
         
-                mock_session.query.return_value.all.return_value = []
+                mock_session.query.return_value.order_by.return_value.limit.return_value.all.return_value = []
+                mock_session.query.return_value.scalar.return_value = 0
         
                 response = self.app.get('/api/get_customers')
                 self.assertEqual(response.status_code, 200)
@@ -264,26 +355,25 @@ class TestLoadOrders(unittest.TestCase):
         def setUp(self):
             self.app = app.test_client()
             self.app.testing = True
+            patch_upload_checks(self)
     
         @patch('src.api.get_db')
-        @patch('src.api.load_data')
-        @patch('src.api.transform__df')
-        @patch('src.api.df_to_list_of_dicts')
-        def test_with_sample_data(self, mock_df_to_list_of_dicts, mock_transform__df, mock_load_data, mock_get_db):
+        @patch('src.api.load_data_batched')
+        @patch('src.api.ingest_batches')
+        def test_with_sample_data(self, mock_ingest_batches, mock_load_data_batched, mock_get_db):
             #mocking the database functions
             mock_session = MagicMock()
             mock_get_db.return_value.__enter__.return_value = mock_session
     
-            # Mocking database query results
-            mock_session.query.return_value.filter.return_value.all.return_value = []
-            
             #Mocking the functions that are called in the api
-            mock_load_data.return_value = mock_session
-            mock_transform__df.return_value = mock_session
-            mock_df_to_list_of_dicts.return_value = [
+            records = [
                 {'id': '1', 'order_id': 'order1', 'customer_id': 'customer1', 'order_status': 'delivered', 'order_purchase_timestamp': '2021-01-01 00:00:00', 'order_approved_at': '2021-01-01 00:00:00', 'order_delivered_carrier_date': '2021-01-01 00:00:00', 'order_delivered_customer_date': '2021-01-01 00:00:00', 'order_estimated_delivery_date': '2021-01-01 00:00:00'},
                 {'id': '2', 'order_id': 'order2', 'customer_id': 'customer2', 'order_status': 'shipped', 'order_purchase_timestamp': '2021-01-01 00:00:00', 'order_approved_at': '2021-01-01 00:00:00', 'order_delivered_carrier_date': '2021-01-01 00:00:00', 'order_delivered_customer_date': '2021-01-01 00:00:00', 'order_estimated_delivery_date': '2021-01-01 00:00:00'}
             ]  
+            mock_load_data_batched.return_value = iter([pl.DataFrame(records).drop('id')])
+            mock_ingest_batches.return_value = {'new_count': 2, 'existing_count': 0, 'rows_read': 2,
+                                                  'preview': pl.DataFrame(records),
+                                                  'ingest_seconds': 0.01, 'rows_per_second': 200.0}
     
             mock_file = (BytesIO(b'mock,file,content'), 'orders.csv')
     
@@ -306,11 +396,9 @@ class TestLoadOrders(unittest.TestCase):
             self.assertEqual(data['error'], 'No file part')
 
         @patch('src.api.get_db')
-        @patch('src.api.load_data')
-        @patch('src.api.transform__df')
-        @patch('src.api.df_to_list_of_dicts')
-        def test_with_invalid_data(self, mock_df_to_list_of_dicts, mock_transform__df, mock_load_data, mock_get_db):
-            mock_df_to_list_of_dicts.return_value = [{'invalid_column': 'data'}]
+        @patch('src.api.load_data_batched')
+        def test_with_invalid_data(self, mock_load_data_batched, mock_get_db):
+            mock_load_data_batched.return_value = iter([pl.DataFrame({'invalid_column': ['data']})])
             mock_file = (BytesIO(b'mock,file,content'), 'invalid_orders.csv')
             response = self.app.post('/api/load_orders_data',
                                         content_type='multipart/form-data',
@@ -351,7 +439,8 @@ class TestGetOrders(unittest.TestCase):
                     Orders(id=1, order_id='order1', customer_id='customer1', order_status='delivered', order_purchase_timestamp='2021-01-01 00:00:00', order_approved_at='2021-01-01 00:00:00', order_delivered_carrier_date='2021-01-01 00:00:00', order_delivered_customer_date='2021-01-01 00:00:00', order_estimated_delivery_date='2021-01-01 00:00:00'),
                     Orders(id=2, order_id='order2', customer_id='customer2', order_status='shipped', order_purchase_timestamp='2021-01-01 00:00:00', order_approved_at='2021-01-01 00:00:00', order_delivered_carrier_date='2021-01-01 00:00:00', order_delivered_customer_date='2021-01-01 00:00:00', order_estimated_delivery_date='2021-01-01 00:00:00')
                 ]
-                mock_session.query.return_value.all.return_value = mock_orders
+                mock_session.query.return_value.order_by.return_value.limit.return_value.all.return_value = mock_orders
+                mock_session.query.return_value.scalar.return_value = len(mock_orders)
         
                 response = self.app.get('/api/get_orders')
                 self.assertEqual(response.status_code, 200)
@@ -367,7 +456,8 @@ class TestGetOrders(unittest.TestCase):
                 mock_session = MagicMock()
                 mock_get_db.return_value.__enter__.return_value = mock_session
         
-                mock_session.query.return_value.all.return_value = []
+                mock_session.query.return_value.order_by.return_value.limit.return_value.all.return_value = []
+                mock_session.query.return_value.scalar.return_value = 0
         
                 response = self.app.get('/api/get_orders')
                 self.assertEqual(response.status_code, 200)
@@ -394,26 +484,25 @@ class TestLoadOrderItems(unittest.TestCase):
             def setUp(self):
                 self.app = app.test_client()
                 self.app.testing = True
+                patch_upload_checks(self)
         
             @patch('src.api.get_db')
-            @patch('src.api.load_data')
-            @patch('src.api.transform__df')
-            @patch('src.api.df_to_list_of_dicts')
-            def test_with_sample_data(self, mock_df_to_list_of_dicts, mock_transform__df, mock_load_data, mock_get_db):
+            @patch('src.api.load_data_batched')
+            @patch('src.api.ingest_batches')
+            def test_with_sample_data(self, mock_ingest_batches, mock_load_data_batched, mock_get_db):
                 #mocking the database functions
                 mock_session = MagicMock()
                 mock_get_db.return_value.__enter__.return_value = mock_session
         
-                # Mocking database query results
-                mock_session.query.return_value.filter.return_value.all.return_value = []
-                
                 #Mocking the functions that are called in the api
-                mock_load_data.return_value = mock_session
-                mock_transform__df.return_value = mock_session
-                mock_df_to_list_of_dicts.return_value = [
+                records = [
                     {'id': '1', 'order_id': 'order1', 'order_item_id': 'item1', 'product_id': 'product1', 'seller_id': 'seller1', 'shipping_limit_date': '2021-01-01 00:00:00', 'price': 100.0, 'freight_value': 10.0},
                     {'id': '2', 'order_id': 'order2', 'order_item_id': 'item2', 'product_id': 'product2', 'seller_id': 'seller2', 'shipping_limit_date': '2021-01-01 00:00:00', 'price': 200.0, 'freight_value': 20.0}
                 ]  
+                mock_load_data_batched.return_value = iter([pl.DataFrame(records).drop('id')])
+                mock_ingest_batches.return_value = {'new_count': 2, 'existing_count': 0, 'rows_read': 2,
+                                                      'preview': pl.DataFrame(records),
+                                                      'ingest_seconds': 0.01, 'rows_per_second': 200.0}
         
                 mock_file = (BytesIO(b'mock,file,content'), 'order_items.csv')
         
@@ -436,11 +525,9 @@ class TestLoadOrderItems(unittest.TestCase):
                 self.assertEqual(data['error'], 'No file part')
 
             @patch('src.api.get_db')
-            @patch('src.api.load_data')
-            @patch('src.api.transform__df')
-            @patch('src.api.df_to_list_of_dicts')
-            def test_with_invalid_data(self, mock_df_to_list_of_dicts, mock_transform__df, mock_load_data, mock_get_db):
-                mock_df_to_list_of_dicts.return_value = [{'invalid_column': 'data'}]
+            @patch('src.api.load_data_batched')
+            def test_with_invalid_data(self, mock_load_data_batched, mock_get_db):
+                mock_load_data_batched.return_value = iter([pl.DataFrame({'invalid_column': ['data']})])
                 mock_file = (BytesIO(b'mock,file,content'), 'invalid_order_items.csv')
                 response = self.app.post('/api/load_order_items_data',
                                             content_type='multipart/form-data',
@@ -524,26 +611,25 @@ class TestLoadOrderPayments(unittest.TestCase):
             def setUp(self):
                 self.app = app.test_client()
                 self.app.testing = True
+                patch_upload_checks(self)
         
             @patch('src.api.get_db')
-            @patch('src.api.load_data')
-            @patch('src.api.transform__df')
-            @patch('src.api.df_to_list_of_dicts')
-            def test_with_sample_data(self, mock_df_to_list_of_dicts, mock_transform__df, mock_load_data, mock_get_db):
+            @patch('src.api.load_data_batched')
+            @patch('src.api.ingest_batches')
+            def test_with_sample_data(self, mock_ingest_batches, mock_load_data_batched, mock_get_db):
                 #mocking the database functions
                 mock_session = MagicMock()
                 mock_get_db.return_value.__enter__.return_value = mock_session
         
-                # Mocking database query results
-                mock_session.query.return_value.filter.return_value.all.return_value = []
-                
                 #Mocking the functions that are called in the api
-                mock_load_data.return_value = mock_session
-                mock_transform__df.return_value = mock_session
-                mock_df_to_list_of_dicts.return_value = [
+                records = [
                     {'id': '1', 'order_id': 'order1', 'payment_sequential': 1, 'payment_type': 'credit_card', 'payment_installments': 1, 'payment_value': 100.0},
                     {'id': '2', 'order_id': 'order2', 'payment_sequential': 2, 'payment_type': 'debit_card', 'payment_installments': 2, 'payment_value': 200.0}
                 ]  
+                mock_load_data_batched.return_value = iter([pl.DataFrame(records).drop('id')])
+                mock_ingest_batches.return_value = {'new_count': 2, 'existing_count': 0, 'rows_read': 2,
+                                                      'preview': pl.DataFrame(records),
+                                                      'ingest_seconds': 0.01, 'rows_per_second': 200.0}
         
                 mock_file = (BytesIO(b'mock,file,content'), 'order_payments.csv')
         
@@ -566,11 +652,9 @@ class TestLoadOrderPayments(unittest.TestCase):
                 self.assertEqual(data['error'], 'No file part')
 
             @patch('src.api.get_db')
-            @patch('src.api.load_data')
-            @patch('src.api.transform__df')
-            @patch('src.api.df_to_list_of_dicts')
-            def test_with_invalid_data(self, mock_df_to_list_of_dicts, mock_transform__df, mock_load_data, mock_get_db):
-                mock_df_to_list_of_dicts.return_value = [{'invalid_column': 'data'}]
+            @patch('src.api.load_data_batched')
+            def test_with_invalid_data(self, mock_load_data_batched, mock_get_db):
+                mock_load_data_batched.return_value = iter([pl.DataFrame({'invalid_column': ['data']})])
                 mock_file = (BytesIO(b'mock,file,content'), 'invalid_order_payments.csv')
                 response = self.app.post('/api/load_order_payments_data',
                                             content_type='multipart/form-data',
@@ -610,7 +694,8 @@ class TestGetOrderPayments(unittest.TestCase):
                                 Order_Payments(id=1, order_id='order1', payment_sequential=1, payment_type='credit_card', payment_installments=1, payment_value=100.0),
                                 Order_Payments(id=2, order_id='order2', payment_sequential=2, payment_type='debit_card', payment_installments=2, payment_value=200.0)
                             ]
-                            mock_session.query.return_value.all.return_value = mock_order_payments
+                            mock_session.query.return_value.order_by.return_value.limit.return_value.all.return_value = mock_order_payments
+                            mock_session.query.return_value.scalar.return_value = len(mock_order_payments)
                     
                             response = self.app.get('/api/get_order_payments')
                             self.assertEqual(response.status_code, 200)
@@ -626,7 +711,8 @@ class TestGetOrderPayments(unittest.TestCase):
                             mock_session = MagicMock()
                             mock_get_db.return_value.__enter__.return_value = mock_session
                     
-                            mock_session.query.return_value.all.return_value = []
+                            mock_session.query.return_value.order_by.return_value.limit.return_value.all.return_value = []
+                            mock_session.query.return_value.scalar.return_value = 0
                     
                             response = self.app.get('/api/get_order_payments')
                             self.assertEqual(response.status_code, 200)
@@ -647,8 +733,580 @@ class TestGetOrderPayments(unittest.TestCase):
                             data = json.loads(response.data.decode('utf-8'))
                             self.assertEqual(data['status'], 'error')   
 
+
+class TestGetTablePage(DuckDBTestCase):
+
+    def setUp(self):
+        # the pagination runs as real SQL, so the get endpoints read a throwaway DuckDB file
+        super().setUp()
+        self.app = app.test_client()
+        self.app.testing = True
+        self.session.add_all([
+            Sellers(id=i, seller_id=f'seller{i}', seller_zip_code_prefix=i,
+                    seller_city=None if i == 4 else ['City1', 'City2'][i % 2], seller_state='SP')
+            for i in range(1, 8)])
+        self.session.commit()
+        invalidate_counts()
+
+        patcher = patch('src.api.get_db')
+        self.addCleanup(patcher.stop)
+        mock_get_db = patcher.start()
+        mock_get_db.return_value.__enter__.return_value = self.session
+
+    def get_ids(self, url):
+        response = self.app.get(url)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        return [row['id'] for row in data['body']], data
+
+    def test_default_limit_and_count(self):
+        "Test that five rows are returned by default and the count covers the whole table"
+        ids, data = self.get_ids('/api/get_sellers')
+        self.assertListEqual(ids, [1, 2, 3, 4, 5])
+        self.assertEqual(data['count_records'], 7)
+        self.assertEqual(data['next_after_id'], 5)
+
+    def test_after_id(self):
+        "Test that following next_after_id pages through the table without repeating rows"
+        ids, data = self.get_ids('/api/get_sellers?limit=3')
+        pages = [ids]
+        while data['next_after_id'] is not None:
+            ids, data = self.get_ids(f"/api/get_sellers?limit=3&after_id={data['next_after_id']}")
+            pages.append(ids)
+        self.assertListEqual(pages, [[1, 2, 3], [4, 5, 6], [7]])
+
+    def test_order_by_column(self):
+        "Test that pages ordered by another column are broken by id and keep nulls last"
+        ids, data = self.get_ids('/api/get_sellers?limit=4&order_by=seller_city')
+        self.assertListEqual(ids, [2, 6, 1, 3])
+        ids, data = self.get_ids('/api/get_sellers?limit=4&order_by=seller_city&after_id=3')
+        self.assertListEqual(ids, [5, 7, 4])
+        ids, data = self.get_ids('/api/get_sellers?limit=3&order_by=-id')
+        self.assertListEqual(ids, [7, 6, 5])
+
+    def test_count_is_cached_until_a_write(self):
+        "Test that the row count is reused between gets and cleared by invalidate_counts"
+        self.get_ids('/api/get_sellers')
+        self.session.add(Sellers(id=8, seller_id='seller8'))
+        self.session.commit()
+        ids, data = self.get_ids('/api/get_sellers')
+        self.assertEqual(data['count_records'], 7)
+
+        invalidate_counts('sellers')
+        ids, data = self.get_ids('/api/get_sellers')
+        self.assertEqual(data['count_records'], 8)
+
+    def test_arrow_response(self):
+        "Test that Accept: application/vnd.apache.arrow.stream returns the page as an Arrow IPC stream"
+        response = self.app.get('/api/get_sellers?limit=3',
+                                headers={'Accept': 'application/vnd.apache.arrow.stream'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/vnd.apache.arrow.stream')
+        table = pa.ipc.open_stream(response.data).read_all()
+        self.assertListEqual(table.column_names, api_columns(Sellers.__table__.columns.keys()))
+        self.assertListEqual(table.column('id').to_pylist(), [1, 2, 3])
+        self.assertEqual(response.headers['X-Count-Records'], '7')
+        self.assertEqual(response.headers['X-Next-After-Id'], '3')
+
+    def test_parquet_response(self):
+        "Test that format=parquet returns the same page as a Parquet file"
+        response = self.app.get('/api/get_sellers?format=parquet&limit=4&order_by=seller_city')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/parquet')
+        table = pq.read_table(BytesIO(response.data))
+        self.assertListEqual(table.column('id').to_pylist(), [2, 6, 1, 3])
+
+    def test_invalid_arguments(self):
+        "Test that bad paging arguments are rejected"
+        for url in ['/api/get_sellers?limit=0', '/api/get_sellers?limit=abc',
+                    '/api/get_sellers?after_id=abc', '/api/get_sellers?order_by=unknown_column',
+                    '/api/get_sellers?format=xml']:
+            response = self.app.get(url)
+            self.assertEqual(response.status_code, 400, url)
+
+    def test_keys_decoded(self):
+        "Test that a table holding surrogate keys is returned with the hex ids, as json and arrow"
+        get_raw_connection(self.session).execute(
+            "INSERT INTO etl_key_dictionary VALUES (1, 'seller_id', 'seller2', 1), (2, 'seller_id', 'seller1', 2)")
+        self.session.add_all([Top_Sellers(id=1, seller_key=2, total_sales=30.0),
+                              Top_Sellers(id=2, seller_key=1, total_sales=20.0)])
+        self.session.commit()
+        ids, data = self.get_ids('/api/get_top_sellers')
+        self.assertListEqual([row['seller_id'] for row in data['body']], ['seller1', 'seller2'])
+        self.assertNotIn('seller_key', data['body'][0])
+
+        response = self.app.get('/api/get_top_sellers?format=arrow')
+        table = pa.ipc.open_stream(response.data).read_all()
+        self.assertListEqual(table.column_names, ['id', 'seller_id', 'total_sales'])
+        self.assertListEqual(table.column('seller_id').to_pylist(), ['seller1', 'seller2'])
+        response = self.app.get('/api/get_sellers?order_by=seller_city&after_id=100')
+        self.assertEqual(response.status_code, 404)
+
+
+
+class TestUploadValidation(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        patch_upload_checks(self, validate=False)
+
+    def post_sellers(self, content):
+        return self.app.post('/api/load_sellers_data', content_type='multipart/form-data',
+                             data={'file': (BytesIO(content), 'sellers.csv')})
+
+    @patch('src.api.get_db')
+    @patch('src.api.ingest_batches')
+    def test_invalid_values_rejected(self, mock_ingest_batches, mock_get_db):
+        "Test that an upload failing validation gets the report back and nothing is written"
+        response = self.post_sellers(b"seller_id,seller_zip_code_prefix,seller_city,seller_state\n"
+                                     b"seller1,12345,City1,SP\nseller2,abc,City2,XX\nseller1,12345,City1,SP\n")
+        self.assertEqual(response.status_code, 400)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertIn('Invalid Sellers file', data['error'])
+        self.assertEqual(data['validation']['columns']['seller_state']['domain_errors'], 1)
+        self.assertEqual(data['validation']['columns']['seller_zip_code_prefix']['type_errors'], 1)
+        self.assertEqual(data['validation']['duplicate_keys'], 1)
+        mock_ingest_batches.assert_not_called()
+
+    @patch('src.api.get_db')
+    @patch('src.api.ingest_batches')
+    def test_wrong_file_rejected(self, mock_ingest_batches, mock_get_db):
+        response = self.post_sellers(b"customer_id,customer_state\ncustomer1,SP\n")
+        self.assertEqual(response.status_code, 400)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['error'], 'Invalid file, Kindly provide the Sellers csv file')
+        self.assertIn('seller_id', data['validation']['missing_columns'])
+        mock_ingest_batches.assert_not_called()
+
+    @patch('src.api.get_db')
+    @patch('src.api.ingest_batches')
+    def test_report_of_a_valid_upload(self, mock_ingest_batches, mock_get_db):
+        mock_get_db.return_value.__enter__.return_value = MagicMock()
+        mock_ingest_batches.return_value = {'new_count': 1, 'existing_count': 0, 'rows_read': 1,
+                                            'preview': pl.DataFrame({'id': [1]}),
+                                            'ingest_seconds': 0.01, 'rows_per_second': 100.0}
+        response = self.post_sellers(b"seller_id,seller_zip_code_prefix,seller_city,seller_state\n"
+                                     b"seller1,12345,City1,SP\n")
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertTrue(data['validation']['valid'])
+        self.assertEqual(data['validation']['rows'], 1)
+
+
+class TestIngestManifestSkip(DuckDBTestCase):
+
+    def setUp(self):
+        # the loads and the manifest run as real SQL on a throwaway DuckDB file
+        super().setUp()
+        self.app = app.test_client()
+        self.app.testing = True
+
+        patcher = patch('src.api.get_db')
+        self.addCleanup(patcher.stop)
+        mock_get_db = patcher.start()
+        mock_get_db.return_value.__enter__.return_value = self.session
+        self.content = (b"seller_id,seller_zip_code_prefix,seller_city,seller_state\n"
+                        b"seller1,12345,City1,SP\nseller2,67890,City2,RJ\n")
+
+    def post(self, content, query=''):
+        response = self.app.post(f'/api/load_sellers_data{query}', content_type='multipart/form-data',
+                                 data={'file': (BytesIO(content), 'sellers.csv')})
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.data.decode('utf-8'))
+
+    def test_identical_upload_is_skipped(self):
+        "Test that the same file sent again gets the first answer back without being parsed"
+        first = self.post(self.content)
+        self.assertEqual(first['new_sellers_count'], 2)
+        self.assertNotIn('skipped', first)
+
+        with patch('src.api.load_data_batched') as mock_load_data_batched:
+            second = self.post(self.content)
+            mock_load_data_batched.assert_not_called()
+        self.assertTrue(second['skipped'])
+        self.assertEqual(second['new_sellers_count'], 2)
+        self.assertListEqual(second['body'], first['body'])
+        self.assertIn('ingested_at', second)
+
+    def test_changed_upload_force_and_mode(self):
+        "Test that other content, another mode or force=true are loaded again"
+        self.post(self.content)
+        self.assertNotIn('skipped', self.post(self.content + b"seller3,13579,City3,MG\n"))
+        self.assertNotIn('skipped', self.post(self.content, '?mode=upsert'))
+        forced = self.post(self.content, '?force=true')
+        self.assertNotIn('skipped', forced)
+        self.assertEqual(forced['existing_sellers_count'], 2)
+
+
+class TestExportTable(DuckDBTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.app = app.test_client()
+        self.app.testing = True
+        self.session.add_all([Sellers(id=i, seller_id=f'seller{i}', seller_state='SP') for i in range(1, 4)])
+        self.session.commit()
+
+        patcher = patch('src.api.get_db')
+        self.addCleanup(patcher.stop)
+        mock_get_db = patcher.start()
+        mock_get_db.return_value.__enter__.return_value = self.session
+
+    def test_export_ndjson(self):
+        "Test that the whole table is streamed as ndjson by default"
+        response = self.app.get('/api/export/sellers')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertIn('sellers.ndjson', response.headers['Content-Disposition'])
+        rows = [json.loads(line) for line in response.data.decode('utf-8').splitlines()]
+        self.assertListEqual([row['seller_id'] for row in rows], ['seller1', 'seller2', 'seller3'])
+
+    def test_export_csv(self):
+        "Test that the csv export starts with the header"
+        response = self.app.get('/api/export/sellers?format=csv')
+        self.assertEqual(response.status_code, 200)
+        lines = response.data.decode('utf-8').splitlines()
+        self.assertEqual(lines[0], 'id,seller_id,seller_zip_code_prefix,seller_city,seller_state')
+        self.assertEqual(len(lines), 4)
+
+    def test_export_arrow(self):
+        "Test that the export follows the Accept header"
+        response = self.app.get('/api/export/sellers', headers={'Accept': 'application/parquet'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/parquet')
+        self.assertEqual(pq.read_table(BytesIO(response.data)).num_rows, 3)
+
+    def test_unknown_table(self):
+        response = self.app.get('/api/export/unknown_table')
+        self.assertEqual(response.status_code, 404)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['status'], 'error')
+
+    def test_unknown_format(self):
+        response = self.app.get('/api/export/sellers?format=xml')
+        self.assertEqual(response.status_code, 400)
+
+
+
+class TestLoadPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+
+    @patch('src.api.get_db')
+    @patch('src.api.load_tables')
+    @patch('src.api.parse_files')
+    def test_field_and_file_names(self, mock_parse_files, mock_load_tables, mock_get_db):
+        "Test that csv files are matched by field name or Olist file name and loaded together"
+        mock_get_db.return_value.__enter__.return_value = MagicMock()
+        mock_parse_files.return_value = ({'sellers': pl.DataFrame(), 'customers': pl.DataFrame()},
+                                         {'sellers': 0.1, 'customers': 0.2})
+        mock_load_tables.return_value = {
+            'sellers': {'new_count': 2, 'existing_count': 0, 'rows_read': 2, 'ingest_seconds': 0.1},
+            'customers': {'new_count': 3, 'existing_count': 1, 'rows_read': 4, 'ingest_seconds': 0.1}}
+
+        data = {'sellers': (BytesIO(b'seller_id\nseller1'), 'my_sellers.csv'),
+                'file': (BytesIO(b'customer_id\ncustomer1'), 'olist_customers_dataset.csv')}
+        response = self.app.post('/api/load_pipeline', data=data, content_type='multipart/form-data')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertSetEqual(set(mock_parse_files.call_args[0][0]), {'sellers', 'customers'})
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['tables']['customers']['existing_count'], 1)
+        self.assertNotIn('fact_table', data)
+
+    def test_unknown_file(self):
+        data = {'file': (BytesIO(b'a,b\n1,2'), 'something_else.csv')}
+        response = self.app.post('/api/load_pipeline', data=data, content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 400)
+
+    def test_no_files(self):
+        response = self.app.post('/api/load_pipeline')
+        self.assertEqual(response.status_code, 400)
+
+    @patch('src.api.parse_files')
+    def test_zip_too_large(self, mock_parse_files):
+        "Test that a zip whose Olist files decompress past MAX_DECOMPRESSED_LENGTH is refused with a 413"
+        archive_bytes = BytesIO()
+        with zipfile.ZipFile(archive_bytes, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('olist_sellers_dataset.csv',
+                             b'seller_id,seller_zip_code_prefix,seller_city,seller_state\n' + b'0' * (4 << 20))
+        archive_bytes.seek(0)
+
+        with patch.dict(app.config, {'MAX_DECOMPRESSED_LENGTH': 1 << 20}):
+            response = self.app.post('/api/load_pipeline', data={'file': (archive_bytes, 'olist.zip')},
+                                     content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 413)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertIn('olist.zip', data['error'])
+        mock_parse_files.assert_not_called()
+
+    @patch('src.api.parse_files')
+    def test_invalid_upload(self, mock_parse_files):
+        mock_parse_files.side_effect = InvalidUploadError('Sellers: Columns not in the dataframe: seller_id')
+        data = {'sellers': (BytesIO(b'a,b\n1,2'), 'sellers.csv')}
+        response = self.app.post('/api/load_pipeline', data=data, content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 400)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertIn('Sellers', data['error'])
+
+
+class TestProcessFactTable(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        patcher = patch('src.api.check_integrity', return_value=INTEGRITY_REPORT)
+        self.addCleanup(patcher.stop)
+        self.mock_check_integrity = patcher.start()
+
+    @patch('src.api.get_db')
+    @patch('src.api.empty_dimension_tables')
+    @patch('src.api.build_fact_table_sql')
+    def test_sql_engine(self, mock_build_fact_table_sql, mock_empty_dimension_tables, mock_get_db):
+        mock_get_db.return_value.__enter__.return_value = MagicMock()
+        mock_empty_dimension_tables.return_value = []
+        mock_build_fact_table_sql.return_value = {'new_count': 2, 'existing_count': 1, 'built_count': 3,
+                                                  'preview': pl.DataFrame({'id': [2, 3], 'order_id': ['o2', 'o3']}),
+                                                  'build_seconds': 0.01,
+                                                  'watermarks': {'orders': 3, 'order_items': 3}}
+
+        response = self.app.post('/api/process_fact_table')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['status'], 'success')
+        self.assertEqual(data['engine'], 'sql')
+        self.assertEqual(len(data['body']), 2)
+        self.assertEqual(data['new_fact_table_count'], 2)
+        self.assertEqual(data['existing_fact_table_count'], 1)
+        self.assertEqual(data['integrity']['order_items_dropped'], 0)
+        self.mock_check_integrity.assert_called_once()
+
+    @patch('src.api.get_db')
+    @patch('src.api.empty_dimension_tables')
+    def test_empty_tables(self, mock_empty_dimension_tables, mock_get_db):
+        mock_get_db.return_value.__enter__.return_value = MagicMock()
+        mock_empty_dimension_tables.return_value = ['orders']
+
+        response = self.app.post('/api/process_fact_table')
+        self.assertEqual(response.status_code, 404)
+
+    @patch('src.api.get_db')
+    @patch('src.api.empty_dimension_tables')
+    @patch('src.api.build_fact_table_incremental')
+    def test_incremental_mode(self, mock_build_fact_table_incremental, mock_empty_dimension_tables, mock_get_db):
+        mock_get_db.return_value.__enter__.return_value = MagicMock()
+        mock_empty_dimension_tables.return_value = []
+        mock_build_fact_table_incremental.return_value = {'new_count': 1, 'existing_count': 1, 'updated_count': 1,
+                                                          'delta_count': 2, 'preview': pl.DataFrame({'id': [4]}),
+                                                          'build_seconds': 0.01,
+                                                          'watermarks': {'orders': 4, 'order_items': 5}}
+
+        response = self.app.post('/api/process_fact_table?mode=incremental')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['mode'], 'incremental')
+        self.assertEqual(data['new_fact_table_count'], 1)
+        self.assertEqual(data['updated_fact_table_count'], 1)
+        self.assertEqual(data['watermarks']['orders'], 4)
+
+    @patch('src.api.get_db')
+    @patch('src.api.empty_dimension_tables')
+    @patch('src.api.build_fact_table_streaming')
+    def test_streaming_engine(self, mock_build_fact_table_streaming, mock_empty_dimension_tables, mock_get_db):
+        mock_get_db.return_value.__enter__.return_value = MagicMock()
+        mock_empty_dimension_tables.return_value = []
+        mock_build_fact_table_streaming.return_value = {'new_count': 3, 'existing_count': 0, 'built_count': 3,
+                                                        'preview': pl.DataFrame({'id': [1, 2, 3]}),
+                                                        'build_seconds': 0.01,
+                                                        'watermarks': {'orders': 3, 'order_items': 3}}
+
+        response = self.app.post('/api/process_fact_table?engine=streaming')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['engine'], 'streaming')
+        self.assertEqual(data['new_fact_table_count'], 3)
+        mock_build_fact_table_streaming.assert_called_once()
+
+    @patch('src.api.get_db')
+    @patch('src.api.check_integrity')
+    @patch('src.api.read_fact_table_sources')
+    def test_polars_engine_empty_tables(self, mock_read_fact_table_sources, mock_check_integrity, mock_get_db):
+        "The polars engine should read its tables with the configured workers and stop on an empty one"
+        mock_get_db.return_value.__enter__.return_value = MagicMock()
+        mock_check_integrity.return_value = {}
+        mock_read_fact_table_sources.return_value = ([pl.DataFrame({'id': [1]}), pl.DataFrame()],
+                                                     {'orders': 0.01, 'order_items': 0.0})
+
+        with patch.dict(app.config, {'READ_WORKERS': 2}):
+            response = self.app.post('/api/process_fact_table?engine=polars')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(mock_read_fact_table_sources.call_args.kwargs['workers'], 2)
+
+    def test_incremental_requires_sql_engine(self):
+        response = self.app.post('/api/process_fact_table?mode=incremental&engine=polars')
+        self.assertEqual(response.status_code, 400)
+
+    def test_unknown_engine(self):
+        response = self.app.post('/api/process_fact_table?engine=spark')
+        self.assertEqual(response.status_code, 400)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['status'], 'error')
+
+
+class TestCheckIntegrity(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+
+    @patch('src.api.get_db')
+    @patch('src.api.check_integrity')
+    def test_report(self, mock_check_integrity, mock_get_db):
+        mock_get_db.return_value.__enter__.return_value = MagicMock()
+        mock_check_integrity.return_value = {
+            'relationships': {'order_items.seller_id': {
+                'references': 'sellers.seller_id', 'rows': 4, 'orphan_rows': 1, 'null_keys': 0,
+                'orphan_keys': 1, 'sample_keys': ['s9']}},
+            'orphan_rows': 1, 'order_items_dropped': 1, 'check_seconds': 0.01}
+
+        response = self.app.get('/api/check_integrity?samples=3')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['status'], 'success')
+        self.assertListEqual(data['relationships']['order_items.seller_id']['sample_keys'], ['s9'])
+        self.assertEqual(mock_check_integrity.call_args[1]['sample_size'], 3)
+
+    def test_invalid_samples(self):
+        response = self.app.get('/api/check_integrity?samples=many')
+        self.assertEqual(response.status_code, 400)
+
+
+class TestRollbackTable(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+
+    @patch('src.api.get_db')
+    @patch('src.api.rollback_table')
+    def test_rollback(self, mock_rollback_table, mock_get_db):
+        mock_get_db.return_value.__enter__.return_value = MagicMock()
+        mock_rollback_table.return_value = {'table': 'fact_table', 'rows': 3, 'previous_rows': 2}
+
+        response = self.app.post('/api/rollback/fact_table')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['status'], 'success')
+        self.assertEqual(data['rows'], 3)
+        self.assertIs(mock_rollback_table.call_args[0][1], FactTable)
+
+    @patch('src.api.get_db')
+    @patch('src.api.rollback_table')
+    def test_no_previous_version(self, mock_rollback_table, mock_get_db):
+        mock_get_db.return_value.__enter__.return_value = MagicMock()
+        mock_rollback_table.side_effect = ValueError('top_sellers has no previous version to roll back to')
+
+        response = self.app.post('/api/rollback/top_sellers')
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('no previous version', json.loads(response.data.decode('utf-8'))['error'])
+
+    def test_table_not_rebuilt(self):
+        "Only the tables that are rebuilt whole can be rolled back"
+        response = self.app.post('/api/rollback/orders')
+        self.assertEqual(response.status_code, 404)
+
+
+class TestBackgroundJobs(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        patch_upload_checks(self, check_integrity=INTEGRITY_REPORT)
+        #a queue that runs the work straight away and keeps what it returned
+        self.submitted = []
+
+        def submit(job_type, job_key, work):
+            self.submitted.append((job_type, job_key, work(NoJobProgress())))
+            return 7, False
+
+        patcher = patch('src.api.job_queue')
+        self.addCleanup(patcher.stop)
+        self.mock_job_queue = patcher.start()
+        self.mock_job_queue.submit.side_effect = submit
+
+    @patch('src.api.get_db')
+    @patch('src.api.empty_dimension_tables')
+    @patch('src.api.build_fact_table_sql')
+    def test_async_process_fact_table(self, mock_build_fact_table_sql, mock_empty_dimension_tables, mock_get_db):
+        "Test that async=true answers 202 with the job id and the job stores the usual response"
+        mock_get_db.return_value.__enter__.return_value = MagicMock()
+        mock_empty_dimension_tables.return_value = []
+        mock_build_fact_table_sql.return_value = {'new_count': 2, 'existing_count': 1, 'built_count': 3,
+                                                  'preview': pl.DataFrame({'id': [2, 3]}),
+                                                  'build_seconds': 0.01,
+                                                  'watermarks': {'orders': 3, 'order_items': 3}}
+
+        response = self.app.post('/api/process_fact_table?async=true')
+        self.assertEqual(response.status_code, 202)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['status'], 'accepted')
+        self.assertEqual(data['job_id'], 7)
+        self.assertEqual(data['status_url'], '/api/jobs/7')
+
+        job_type, job_key, (result, status_code) = self.submitted[0]
+        self.assertEqual(job_type, 'process_fact_table')
+        self.assertEqual(job_key, 'process_fact_table:sql:full')
+        self.assertEqual(status_code, 200)
+        self.assertEqual(result['new_fact_table_count'], 2)
+
+    @patch('src.api.get_db')
+    @patch('src.api.load_data_batched')
+    @patch('src.api.ingest_batches')
+    def test_async_upload_key(self, mock_ingest_batches, mock_load_data_batched, mock_get_db):
+        "Test that uploads of the same content share a job key and the saved copy is removed"
+        mock_get_db.return_value.__enter__.return_value = MagicMock()
+        mock_ingest_batches.return_value = {'new_count': 1, 'existing_count': 0, 'rows_read': 1,
+                                            'preview': pl.DataFrame({'id': [1]}),
+                                            'ingest_seconds': 0.01, 'rows_per_second': 100.0}
+
+        for filename in ('sellers.csv', 'sellers_copy.csv'):
+            response = self.app.post('/api/load_sellers_data?async=true', content_type='multipart/form-data',
+                                     data={'file': (BytesIO(b'seller_id\nseller1'), filename)})
+            self.assertEqual(response.status_code, 202)
+
+        self.assertEqual(self.submitted[0][1], self.submitted[1][1])
+        self.assertTrue(self.submitted[0][1].startswith('load_sellers:append:'))
+        saved_path = mock_load_data_batched.call_args[0][0]
+        self.assertFalse(os.path.exists(saved_path))
+
+    def test_invalid_request_is_not_queued(self):
+        "Test that a request rejected by its checks answers at once and queues nothing"
+        response = self.app.post('/api/process_fact_table?async=true&engine=spark')
+        self.assertEqual(response.status_code, 400)
+        self.mock_job_queue.submit.assert_not_called()
+
+    @patch('src.api.get_job')
+    def test_get_job(self, mock_get_job):
+        mock_get_job.return_value = {'job_id': 7, 'state': 'running', 'rows_processed': 100000,
+                                     'stages': {'parse': 1.5}, 'result': None}
+        response = self.app.get('/api/jobs/7')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['state'], 'running')
+        self.assertEqual(data['rows_processed'], 100000)
+        mock_get_job.assert_called_once_with(7)
+
+    @patch('src.api.get_job')
+    def test_get_missing_job(self, mock_get_job):
+        mock_get_job.return_value = None
+        response = self.app.get('/api/jobs/8')
+        self.assertEqual(response.status_code, 404)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['status'], 'error')
+
+
 if __name__ == '__main__':
     unittest.main()
-
-                        
-                     
\ No newline at end of file
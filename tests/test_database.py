@@ -4,13 +4,15 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 import sys
 import os
+import polars as pl
 
 # Add the parent directory to the Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from src.database import (
-    Base, get_db, Sellers, Customers, Order_Items, Order_Payments, Orders,
-    Products, Product_Category, FactTable, Top_Sellers)
+    Base, get_db, read_table, create_indexes, upgrade_tables, get_engine, write_lock, Sellers, Customers, Order_Items, Order_Payments, Orders,
+    Products, Product_Category, FactTable, Top_Sellers, Watermarks)
+from tests import DuckDBTestCase
 
 class TestDatabase(unittest.TestCase):
 
@@ -30,11 +32,34 @@ class TestDatabase(unittest.TestCase):
         self.session.close()
 
     def test_get_db(self):
-        with patch('src.database.create_engine') as mock_create_engine:
+        with patch('src.database._engine', None), patch('src.database._SessionLocal', None), \
+                patch('src.database.create_engine') as mock_create_engine:
             mock_create_engine.return_value = self.engine
             with get_db() as db:
                 self.assertIsNotNone(db)
 
+    def test_get_db_reuses_engine(self):
+        "The engine and schema should be created once, not on every session"
+        with patch('src.database._engine', None), patch('src.database._SessionLocal', None), \
+                patch('src.database.create_engine') as mock_create_engine:
+            mock_create_engine.return_value = self.engine
+            with get_db() as first_db:
+                self.assertIsNotNone(first_db)
+            with get_db(write=True) as second_db:
+                self.assertIsNotNone(second_db)
+            self.assertEqual(mock_create_engine.call_count, 1)
+            self.assertIs(get_engine(), self.engine)
+
+    def test_get_db_write_lock_released(self):
+        "The writer lock should be free again once the write session is closed"
+        with patch('src.database._engine', None), patch('src.database._SessionLocal', None), \
+                patch('src.database.create_engine') as mock_create_engine:
+            mock_create_engine.return_value = self.engine
+            with get_db(write=True):
+                pass
+            self.assertTrue(write_lock.acquire(blocking=False))
+            write_lock.release()
+
     def test_sellers_model(self):
         seller = Sellers(seller_id="S001", seller_zip_code_prefix=12345, seller_city="Test City", seller_state="TS")
         self.session.add(seller)
@@ -99,22 +124,124 @@ class TestDatabase(unittest.TestCase):
         self.assertEqual(queried_category.product_category_name_english, "electronics")
 
     def test_fact_table_model(self):
-        fact = FactTable(order_id="O001", customer_id="C001", product_id="P001", seller_id="S001", price=100.0)
+        fact = FactTable(order_key=1, customer_key=1, product_key=1, seller_key=1, price=100.0)
         self.session.add(fact)
         self.session.commit()
 
-        queried_fact = self.session.query(FactTable).filter_by(order_id="O001").first()
+        queried_fact = self.session.query(FactTable).filter_by(order_key=1).first()
         self.assertIsNotNone(queried_fact)
         self.assertEqual(queried_fact.price, 100.0)
 
     def test_top_sellers_model(self):
-        top_seller = Top_Sellers(seller_id="S001", total_sales=10000.0)
+        top_seller = Top_Sellers(seller_key=1, total_sales=10000.0)
         self.session.add(top_seller)
         self.session.commit()
 
-        queried_top_seller = self.session.query(Top_Sellers).filter_by(seller_id="S001").first()
+        queried_top_seller = self.session.query(Top_Sellers).filter_by(seller_key=1).first()
         self.assertIsNotNone(queried_top_seller)
         self.assertEqual(queried_top_seller.total_sales, 10000.0)
 
+    def test_watermarks_model(self):
+        watermark = Watermarks(table_name="fact_table", source_table="orders", high_watermark=100)
+        self.session.add(watermark)
+        self.session.commit()
+
+        queried_watermark = self.session.query(Watermarks).filter_by(table_name="fact_table").first()
+        self.assertIsNotNone(queried_watermark)
+        self.assertEqual(queried_watermark.high_watermark, 100)
+
+
+class TestReadTable(DuckDBTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.session.add_all([
+            Sellers(id=1, seller_id='seller1', seller_zip_code_prefix=12345, seller_city='City1', seller_state='SP'),
+            Sellers(id=2, seller_id='seller2', seller_zip_code_prefix=67890, seller_city='City2', seller_state='RJ'),
+            Sellers(id=3, seller_id='seller3', seller_zip_code_prefix=13579, seller_city=None, seller_state='SP'),
+        ])
+        self.session.commit()
+
+    def test_reads_whole_table(self):
+        "Test that every row and column of the table comes back as a polars DataFrame"
+        df = read_table(self.session, Sellers)
+        self.assertIsInstance(df, pl.DataFrame)
+        self.assertListEqual(df.columns, Sellers.__table__.columns.keys())
+        self.assertEqual(len(df), 3)
+
+    def test_projection(self):
+        "Test that only the requested columns are read"
+        df = read_table(self.session, Sellers, columns=['seller_id', 'seller_state'])
+        self.assertListEqual(df.columns, ['seller_id', 'seller_state'])
+
+    def test_filters(self):
+        "Test that the filters are combined and applied inside DuckDB"
+        df = read_table(self.session, Sellers, columns=['seller_id'],
+                        filters=[('seller_state', '=', 'SP'), ('seller_city', 'is not null')])
+        self.assertListEqual(df['seller_id'].to_list(), ['seller1'])
+
+        df = read_table(self.session, Sellers, filters=[('id', 'in', [2, 3])])
+        self.assertListEqual(sorted(df['id'].to_list()), [2, 3])
+
+        df = read_table(self.session, Sellers, filters=[('id', 'in', [])])
+        self.assertTrue(df.is_empty())
+
+    def test_empty_table_keeps_schema(self):
+        "Test that an empty table gives an empty DataFrame with the table's columns"
+        df = read_table(self.session, Top_Sellers)
+        self.assertTrue(df.is_empty())
+        self.assertListEqual(df.columns, ['id', 'seller_key', 'total_sales'])
+
+    def test_invalid_column(self):
+        "Test that unknown columns and operators are rejected before any SQL is run"
+        with self.assertRaises(ValueError):
+            read_table(self.session, Sellers, columns=['unknown_column'])
+        with self.assertRaises(ValueError):
+            read_table(self.session, Sellers, filters=[('id', 'like', 1)])
+
+
+class TestCreateIndexes(DuckDBTestCase):
+
+    def index_names(self):
+        with self.engine.connect() as conn:
+            return {row[0] for row in conn.exec_driver_sql("SELECT index_name FROM duckdb_indexes()")}
+
+    def test_natural_key_indexes(self):
+        "Test that the dimension tables get an index on their natural key and the fact table none"
+        self.assertSetEqual(self.index_names(), {
+            'ix_sellers_seller_id', 'ix_customers_customer_id', 'ix_orders_order_id',
+            'ix_order_items_order_id_order_item_id', 'ix_order_payments_order_id_payment_sequential',
+            'ix_products_product_id', 'ix_product_category_product_category_name',
+            'ix_etl_ingest_manifest_table_name_content_hash'})
+
+    def test_create_indexes_on_existing_tables(self):
+        "Test that tables created without their indexes get them, and that it can run again"
+        with self.engine.begin() as conn:
+            for table in Base.metadata.sorted_tables:
+                for index in table.indexes:
+                    conn.exec_driver_sql(f"DROP INDEX {index.name}")
+        self.assertSetEqual(self.index_names(), set())
+
+        create_indexes(self.engine)
+        create_indexes(self.engine)
+        self.assertIn('ix_sellers_seller_id', self.index_names())
+
+    def test_upgrade_tables(self):
+        "Test that a table created before its key and load_seq columns gets them, filled in, and keeps its index"
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql("DROP TABLE sellers")
+            conn.exec_driver_sql("CREATE TABLE sellers (id INTEGER PRIMARY KEY, seller_id VARCHAR, "
+                                 "seller_zip_code_prefix INTEGER, seller_city VARCHAR, seller_state VARCHAR)")
+            conn.exec_driver_sql("CREATE INDEX ix_sellers_seller_id ON sellers (seller_id)")
+            conn.exec_driver_sql("INSERT INTO sellers VALUES (1, 's2', 1, 'santos', 'SP'), (2, 's1', 2, 'santos', 'SP')")
+
+        upgrade_tables(self.engine)
+        create_indexes(self.engine)
+        with self.engine.connect() as conn:
+            rows = conn.exec_driver_sql("SELECT seller_id, seller_key, load_seq FROM sellers ORDER BY seller_id").fetchall()
+        self.assertListEqual(rows, [('s1', 1, 2), ('s2', 2, 1)])
+        self.assertIn('ix_sellers_seller_id', self.index_names())
+
+
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
\ No newline at end of file
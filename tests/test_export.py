@@ -0,0 +1,97 @@
+import sys
+import os
+import json
+import unittest
+import io
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Adding the project root directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database import Sellers, Top_Sellers, get_raw_connection
+from src.export import iter_record_batches, stream_table, encode_arrow_table
+from tests import DuckDBTestCase
+
+
+class TestStreamTable(DuckDBTestCase):
+
+    def setUp(self):
+        # the export reads through a plain DuckDB cursor, as the api gives it one of its own
+        super().setUp()
+        self.cursor = get_raw_connection(self.session).duplicate()
+        self.cursor.execute(
+            "INSERT INTO sellers (id, seller_id, seller_zip_code_prefix, seller_city, seller_state) "
+            "SELECT i, 'seller' || i, 1000 + i, 'City' || i, 'SP' FROM range(1, 6) t(i)")
+
+    def tearDown(self):
+        self.cursor.close()
+        super().tearDown()
+
+    def test_record_batches(self):
+        "Test that the table is read in batches of at most batch_size rows"
+        batches = list(iter_record_batches(self.cursor, Sellers, batch_size=2))
+        self.assertListEqual([batch.num_rows for batch in batches], [2, 2, 1])
+
+    def test_ndjson(self):
+        "Test that every row is exported as one json object per line"
+        body = b"".join(stream_table(self.cursor, Sellers, 'ndjson', batch_size=2)).decode()
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0], {'id': 1, 'seller_id': 'seller1', 'seller_zip_code_prefix': 1001,
+                                   'seller_city': 'City1', 'seller_state': 'SP'})
+
+    def test_csv(self):
+        "Test that the csv export has a single header followed by every row"
+        lines = b"".join(stream_table(self.cursor, Sellers, 'csv', batch_size=2)).decode().splitlines()
+        self.assertEqual(lines[0], 'id,seller_id,seller_zip_code_prefix,seller_city,seller_state')
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(lines[1], '1,seller1,1001,City1,SP')
+
+    def test_empty_table(self):
+        "Test that an empty table exports only the csv header and nothing as ndjson"
+        csv_body = b"".join(stream_table(self.cursor, Top_Sellers, 'csv')).decode()
+        self.assertEqual(csv_body, 'id,seller_id,total_sales\n')
+        self.assertEqual(b"".join(stream_table(self.cursor, Top_Sellers, 'ndjson')), b"")
+
+    def test_keys_exported_as_ids(self):
+        "Test that surrogate keys are exported as their hex ids, in the table's order"
+        self.cursor.execute("INSERT INTO etl_key_dictionary VALUES (1, 'seller_id', 'seller2', 1), "
+                            "(2, 'seller_id', 'seller1', 2)")
+        self.cursor.execute("INSERT INTO top_sellers VALUES (1, 2, 30.0), (2, 1, 20.0), (3, 2, 10.0)")
+        lines = b"".join(stream_table(self.cursor, Top_Sellers, 'csv', batch_size=2)).decode().splitlines()
+        self.assertListEqual(lines, ['id,seller_id,total_sales', '1,seller1,30.0', '2,seller2,20.0', '3,seller1,10.0'])
+        table = pa.ipc.open_stream(b"".join(stream_table(self.cursor, Top_Sellers, 'arrow'))).read_all()
+        self.assertListEqual(table.column('seller_id').to_pylist(), ['seller1', 'seller2', 'seller1'])
+
+    def test_arrow_stream(self):
+        "Test that the arrow export is one IPC stream with the table's column types"
+        chunks = list(stream_table(self.cursor, Sellers, 'arrow', batch_size=2))
+        table = pa.ipc.open_stream(b"".join(chunks)).read_all()
+        self.assertEqual(table.num_rows, 5)
+        self.assertEqual(table.schema.field('seller_zip_code_prefix').type, pa.int32())
+        #a chunk per batch plus the end of stream marker
+        self.assertEqual(len(chunks), 4)
+
+    def test_parquet(self):
+        "Test that the parquet export is a complete file with a row group per batch"
+        body = b"".join(stream_table(self.cursor, Sellers, 'parquet', batch_size=2))
+        parquet_file = pq.ParquetFile(io.BytesIO(body))
+        self.assertEqual(parquet_file.metadata.num_rows, 5)
+        self.assertEqual(parquet_file.metadata.num_row_groups, 3)
+        self.assertListEqual(parquet_file.read().column('id').to_pylist(), [1, 2, 3, 4, 5])
+
+    def test_encode_arrow_table(self):
+        "Test that a small Arrow table round trips through both binary formats"
+        table = self.cursor.execute("SELECT * FROM sellers").arrow()
+        self.assertTrue(pa.ipc.open_stream(encode_arrow_table(table, 'arrow')).read_all().equals(table))
+        self.assertTrue(pq.read_table(io.BytesIO(encode_arrow_table(table, 'parquet'))).equals(table))
+
+    def test_invalid_format(self):
+        "Test that an unknown format is rejected"
+        with self.assertRaises(ValueError):
+            list(stream_table(self.cursor, Sellers, 'xml'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,228 @@
+import sys
+import os
+import io
+import hashlib
+import unittest
+import polars as pl
+
+# Adding the project root directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database import Sellers, Order_Items
+from src.ingest import ingest_batches, stream_digest, find_ingest, record_ingest, InvalidUploadError
+from tests import DuckDBTestCase, bulk_insert_df
+
+
+class TestAppendRows(DuckDBTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.sellers_df = pl.DataFrame({
+            "id": [1, 2, 3],
+            "seller_id": ["seller1", "seller2", "seller3"],
+            "seller_zip_code_prefix": [12345, 67890, 13579],
+            "seller_city": ["City1", "City2", "City3"],
+            "seller_state": ["SP", "RJ", "MG"]
+        })
+
+    def test_inserts_all_new_rows(self):
+        "Test that every row of a fresh upload is written in one call"
+        result = bulk_insert_df(self.session, Sellers, self.sellers_df)
+
+        self.assertEqual(result['new_count'], 3)
+        self.assertEqual(result['existing_count'], 0)
+        self.assertEqual(self.session.query(Sellers).count(), 3)
+        self.assertGreater(result['rows_per_second'], 0)
+
+    def test_skips_existing_rows(self):
+        "Test that rows already in the table are counted as existing and not inserted again"
+        bulk_insert_df(self.session, Sellers, self.sellers_df.head(2))
+        result = bulk_insert_df(self.session, Sellers, self.sellers_df)
+
+        self.assertEqual(result['new_count'], 1)
+        self.assertEqual(result['existing_count'], 2)
+        self.assertEqual(self.session.query(Sellers).count(), 3)
+        self.assertListEqual(result['preview']['seller_id'].to_list(), ["seller3"])
+
+    def test_preview_is_limited(self):
+        "Test that only the requested number of new rows is returned for the response body"
+        result = bulk_insert_df(self.session, Sellers, self.sellers_df, preview_rows=2)
+        self.assertEqual(len(result['preview']), 2)
+
+    def test_ignores_extra_columns(self):
+        "Test that columns which are not part of the model are not sent to the database"
+        df = self.sellers_df.with_columns(pl.lit("x").alias("unknown_column"))
+        result = bulk_insert_df(self.session, Sellers, df)
+        self.assertEqual(result['new_count'], 3)
+
+
+class TestIngestBatches(DuckDBTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.required_columns = ['seller_id', 'seller_zip_code_prefix', 'seller_city', 'seller_state']
+
+        sellers_df = pl.DataFrame({
+            "seller_id": [f"seller{i}" for i in range(10)],
+            "seller_zip_code_prefix": list(range(10)),
+            "seller_city": [f"City{i}" for i in range(10)],
+            "seller_state": ["SP"] * 10
+        })
+        self.batches = list(sellers_df.iter_slices(n_rows=4))
+
+    def test_all_batches_written(self):
+        "Test that every batch is written and the ids continue across batches"
+        result = ingest_batches(self.session, Sellers, iter(self.batches), self.required_columns)
+
+        self.assertEqual(result['rows_read'], 10)
+        self.assertEqual(result['new_count'], 10)
+        ids = sorted(seller.id for seller in self.session.query(Sellers).all())
+        self.assertListEqual(ids, list(range(1, 11)))
+
+    def test_preview_spans_batches(self):
+        "Test that the preview is filled from the first batches only up to its limit"
+        result = ingest_batches(self.session, Sellers, iter(self.batches), self.required_columns)
+        self.assertListEqual(result['preview']['id'].to_list(), [1, 2, 3, 4, 5])
+
+    def test_invalid_batch_rolls_back(self):
+        "Test that a batch with the wrong columns rolls back the batches written before it"
+        bad_batch = pl.DataFrame({"invalid_column": ["data"]})
+        with self.assertRaises(InvalidUploadError):
+            ingest_batches(self.session, Sellers, iter(self.batches + [bad_batch]), self.required_columns)
+        self.assertEqual(self.session.query(Sellers).count(), 0)
+
+    def test_no_rows(self):
+        "Test that an upload without rows is reported as an error"
+        with self.assertRaises(ValueError):
+            ingest_batches(self.session, Sellers, iter([]), self.required_columns)
+
+
+class TestUpsert(DuckDBTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.required_columns = ['seller_id', 'seller_zip_code_prefix', 'seller_city', 'seller_state']
+
+        #positional ids, as transform__df gives them to every uploaded file
+        self.sellers_df = pl.DataFrame({
+            "id": [1, 2, 3],
+            "seller_id": ["seller1", "seller2", "seller3"],
+            "seller_zip_code_prefix": [12345, 67890, 13579],
+            "seller_city": ["City1", "City2", "City3"],
+            "seller_state": ["SP", "RJ", "MG"]
+        })
+
+    def sellers(self):
+        return {seller.seller_id: (seller.id, seller.seller_city)
+                for seller in self.session.query(Sellers).all()}
+
+    def test_reordered_upload(self):
+        "Test that a reordered second extract updates the known keys and appends the new ones"
+        bulk_insert_df(self.session, Sellers, self.sellers_df, mode='upsert')
+        second_extract = pl.DataFrame({
+            "id": [1, 2, 3],
+            "seller_id": ["seller4", "seller3", "seller1"],
+            "seller_zip_code_prefix": [1, 2, 3],
+            "seller_city": ["City4", "NewCity3", "NewCity1"],
+            "seller_state": ["SP", "SP", "SP"]
+        })
+        result = bulk_insert_df(self.session, Sellers, second_extract, mode='upsert')
+
+        self.assertEqual(result['new_count'], 1)
+        self.assertEqual(result['existing_count'], 2)
+        self.assertDictEqual(self.sellers(), {"seller1": (1, "NewCity1"), "seller2": (2, "City2"),
+                                              "seller3": (3, "NewCity3"), "seller4": (4, "City4")})
+        self.assertListEqual(result['preview']['seller_id'].to_list(), ["seller4"])
+
+    def test_load_seq_marks_changed_rows(self):
+        "Test that an upsert stamps the rows it adds or changes with the next load_seq and leaves the others"
+        bulk_insert_df(self.session, Sellers, self.sellers_df, mode='upsert')
+        second_extract = self.sellers_df.with_columns(
+            pl.when(pl.col("seller_id") == "seller2").then(pl.lit("NewCity2"))
+            .otherwise(pl.col("seller_city")).alias("seller_city"))
+        bulk_insert_df(self.session, Sellers, second_extract, mode='upsert')
+        new_seller = pl.DataFrame({"id": [1], "seller_id": ["seller4"], "seller_zip_code_prefix": [1],
+                                   "seller_city": ["City4"], "seller_state": ["SP"]})
+        bulk_insert_df(self.session, Sellers, new_seller, mode='upsert')
+
+        load_seqs = {seller.seller_id: seller.load_seq for seller in self.session.query(Sellers).all()}
+        self.assertDictEqual(load_seqs, {"seller1": 1, "seller2": 2, "seller3": 1, "seller4": 3})
+
+    def test_append_collides_on_positional_ids(self):
+        "Test that the default append mode still only compares ids, unlike upsert"
+        bulk_insert_df(self.session, Sellers, self.sellers_df)
+        other_sellers = self.sellers_df.with_columns(pl.col("seller_id") + "_b")
+        result = bulk_insert_df(self.session, Sellers, other_sellers)
+        self.assertEqual(result['new_count'], 0)
+
+        result = bulk_insert_df(self.session, Sellers, other_sellers, mode='upsert')
+        self.assertEqual(result['new_count'], 3)
+        self.assertEqual(self.session.query(Sellers).count(), 6)
+
+    def test_duplicate_and_null_keys(self):
+        "Test that the last row of a repeated key wins and rows without a key are always added"
+        df = pl.DataFrame({
+            "id": [1, 2, 3, 4],
+            "seller_id": ["seller1", "seller1", None, None],
+            "seller_zip_code_prefix": [1, 2, 3, 4],
+            "seller_city": ["Old", "New", "A", "B"],
+            "seller_state": ["SP"] * 4
+        })
+        result = bulk_insert_df(self.session, Sellers, df, mode='upsert')
+        self.assertEqual(result['new_count'], 3)
+        cities = sorted(seller.seller_city for seller in self.session.query(Sellers).all())
+        self.assertListEqual(cities, ["A", "B", "New"])
+
+    def test_composite_key_across_batches(self):
+        "Test that (order_id, order_item_id) is matched across the batches of one upload"
+        order_items = pl.DataFrame({
+            "order_id": ["o1", "o1", "o2", "o1"],
+            "order_item_id": [1, 2, 1, 2],
+            "product_id": ["p1", "p2", "p3", "p2"],
+            "seller_id": ["s1"] * 4,
+            "price": [1.0, 2.0, 3.0, 20.0],
+            "freight_value": [0.0] * 4
+        })
+        result = ingest_batches(self.session, Order_Items, iter(order_items.iter_slices(n_rows=3)),
+                                ['order_id', 'order_item_id'], mode='upsert')
+
+        self.assertEqual(result['new_count'], 3)
+        self.assertEqual(result['existing_count'], 1)
+        prices = {(item.order_id, item.order_item_id): item.price
+                  for item in self.session.query(Order_Items).all()}
+        self.assertDictEqual(prices, {("o1", 1): 1.0, ("o1", 2): 20.0, ("o2", 1): 3.0})
+
+
+class TestIngestManifest(DuckDBTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.result = {'new_count': 2, 'existing_count': 0, 'rows_read': 2, 'ingest_seconds': 0.5}
+        self.summary = {'status': 'success', 'new_sellers_count': 2, 'body': [{'id': 1}]}
+
+    def test_stream_digest(self):
+        "Test that the digest read in chunks is the sha256 of the whole content"
+        content = b"seller_id\n" * 1000
+        self.assertEqual(stream_digest(io.BytesIO(content), chunk_size=7), hashlib.sha256(content).hexdigest())
+
+    def test_recorded_ingest_is_found(self):
+        "Test that a committed load is found again by table, hash and mode with its summary"
+        self.assertIsNone(find_ingest(self.session, 'sellers', 'abc', 'append'))
+        record_ingest(self.session, 'sellers', 'abc', 'append', 'sellers.csv', self.result, self.summary)
+        self.session.commit()
+
+        previous = find_ingest(self.session, 'sellers', 'abc', 'append')
+        self.assertDictEqual(previous['summary'], self.summary)
+        self.assertIsNotNone(previous['ingested_at'])
+        self.assertIsNone(find_ingest(self.session, 'sellers', 'abc', 'upsert'))
+        self.assertIsNone(find_ingest(self.session, 'customers', 'abc', 'append'))
+
+    def test_rolled_back_ingest_is_not_recorded(self):
+        "Test that the manifest row goes away with a load that is rolled back"
+        record_ingest(self.session, 'sellers', 'abc', 'append', 'sellers.csv', self.result, self.summary)
+        self.session.rollback()
+        self.assertIsNone(find_ingest(self.session, 'sellers', 'abc', 'append'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import sys
+import os
+import threading
+import unittest
+from contextlib import contextmanager
+from unittest.mock import patch
+from sqlalchemy.orm import sessionmaker
+
+# Adding the project root directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database import Jobs
+from src.jobs import JobQueue, NoJobProgress, get_job, fail_interrupted_jobs
+from tests import DuckDBTestCase
+
+
+class TestJobQueue(DuckDBTestCase):
+
+    def setUp(self):
+        # each get_db opens its own session as it does in the app, since the job threads
+        # write the table at the same time
+        super().setUp()
+        session_factory = sessionmaker(bind=self.engine)
+
+        @contextmanager
+        def get_db(write=False):
+            db = session_factory()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        patcher = patch('src.jobs.get_db', get_db)
+        self.addCleanup(patcher.stop)
+        patcher.start()
+        self.queue = JobQueue(workers=2)
+
+    def tearDown(self):
+        self.queue.shutdown()
+        super().tearDown()
+
+    def test_job_succeeds_with_progress_and_stages(self):
+        "Test that a job records its rows processed, stage timings and result"
+        def work(progress):
+            with progress.stage('ingest'):
+                progress.progress(10)
+                progress.progress(25)
+            return {'status': 'success', 'new_count': 25}, 200
+
+        job_id, coalesced = self.queue.submit('load_sellers', 'load_sellers:append:abc', work)
+        self.queue.shutdown()
+
+        self.assertFalse(coalesced)
+        job = get_job(job_id)
+        self.assertEqual(job['state'], 'succeeded')
+        self.assertEqual(job['job_type'], 'load_sellers')
+        self.assertEqual(job['rows_processed'], 25)
+        self.assertListEqual(list(job['stages']), ['ingest'])
+        self.assertDictEqual(job['result'], {'status': 'success', 'new_count': 25})
+        self.assertEqual(job['status_code'], 200)
+        self.assertIsNotNone(job['started_at'])
+        self.assertIsNotNone(job['finished_at'])
+
+    def test_error_response_fails_the_job(self):
+        "Test that work answering with an error status marks the job failed and keeps the body"
+        job_id, _ = self.queue.submit('load_top_sellers', 'load_top_sellers',
+                                      lambda progress: ({'error': 'Fact table not found'}, 404))
+        self.queue.shutdown()
+
+        job = get_job(job_id)
+        self.assertEqual(job['state'], 'failed')
+        self.assertEqual(job['status_code'], 404)
+        self.assertDictEqual(job['result'], {'error': 'Fact table not found'})
+
+    def test_exception_fails_the_job(self):
+        "Test that an exception raised by the work is recorded as the job error"
+        def work(progress):
+            raise RuntimeError('disk full')
+
+        job_id, _ = self.queue.submit('process_fact_table', 'process_fact_table:sql:full', work)
+        self.queue.shutdown()
+
+        job = get_job(job_id)
+        self.assertEqual(job['state'], 'failed')
+        self.assertEqual(job['error'], 'disk full')
+        self.assertEqual(job['status_code'], 500)
+
+    def test_identical_jobs_are_coalesced(self):
+        "Test that a job submitted while an identical one runs gets the running job's id"
+        release = threading.Event()
+        calls = []
+
+        def work(progress):
+            calls.append(1)
+            release.wait(5)
+            return {'status': 'success'}, 200
+
+        first_id, first_coalesced = self.queue.submit('load_top_sellers', 'load_top_sellers', work)
+        second_id, second_coalesced = self.queue.submit('load_top_sellers', 'load_top_sellers', work)
+        other_id, other_coalesced = self.queue.submit('process_fact_table', 'process_fact_table:sql:full',
+                                                      lambda progress: ({}, 200))
+        release.set()
+        self.queue.shutdown()
+
+        self.assertEqual(first_id, second_id)
+        self.assertFalse(first_coalesced)
+        self.assertTrue(second_coalesced)
+        self.assertFalse(other_coalesced)
+        self.assertNotEqual(other_id, first_id)
+        self.assertEqual(len(calls), 1)
+
+        #once the first job is done the same key starts a new job
+        third_id, third_coalesced = self.queue.submit('load_top_sellers', 'load_top_sellers',
+                                                      lambda progress: ({}, 200))
+        self.assertFalse(third_coalesced)
+        self.assertNotEqual(third_id, first_id)
+
+    def test_get_missing_job(self):
+        "Test that an unknown job id returns None"
+        self.assertIsNone(get_job(12345))
+
+    def test_fail_interrupted_jobs(self):
+        "Test that jobs left queued or running by a stopped process are marked failed"
+        session = sessionmaker(bind=self.engine)()
+        session.add_all([Jobs(id=1, job_type='load_sellers', job_key='a', state='running'),
+                         Jobs(id=2, job_type='load_sellers', job_key='b', state='queued'),
+                         Jobs(id=3, job_type='load_sellers', job_key='c', state='succeeded')])
+        session.commit()
+        session.close()
+
+        self.assertEqual(fail_interrupted_jobs(), 2)
+        self.assertListEqual([get_job(job_id)['state'] for job_id in (1, 2, 3)],
+                             ['failed', 'failed', 'succeeded'])
+        self.assertEqual(get_job(1)['error'], 'interrupted by a restart')
+
+
+class TestNoJobProgress(unittest.TestCase):
+
+    def test_records_nothing(self):
+        "Test that work run inside the request can report progress without a job row"
+        progress = NoJobProgress()
+        with progress.stage('ingest'):
+            progress.progress(5)
+        self.assertEqual(progress.rows_processed, 5)
+        self.assertDictEqual(progress.stages, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
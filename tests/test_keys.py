@@ -0,0 +1,86 @@
+import sys
+import os
+import unittest
+import polars as pl
+
+# Adding the project root directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database import Sellers, Order_Items, FactTable, get_raw_connection
+from src.keys import (assign_keys, decode_keys, decode_records, encoded_columns, api_columns,
+                      KEY_DICTIONARY)
+from tests import DuckDBTestCase
+
+
+class KeysTestCase(DuckDBTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.conn = get_raw_connection(self.session)
+
+    def keys_of(self, df, natural_id, key):
+        return dict(df.select(natural_id, key).rows())
+
+
+class TestAssignKeys(KeysTestCase):
+
+    def test_keys_follow_the_ids(self):
+        "Test that an id keeps its key in every batch and table, new ids get the next keys"
+        sellers = assign_keys(self.conn, Sellers, pl.DataFrame({'id': [1, 2], 'seller_id': ['s2', 's1']}))
+        self.assertDictEqual(self.keys_of(sellers, 'seller_id', 'seller_key'), {'s1': 1, 's2': 2})
+
+        order_items = assign_keys(self.conn, Order_Items, pl.DataFrame({
+            'id': [1, 2, 3], 'order_id': ['o1', 'o1', 'o2'], 'seller_id': ['s1', 's3', 's1']}))
+        self.assertDictEqual(self.keys_of(order_items, 'seller_id', 'seller_key'), {'s1': 1, 's3': 3})
+        self.assertDictEqual(self.keys_of(order_items, 'order_id', 'order_key'), {'o1': 1, 'o2': 2})
+        self.assertEqual(len(order_items), 3)
+        self.assertEqual(self.conn.execute(f"SELECT count(*) FROM {KEY_DICTIONARY}").fetchone()[0], 5)
+
+    def test_null_ids(self):
+        "Test that a row without an id gets no key"
+        sellers = assign_keys(self.conn, Sellers, pl.DataFrame({'id': [1, 2], 'seller_id': ['s1', None]}))
+        self.assertListEqual(sellers.sort('id')['seller_key'].to_list(), [1, None])
+
+    def test_frame_without_ids(self):
+        df = pl.DataFrame({'id': [1], 'seller_city': ['santos']})
+        self.assertIs(assign_keys(self.conn, Sellers, df), df)
+
+
+class TestDecodeKeys(KeysTestCase):
+
+    def setUp(self):
+        super().setUp()
+        assign_keys(self.conn, Order_Items, pl.DataFrame({
+            'order_id': ['o1', 'o2'], 'product_id': ['p1', 'p2'], 'seller_id': ['s1', 's2']}))
+
+    def test_keys_replaced_in_place(self):
+        "Test that each key column becomes its natural id at the same position"
+        df = pl.DataFrame({'id': [1, 2, 3], 'order_key': [2, 1, 2], 'seller_key': [1, None, 2], 'price': [1.0, 2.0, 3.0]})
+        decoded = decode_keys(self.conn, df)
+        self.assertListEqual(decoded.columns, ['id', 'order_id', 'seller_id', 'price'])
+        self.assertListEqual(decoded['order_id'].to_list(), ['o2', 'o1', 'o2'])
+        self.assertListEqual(decoded['seller_id'].to_list(), ['s1', None, 's2'])
+
+    def test_key_dropped_next_to_its_id(self):
+        df = pl.DataFrame({'id': [1], 'seller_id': ['s1'], 'seller_key': [1]})
+        self.assertListEqual(decode_keys(self.conn, df).columns, ['id', 'seller_id'])
+        self.assertListEqual(api_columns(Sellers.__table__.columns.keys()),
+                             ['id', 'seller_id', 'seller_zip_code_prefix', 'seller_city', 'seller_state'])
+
+    def test_records(self):
+        "Test that the records of a json page are decoded the same way"
+        records = decode_records(self.conn, [{'id': 1, 'seller_key': 2, 'total_sales': 10.0},
+                                             {'id': 2, 'seller_key': 1, 'total_sales': 5.0}])
+        self.assertListEqual(records, [{'id': 1, 'seller_id': 's2', 'total_sales': 10.0},
+                                       {'id': 2, 'seller_id': 's1', 'total_sales': 5.0}])
+
+    def test_encoded_columns(self):
+        "Test that the builds read the keys of a table instead of its hex ids"
+        self.assertNotIn('order_id', encoded_columns(Order_Items))
+        self.assertIn('order_key', encoded_columns(Order_Items))
+        self.assertIn('order_key', encoded_columns(FactTable))
+        self.assertNotIn('load_seq', encoded_columns(Order_Items))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import sys
+import os
+import tempfile
+import zipfile
+import unittest
+import polars as pl
+
+# Adding the project root directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database import Sellers, Product_Category
+from src.ingest import InvalidUploadError
+from src.pipeline import ArchiveTooLargeError, table_for_file, extract_zip, parse_files, load_tables
+from tests import DuckDBTestCase
+
+SELLERS_CSV = (b"seller_id,seller_zip_code_prefix,seller_city,seller_state\n"
+               b"seller1,12345,City1,SP\nseller2,67890,City2,RJ\n")
+CATEGORIES_CSV = (b"product_category_name,product_category_name_english\n"
+                  b"beleza_saude,health_beauty\n")
+
+
+class PipelineTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_file(self, name, content):
+        file_path = os.path.join(self.tmp_dir.name, name)
+        with open(file_path, 'wb') as f:
+            f.write(content)
+        return file_path
+
+
+class TestFiles(PipelineTestCase):
+
+    def test_table_for_file(self):
+        "Test that files are matched to their table by the Olist file name"
+        self.assertEqual(table_for_file('olist_sellers_dataset.csv'), 'sellers')
+        self.assertEqual(table_for_file('data/product_category_name_translation.csv'), 'product_categories')
+        self.assertIsNone(table_for_file('sellers.xlsx'))
+
+    def test_table_for_columnar_file(self):
+        "Test that the Olist file name is matched whatever the upload format"
+        self.assertEqual(table_for_file('olist_orders_dataset.parquet'), 'orders')
+        self.assertEqual(table_for_file('olist_orders_dataset.arrow'), 'orders')
+        self.assertEqual(table_for_file('olist_orders_dataset.csv.gz'), 'orders')
+        self.assertIsNone(table_for_file('olist_orders_dataset.txt'))
+
+    def test_extract_zip(self):
+        "Test that only the known csv files of an archive are extracted, flat into the target folder"
+        zip_path = os.path.join(self.tmp_dir.name, 'olist.zip')
+        with zipfile.ZipFile(zip_path, 'w') as archive:
+            archive.writestr('olist/olist_sellers_dataset.csv', SELLERS_CSV)
+            archive.writestr('../../product_category_name_translation.csv', CATEGORIES_CSV)
+            archive.writestr('olist/readme.txt', b'not a table')
+        target_dir = os.path.join(self.tmp_dir.name, 'extracted')
+        os.makedirs(target_dir)
+
+        file_paths = extract_zip(zip_path, target_dir)
+        self.assertSetEqual(set(file_paths), {'sellers', 'product_categories'})
+        self.assertListEqual(sorted(os.listdir(target_dir)),
+                             ['olist_sellers_dataset.csv', 'product_category_name_translation.csv'])
+
+    def test_extract_zip_too_large(self):
+        "Test that an archive whose files decompress past max_size is refused before anything is written"
+        zip_path = os.path.join(self.tmp_dir.name, 'olist.zip')
+        with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('olist_sellers_dataset.csv', SELLERS_CSV + b'0' * (4 << 20))
+        target_dir = os.path.join(self.tmp_dir.name, 'extracted')
+        os.makedirs(target_dir)
+
+        self.assertLess(os.path.getsize(zip_path), 1 << 16)
+        with self.assertRaises(ArchiveTooLargeError):
+            extract_zip(zip_path, target_dir, max_size=1 << 20)
+        self.assertListEqual(os.listdir(target_dir), [])
+        self.assertSetEqual(set(extract_zip(zip_path, target_dir, max_size=8 << 20)), {'sellers'})
+
+
+class TestParseFiles(PipelineTestCase):
+
+    def test_parse_files(self):
+        "Test that every file is parsed into a frame and timed"
+        frames, parse_seconds = parse_files({
+            'sellers': self.write_file('sellers.csv', SELLERS_CSV),
+            'product_categories': self.write_file('categories.csv', CATEGORIES_CSV)})
+        self.assertEqual(len(frames['sellers']), 2)
+        self.assertEqual(len(frames['product_categories']), 1)
+        self.assertSetEqual(set(parse_seconds), {'sellers', 'product_categories'})
+
+    def test_invalid_files_reported_together(self):
+        "Test that the errors of all invalid files are raised at once"
+        with self.assertRaises(InvalidUploadError) as context:
+            parse_files({
+                'sellers': self.write_file('sellers.csv', CATEGORIES_CSV),
+                'customers': self.write_file('customers.csv', SELLERS_CSV)}, workers=2)
+        self.assertIn('Sellers', str(context.exception))
+        self.assertIn('Customers', str(context.exception))
+
+    def test_unparseable_values_reported_by_column(self):
+        "Test that a file whose values do not parse is rejected with the columns at fault"
+        with self.assertRaises(InvalidUploadError) as context:
+            parse_files({'sellers': self.write_file('sellers.csv', SELLERS_CSV + b"seller3,abc,City3,SP\n")})
+        self.assertIn('seller_zip_code_prefix: 1 values are not Int32', str(context.exception))
+
+    def test_invalid_domain_value(self):
+        with self.assertRaises(InvalidUploadError) as context:
+            parse_files({'sellers': self.write_file('sellers.csv', SELLERS_CSV.replace(b"RJ", b"XX"))})
+        self.assertIn('seller_state', str(context.exception))
+
+
+class TestLoadTables(DuckDBTestCase):
+
+    write_file = PipelineTestCase.write_file
+
+    def setUp(self):
+        super().setUp()
+        self.frames, _ = parse_files({
+            'sellers': self.write_file('sellers.csv', SELLERS_CSV),
+            'product_categories': self.write_file('categories.csv', CATEGORIES_CSV)})
+
+    def test_load_tables(self):
+        "Test that every parsed table is written"
+        results = load_tables(self.session, self.frames)
+        self.assertListEqual(list(results), ['product_categories', 'sellers'])
+        self.assertEqual(self.session.query(Sellers).count(), 2)
+        self.assertEqual(self.session.query(Product_Category).count(), 1)
+
+    def test_failed_table_rolls_back_all(self):
+        "Test that a table failing to load leaves none of the pipeline's tables written"
+        self.frames['sellers'] = self.frames['sellers'].with_columns(
+            pl.lit('not a number').alias('seller_zip_code_prefix'))
+        with self.assertRaises(Exception):
+            load_tables(self.session, self.frames)
+        self.assertEqual(self.session.query(Product_Category).count(), 0)
+        self.assertEqual(self.session.query(Sellers).count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
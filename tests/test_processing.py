@@ -8,6 +8,11 @@ import numpy as np
 from sqlalchemy.orm import declarative_base
 from datetime import datetime
 import unittest
+import tempfile
+import gzip
+import bz2
+import zipfile
+import pyarrow as pa
 
 
 # Adding the project root directory to the Python path
@@ -18,12 +23,24 @@ data_dir = os.path.join(curr_dir, "data")
 
 from unittest.mock import patch 
 from src.processing import (load_data,
+                            load_data_batched,
+                            scan_data,
+                            check_missing_duplcates,
                             transform_product_category_df,
                             transform__df,
                             process_fact_table,
+                            process_fact_table_lazy,
+                            deduplicate_fact_table,
+                            prune_dimensions,
+                            plan_fact_joins,
+                            join_dimensions,
+                            sink_fact_table,
+                            scan_table,
                             process_dim_table_df,
-                            get_top_sellers
+                            get_top_sellers,
+                            FACT_TABLE_ROW_IDS
                             )
+from src.schemas import TABLE_SCHEMAS
 
 
 orders_df_path = os.path.join(data_dir, "olist_order_items_dataset.csv")
@@ -65,6 +82,219 @@ class TestLoadData(unittest.TestCase):
 
 
 
+class TestLoadDataBatched(unittest.TestCase):
+
+    def test_load_data_batched_none(self):
+        "Test load_data_batched function with None file_path"
+        result = load_data_batched(None)
+        self.assertEqual(result, "Invalid file path or format provided")
+
+    def test_load_data_batched_invalid(self):
+        "Test load_data_batched function with invalid file_path"
+        result = load_data_batched("invalid_path")
+        self.assertEqual(result, "File path does not exist or is not in the right format")
+
+    def test_load_data_batched_valid(self):
+        "Test that the batches add up to the whole file and respect the batch size"
+        file_path = os.path.join(data_dir, "olist_customers_dataset.csv")
+        batches = list(load_data_batched(file_path, batch_size=50))
+
+        self.assertGreater(len(batches), 1)
+        self.assertTrue(all(len(batch) <= 50 for batch in batches))
+        self.assertEqual(sum(len(batch) for batch in batches), len(load_data(file_path)))
+
+    def test_load_data_batched_schema(self):
+        "Test that batches read with a schema come out typed and projected"
+        file_path = os.path.join(data_dir, "olist_order_items_dataset.csv")
+        batches = list(load_data_batched(file_path, batch_size=100, schema=TABLE_SCHEMAS['order_items']))
+        self.assertGreater(len(batches), 1)
+        for batch in batches:
+            self.assertDictEqual(dict(batch.schema), TABLE_SCHEMAS['order_items'])
+
+
+class TestLoadDataSchema(unittest.TestCase):
+
+    def test_types(self):
+        "Test that a csv read with its table's schema has the model's types instead of inferred ones"
+        file_path = os.path.join(data_dir, "olist_orders_dataset.csv")
+        df = load_data(file_path, schema=TABLE_SCHEMAS['orders'])
+        self.assertEqual(len(df), len(load_data(file_path)))
+        self.assertDictEqual(dict(df.schema), TABLE_SCHEMAS['orders'])
+        self.assertEqual(df['order_purchase_timestamp'].dtype, pl.Datetime('us'))
+        self.assertEqual(df['order_status'].dtype, pl.Categorical)
+
+    def test_projection(self):
+        "Test that columns outside the schema are not read"
+        file_path = os.path.join(data_dir, "olist_sellers_dataset.csv")
+        df = load_data(file_path, schema={'seller_id': pl.String, 'seller_state': pl.Categorical})
+        self.assertListEqual(df.columns, ['seller_id', 'seller_state'])
+
+    def test_unparseable_value(self):
+        "Test that a value that does not fit its column's type fails the read"
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = os.path.join(tmp_dir, "orders.csv")
+            with open(file_path, 'w') as f:
+                f.write("order_id,order_purchase_timestamp\no1,2017-10-02 10:56:33\no2,not a date\n")
+            with self.assertRaises(pl.exceptions.ComputeError):
+                load_data(file_path, schema=TABLE_SCHEMAS['orders'])
+
+
+
+class TestLoadDataColumnar(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.orders = load_data(os.path.join(data_dir, "olist_orders_dataset.csv"))
+
+    def write(self, name, write):
+        file_path = os.path.join(self.tmp_dir.name, name)
+        write(file_path)
+        return file_path
+
+    def test_parquet(self):
+        "Test that a Parquet file is read with the schema's columns and types"
+        file_path = self.write("orders.parquet", lambda path: self.orders.write_parquet(path))
+        df = load_data(file_path, schema=TABLE_SCHEMAS['orders'])
+        self.assertEqual(len(df), len(self.orders))
+        self.assertDictEqual(dict(df.schema), TABLE_SCHEMAS['orders'])
+
+    def test_parquet_batched(self):
+        "Test that a Parquet file is streamed in batches that add up to the whole file"
+        file_path = self.write("orders.parquet",
+                               lambda path: self.orders.write_parquet(path, row_group_size=40))
+        batches = list(load_data_batched(file_path, batch_size=50, schema={'order_id': pl.String}))
+        self.assertTrue(all(len(batch) <= 50 for batch in batches))
+        self.assertEqual(sum(len(batch) for batch in batches), len(self.orders))
+        self.assertListEqual(batches[0].columns, ['order_id'])
+
+    def test_arrow_ipc(self):
+        "Test that Arrow IPC files, compressed or not, are read like the csv"
+        for name, compression in [("orders.arrow", "uncompressed"), ("orders.feather", "zstd")]:
+            file_path = self.write(name, lambda path: self.orders.write_ipc(path, compression=compression))
+            df = load_data(file_path, schema=TABLE_SCHEMAS['orders'])
+            self.assertDictEqual(dict(df.schema), TABLE_SCHEMAS['orders'])
+            self.assertListEqual(df['order_id'].to_list(), self.orders['order_id'].to_list())
+
+            batches = list(load_data_batched(file_path, batch_size=50, schema=TABLE_SCHEMAS['orders']))
+            self.assertEqual(sum(len(batch) for batch in batches), len(self.orders))
+            self.assertEqual(batches[0]['order_status'].dtype, pl.Categorical)
+
+
+class TestLoadDataCompressed(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.csv_path = os.path.join(data_dir, "olist_orders_dataset.csv")
+        with open(self.csv_path, 'rb') as f:
+            self.content = f.read()
+        self.expected = self.as_text(load_data(self.csv_path, schema=TABLE_SCHEMAS['orders']))
+
+    def as_text(self, df):
+        # categoricals read separately have their own mappings, compare their values
+        return df.with_columns(pl.col(pl.Categorical).cast(pl.String))
+
+    def compressed_files(self):
+        files = {}
+        for name, compress in [("orders.csv.gz", gzip.compress), ("orders.csv.bz2", bz2.compress)]:
+            files[name] = os.path.join(self.tmp_dir.name, name)
+            with open(files[name], 'wb') as f:
+                f.write(compress(self.content))
+        files["orders.csv.zst"] = os.path.join(self.tmp_dir.name, "orders.csv.zst")
+        with pa.CompressedOutputStream(files["orders.csv.zst"], 'zstd') as f:
+            f.write(self.content)
+        files["orders.zip"] = os.path.join(self.tmp_dir.name, "orders.zip")
+        with zipfile.ZipFile(files["orders.zip"], 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("export/olist_orders_dataset.csv", self.content)
+        return files
+
+    def test_same_rows_as_the_csv(self):
+        "Test that every compression is read into the same typed frame as the plain csv"
+        for name, file_path in self.compressed_files().items():
+            df = load_data(file_path, schema=TABLE_SCHEMAS['orders'])
+            self.assertTrue(self.as_text(df).equals(self.expected), name)
+
+    def test_batches(self):
+        "Test that the decompressed stream is cut into batches of the requested size"
+        for name, file_path in self.compressed_files().items():
+            batches = list(load_data_batched(file_path, batch_size=60, schema=TABLE_SCHEMAS['orders']))
+            self.assertListEqual([len(batch) for batch in batches], [60, 60, 60, 20], name)
+            self.assertEqual(batches[0]['order_status'].dtype, pl.Categorical)
+            self.assertTrue(self.as_text(pl.concat(batches)).equals(self.expected), name)
+
+    def test_missing_column_is_left_out(self):
+        "Test that a column missing from the file is not made up, so the column checks report it"
+        file_path = os.path.join(self.tmp_dir.name, "orders.csv.gz")
+        with open(file_path, 'wb') as f:
+            f.write(gzip.compress(b"order_id,order_status\no1,delivered\n"))
+        batches = list(load_data_batched(file_path, schema=TABLE_SCHEMAS['orders']))
+        self.assertListEqual(batches[0].columns, ['order_id', 'order_status'])
+
+    def test_zip_without_csv(self):
+        file_path = os.path.join(self.tmp_dir.name, "orders.zip")
+        with zipfile.ZipFile(file_path, 'w') as archive:
+            archive.writestr("readme.txt", b"no data")
+        self.assertIsInstance(load_data(file_path), ValueError)
+
+    def test_empty_fields_are_nulls(self):
+        "Test that an empty text field is a null, as in the plain csv, and a quoted one is kept"
+        content = b"product_id,product_category_name\np1,\np2,\"\"\n"
+        plain_path = os.path.join(self.tmp_dir.name, "products.csv")
+        with open(plain_path, 'wb') as f:
+            f.write(content)
+        file_path = os.path.join(self.tmp_dir.name, "products.csv.gz")
+        with open(file_path, 'wb') as f:
+            f.write(gzip.compress(content))
+        df = load_data(file_path, schema=TABLE_SCHEMAS['products'])
+        self.assertListEqual(df['product_category_name'].to_list(), [None, ''])
+        self.assertTrue(df.equals(load_data(plain_path, schema=TABLE_SCHEMAS['products'])))
+
+
+class TestScanData(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.content = b"order_id,order_item_id,price\no1,1,58.90\no1,2,\n"
+
+    def test_csv_is_one_text_scan(self):
+        "Test that a csv is scanned lazily with every column as text"
+        file_path = os.path.join(self.tmp_dir.name, "order_items.csv")
+        with open(file_path, 'wb') as f:
+            f.write(self.content)
+        frames = list(scan_data(file_path))
+        self.assertEqual(len(frames), 1)
+        self.assertIsInstance(frames[0], pl.LazyFrame)
+        df = frames[0].collect()
+        self.assertListEqual(df.dtypes, [pl.String] * 3)
+        self.assertListEqual(df['price'].to_list(), ['58.90', None])
+
+    def test_compressed_csv_is_read_in_batches(self):
+        file_path = os.path.join(self.tmp_dir.name, "order_items.csv.gz")
+        with open(file_path, 'wb') as f:
+            f.write(gzip.compress(self.content))
+        frames = [frame.collect() for frame in scan_data(file_path, batch_size=1)]
+        self.assertListEqual([len(frame) for frame in frames], [1, 1])
+        self.assertListEqual(frames[0].dtypes, [pl.String] * 3)
+        self.assertIsNone(frames[1]['price'][0])
+
+    def test_invalid(self):
+        self.assertEqual(scan_data("orders.txt"), "File path does not exist or is not in the right format")
+
+
+class TestCheckMissingDuplicates(unittest.TestCase):
+
+    def test_counts(self):
+        "Test that rows with a null and repeated rows are counted"
+        df = pl.DataFrame({'seller_id': ['s1', 's2', 's2', None], 'seller_state': ['SP', None, None, 'RJ']})
+        self.assertEqual(check_missing_duplcates(df, 'sellers'), (3, 1))
+
+    def test_clean_frame(self):
+        df = pl.DataFrame({'seller_id': ['s1', 's2'], 'seller_state': ['SP', 'RJ']})
+        self.assertEqual(check_missing_duplcates(df, 'sellers'), (0, 0))
+
+
 class TestTransformProductCategoryDF(unittest.TestCase):
 
     def setUp(self):
@@ -174,6 +404,11 @@ class TestTransformDF(unittest.TestCase):
             result_columns = set(result_df.columns) - {"id"}
             self.assertEqual(original_columns, result_columns)
     
+        def test_with_offset(self):
+            "Test that the ids continue from the offset for batched loads"
+            result_df = transform__df(self.sample_data, offset=10)
+            self.assertListEqual(result_df["id"].to_list(), [11, 12, 13])
+
         def test_empty_dataframe(self):
             "Test the transform category function parameter with an empty DataFrame"
             empty_df = pl.DataFrame()
@@ -310,6 +545,107 @@ class TestProcessFactTable(unittest.TestCase):
         self.assertEqual(result, "Please provide a list of polars dataframes")
 
 
+class TestDeduplicateFactTable(unittest.TestCase):
+
+    def setUp(self):
+        self.fact_table = pl.DataFrame({'id': [1, 2, 3, 4, 5], 'order_key': [1, 1, 2, 1, 2],
+                                        'order_item_id': [1, 2, 1, 1, 1], 'price': [10.0, 20.0, 30.0, 15.0, 30.0]})
+
+    def test_natural_key(self):
+        "Test that one row is kept per (order, order_item_id), the last one"
+        deduplicated = deduplicate_fact_table(self.fact_table)
+        self.assertListEqual(deduplicated['id'].to_list(), [2, 4, 5])
+
+    def test_row_hash(self):
+        "Test that only rows repeated whole, apart from their id, are removed with the row hash"
+        deduplicated = deduplicate_fact_table(self.fact_table, row_hash=True)
+        self.assertListEqual(deduplicated['id'].to_list(), [1, 2, 4, 5])
+
+    def test_no_duplicates(self):
+        self.assertTrue(deduplicate_fact_table(self.fact_table.head(3)).equals(self.fact_table.head(3)))
+
+
+class TestJoinDimensions(unittest.TestCase):
+
+    def setUp(self):
+        self.fact_rows = pl.DataFrame({'order_key': [3, 1, 2, 1], 'seller_key': [2, 1, 9, 2],
+                                       'product_key': [1, 1, 2, 2]})
+        self.dimensions = {
+            'sellers': (pl.DataFrame({'seller_key': [1, 2, 3, 4], 'seller_state': ['SP', 'RJ', 'PR', 'MG']}),
+                        'seller_key', None),
+            'products': (pl.DataFrame({'product_key': [1, 2, 3], 'product_category_name': ['a', 'b', 'b']}),
+                         'product_key', None),
+            'product_category': (pl.DataFrame({'product_category_name': ['a', 'b', 'c'],
+                                               'product_category_name_english': ['A', 'B', 'C']}),
+                                 'product_category_name', 'products'),
+        }
+
+    def test_prune_dimensions(self):
+        "Test that only the dimension rows whose key is in the fact rows are kept"
+        pruned = prune_dimensions(self.fact_rows, self.dimensions)
+        self.assertListEqual(sorted(pruned['sellers'][0]['seller_key'].to_list()), [1, 2])
+        self.assertEqual(pruned['sellers'][3], 3)
+        self.assertListEqual(sorted(pruned['products'][0]['product_key'].to_list()), [1, 2])
+        self.assertListEqual(sorted(pruned['product_category'][0]['product_category_name'].to_list()), ['a', 'b'])
+
+    def test_plan_fact_joins(self):
+        "Test that the dimension matching the fewest keys joins first, after the dimension its key comes from"
+        cardinalities = {'customers': (100, 100), 'sellers': (10, 20), 'products': (50, 50), 'product_category': (1, 10)}
+        sources = {'product_category': 'products'}
+        self.assertListEqual(plan_fact_joins(cardinalities, sources),
+                             ['sellers', 'products', 'product_category', 'customers'])
+
+    def test_inner_join(self):
+        "Test that the joined rows are the inner join of the fact rows and the dimensions"
+        with self.assertLogs('src.processing', level='INFO') as logs:
+            fact_table = join_dimensions(self.fact_rows, self.dimensions)
+        self.assertListEqual(sorted(fact_table.select('order_key', 'seller_key', 'product_category_name_english').rows()),
+                             [(1, 1, 'A'), (1, 2, 'B'), (3, 2, 'A')])
+        self.assertIn('Fact join plan: fact rows (4) -> sellers (2 of 4 rows)', logs.output[0])
+        self.assertEqual(len(logs.output), 4)
+
+
+class TestProcessFactTableLazy(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.list_of_dfs = [transform__df(df) for df in [orders_df, order_items_df, customers_df, order_payments_df,
+                                                         products_df, sellers_df, product_category_df]]
+        self.scans = []
+        #the lazy build joins every table but order_payments
+        for i, df in enumerate(self.list_of_dfs[:3] + self.list_of_dfs[4:]):
+            file_path = os.path.join(self.tmp_dir.name, f"table_{i}.parquet" if i % 2 else f"table_{i}.arrow")
+            if i % 2:
+                df.write_parquet(file_path)
+            else:
+                df.write_ipc(file_path)
+            self.scans.append(scan_table(file_path))
+
+    def test_sink_matches_eager_build(self):
+        "Test that the fact rows sunk from parquet and arrow scans are the rows of process_fact_table"
+        eager = process_fact_table(self.list_of_dfs)
+        columns = [col for col in eager.columns if col != 'id']
+        sunk = pl.read_parquet(sink_fact_table(self.scans, os.path.join(self.tmp_dir.name, 'fact.parquet'),
+                                               columns=columns))
+        self.assertEqual(len(sunk), len(eager))
+        self.assertTrue(sunk.drop(FACT_TABLE_ROW_IDS).sort(columns).equals(eager.select(columns).sort(columns)))
+
+    def test_projection(self):
+        "Test that only the selected columns and the row ids are read from the scans"
+        fact_table = process_fact_table_lazy(self.scans, columns=['price'])
+        self.assertListEqual(fact_table.collect_schema().names(), FACT_TABLE_ROW_IDS + ['price'])
+        self.assertNotIn('customer_city', fact_table.explain())
+
+    def test_with_dataframes(self):
+        with self.assertRaises(ValueError):
+            process_fact_table_lazy(self.list_of_dfs)
+
+    def test_scan_table_csv(self):
+        with self.assertRaises(ValueError):
+            scan_table(orders_df_path)
+
+
 class TestGetTopSellers(unittest.TestCase):
     def setUp(self):
         # Sample data for testing
@@ -365,6 +701,14 @@ class TestGetTopSellers(unittest.TestCase):
         for col in result.columns:
             self.assertEqual(set(result[col].to_list()), set(expected_df[col].to_list()))
 
+    def test_seller_keys(self):
+        "Test that a fact table read with its surrogate keys is ranked on them"
+        df = self.sample_data.drop("seller_id").with_columns(pl.Series("seller_key", [1, 2, 1, 2], dtype=pl.Int32))
+        result = get_top_sellers(df)
+        self.assertListEqual(result.columns, ["id", "seller_key", "Total_sales"])
+        self.assertListEqual(result["seller_key"].to_list(), [2, 1])
+        self.assertListEqual(result["Total_sales"].to_list(), [6.0, 4.0])
+
     def test_empty_dataframe(self):
         "Test the get_top_sellers function parameter with an empty DataFrame"
         empty_df = pl.DataFrame()
@@ -384,4 +728,4 @@ class TestGetTopSellers(unittest.TestCase):
         self.assertEqual(result, "Please provide the valid Fact table")
 
 if __name__ == "__main__":
-    unittest.main()
\ No newline at end of file
+    unittest.main()
\ No newline at end of file
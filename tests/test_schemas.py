@@ -0,0 +1,77 @@
+import sys
+import os
+import unittest
+from datetime import datetime
+import polars as pl
+
+# Adding the project root directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database import Orders, Order_Items, Sellers
+from src.ingest import UPLOAD_TABLES
+from src.keys import NATURAL_IDS
+from src.schemas import TABLE_SCHEMAS, model_schema, csv_read_options, apply_schema
+
+
+class TestModelSchema(unittest.TestCase):
+
+    def test_types_follow_the_model(self):
+        "Test that every column of the model but id, load_seq and the surrogate keys gets the polars type of its column type"
+        schema = model_schema(Order_Items)
+        self.assertNotIn('id', schema)
+        self.assertNotIn('order_key', schema)
+        self.assertListEqual(list(schema), [col for col in Order_Items.__table__.columns.keys()
+                                            if col not in ('id', 'load_seq') and col not in NATURAL_IDS])
+        self.assertEqual(schema['order_id'], pl.String)
+        self.assertEqual(schema['order_item_id'], pl.Int32)
+        self.assertEqual(schema['shipping_limit_date'], pl.Datetime('us'))
+        self.assertEqual(schema['price'], pl.Float64)
+
+    def test_categorical_columns(self):
+        self.assertEqual(model_schema(Orders)['order_status'], pl.Categorical)
+        self.assertEqual(model_schema(Sellers)['seller_state'], pl.Categorical)
+        self.assertEqual(model_schema(Sellers)['seller_city'], pl.String)
+
+    def test_every_upload_table_has_a_schema(self):
+        "Test that each upload table's required columns are in its schema"
+        for upload_table in UPLOAD_TABLES.values():
+            schema = TABLE_SCHEMAS[upload_table['model'].__tablename__]
+            self.assertTrue(set(upload_table['columns']) <= set(schema))
+
+
+class TestCsvReadOptions(unittest.TestCase):
+
+    def test_projection(self):
+        "Test that only the schema's columns are read and every header column gets a dtype"
+        header = ['seller_id', 'extra', 'seller_state']
+        options = csv_read_options(header, TABLE_SCHEMAS['sellers'])
+        self.assertListEqual(options['columns'], ['seller_id', 'seller_state'])
+        self.assertListEqual(list(options['schema_overrides']), header)
+        self.assertEqual(options['schema_overrides']['extra'], pl.String)
+        self.assertEqual(options['schema_overrides']['seller_state'], pl.Categorical)
+
+
+class TestApplySchema(unittest.TestCase):
+
+    def test_casts_and_projects(self):
+        df = pl.DataFrame({
+            'order_id': ['o1'],
+            'order_item_id': [1],
+            'shipping_limit_date': ['2017-09-19 09:45:35'],
+            'price': [58.9],
+            'not_a_column': ['x'],
+        })
+        result = apply_schema(df, TABLE_SCHEMAS['order_items'])
+        self.assertListEqual(result.columns, ['order_id', 'order_item_id', 'shipping_limit_date', 'price'])
+        self.assertEqual(result['order_item_id'].dtype, pl.Int32)
+        self.assertEqual(result['shipping_limit_date'][0], datetime(2017, 9, 19, 9, 45, 35))
+
+    def test_other_timestamp_layouts(self):
+        "Test that timestamps that are not in the Olist layout are still parsed"
+        df = pl.DataFrame({'shipping_limit_date': ['2017-09-19', '2017-09-20']})
+        result = apply_schema(df, TABLE_SCHEMAS['order_items'])
+        self.assertEqual(result['shipping_limit_date'][1], datetime(2017, 9, 20))
+
+
+if __name__ == '__main__':
+    unittest.main()
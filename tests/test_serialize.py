@@ -0,0 +1,49 @@
+import sys
+import os
+import unittest
+from datetime import datetime
+import polars as pl
+
+# Adding the project root directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.serialize import check_columns, df_to_list_of_dicts
+
+
+class TestDfToListOfDicts(unittest.TestCase):
+
+    def setUp(self):
+        self.df = pl.DataFrame({
+            "id": [1, 2, 3],
+            "seller_id": ["seller1", "seller2", "seller3"],
+            "shipping_limit_date": [datetime(2017, 1, 1), datetime(2017, 1, 2), None],
+            "price": [10.5, 20.0, None]
+        })
+
+    def test_records(self):
+        "Test that every row becomes one dict keyed by column name with python values"
+        records = df_to_list_of_dicts(self.df)
+        self.assertEqual(len(records), 3)
+        self.assertEqual(records[0], {"id": 1, "seller_id": "seller1",
+                                      "shipping_limit_date": datetime(2017, 1, 1), "price": 10.5})
+        self.assertIsNone(records[2]["price"])
+
+    def test_limit_and_columns(self):
+        "Test that only the requested rows and columns are serialized"
+        records = df_to_list_of_dicts(self.df, columns=["id", "price"], limit=2)
+        self.assertListEqual(records, [{"id": 1, "price": 10.5}, {"id": 2, "price": 20.0}])
+
+    def test_empty_frame(self):
+        "Test that an empty frame gives an empty body"
+        self.assertListEqual(df_to_list_of_dicts(pl.DataFrame()), [])
+
+    def test_check_columns(self):
+        "Test that missing columns are reported from the schema"
+        check_columns(self.df, ["id", "price"])
+        with self.assertRaises(ValueError) as context:
+            check_columns(self.df, ["id", "unknown_column"])
+        self.assertIn("unknown_column", str(context.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import sys
+import os
+import gzip
+import tempfile
+import unittest
+import polars as pl
+
+# Adding the project root directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.validation import validate_file, validate_frames
+
+ORDERS_HEADER = (b"order_id,customer_id,order_status,order_purchase_timestamp,order_approved_at,"
+                 b"order_delivered_carrier_date,order_delivered_customer_date,order_estimated_delivery_date\n")
+ORDERS_CSV = ORDERS_HEADER + (
+    b"o1,c1,delivered,2017-10-02 10:56:33,2017-10-02 11:07:15,2017-10-04 19:55:00,2017-10-10 21:25:13,2017-10-18 00:00:00\n"
+    b"o2,c2,shipped,2018-07-24 20:41:37,2018-07-26 03:24:27,2018-07-26 14:31:00,,2018-08-13 00:00:00\n"
+    b"o3,c3,canceled,2018-08-08 08:38:49,,,,2018-09-04 00:00:00\n")
+ORDER_ITEMS_CSV = (b"order_id,order_item_id,product_id,seller_id,shipping_limit_date,price,freight_value\n"
+                   b"o1,1,p1,s1,2017-09-19 09:45:35,58.90,13.29\n"
+                   b"o1,2,p2,s1,2017-09-19 09:45:35,239.90,19.93\n"
+                   b"o2,1,p1,s2,2017-05-03 11:05:13,199.00,17.87\n")
+
+
+class TestValidateFile(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def write_file(self, name, content):
+        file_path = os.path.join(self.tmp_dir.name, name)
+        with open(file_path, 'wb') as f:
+            f.write(content)
+        return file_path
+
+    def test_valid_file(self):
+        "Test that a clean upload is valid and every column is reported"
+        report = validate_file('orders', self.write_file('orders.csv', ORDERS_CSV))
+        self.assertTrue(report['valid'])
+        self.assertEqual(report['rows'], 3)
+        self.assertListEqual(report['errors'], [])
+        self.assertEqual(report['columns']['order_approved_at']['null_count'], 1)
+        self.assertEqual(report['columns']['order_approved_at']['dtype'], 'Datetime')
+        self.assertEqual(report['columns']['order_status']['domain_errors'], 0)
+
+    def test_missing_columns(self):
+        "Test that the wrong file is rejected from its header without reading its rows"
+        report = validate_file('order_items', self.write_file('orders.csv', ORDERS_CSV))
+        self.assertFalse(report['valid'])
+        self.assertIn('order_item_id', report['missing_columns'])
+        self.assertIsNone(report['rows'])
+        self.assertDictEqual(report['columns'], {})
+
+    def test_no_rows(self):
+        report = validate_file('orders', self.write_file('orders.csv', ORDERS_HEADER))
+        self.assertFalse(report['valid'])
+        self.assertListEqual(report['errors'], ['The file has no rows'])
+
+    def test_type_errors(self):
+        "Test that values that are not of the model's type are counted per column"
+        content = ORDER_ITEMS_CSV + b"o2,two,p1,s2,2017-05-03 11:05:13,free,17.87\n"
+        report = validate_file('order_items', self.write_file('order_items.csv', content))
+        self.assertFalse(report['valid'])
+        self.assertEqual(report['columns']['order_item_id']['type_errors'], 1)
+        self.assertEqual(report['columns']['price']['type_errors'], 1)
+        self.assertEqual(report['columns']['freight_value']['type_errors'], 0)
+
+    def test_other_datetime_format(self):
+        "Test that timestamps in another layout than Olist's are not type errors"
+        report = validate_file('orders', self.write_file('orders.csv', ORDERS_CSV.replace(b" ", b"T")))
+        self.assertTrue(report['valid'], report['errors'])
+
+    def test_missing_natural_key(self):
+        content = ORDERS_CSV + b",c4,delivered,2018-08-08 08:38:49,,,,2018-09-04 00:00:00\n"
+        report = validate_file('orders', self.write_file('orders.csv', content))
+        self.assertFalse(report['valid'])
+        self.assertEqual(report['columns']['order_id']['null_count'], 1)
+
+    def test_domain_errors(self):
+        content = ORDERS_CSV.replace(b"shipped", b"lost")
+        report = validate_file('orders', self.write_file('orders.csv', content))
+        self.assertFalse(report['valid'])
+        self.assertEqual(report['columns']['order_status']['domain_errors'], 1)
+
+    def test_duplicate_keys(self):
+        "Test that rows repeating a natural key are counted, the first of them is not"
+        content = ORDER_ITEMS_CSV + b"o1,2,p3,s3,2017-09-19 09:45:35,9.90,1.00\n"
+        report = validate_file('order_items', self.write_file('order_items.csv', content))
+        self.assertFalse(report['valid'])
+        self.assertEqual(report['duplicate_keys'], 1)
+
+    def test_date_order_is_a_warning(self):
+        "Test that timestamps out of order are reported without rejecting the upload"
+        content = ORDERS_CSV.replace(b"2017-10-04 19:55:00", b"2017-10-01 19:55:00")
+        report = validate_file('orders', self.write_file('orders.csv', content))
+        self.assertTrue(report['valid'])
+        self.assertEqual(report['date_order_violations']['order_approved_at > order_delivered_carrier_date'], 1)
+        self.assertEqual(len(report['warnings']), 1)
+
+    def test_compressed_file(self):
+        "Test that a compressed csv read in batches gets the report of the plain file"
+        content = ORDERS_CSV.replace(b"shipped", b"lost")
+        plain = validate_file('orders', self.write_file('orders.csv', content))
+        compressed = validate_file('orders', self.write_file('orders.csv.gz', gzip.compress(content)),
+                                   batch_size=1)
+        for key in ['valid', 'rows', 'errors', 'columns', 'duplicate_keys', 'date_order_violations']:
+            self.assertEqual(compressed[key], plain[key], key)
+
+
+class TestValidateFrames(unittest.TestCase):
+
+    def test_duplicates_across_frames(self):
+        "Test that a key repeated in a later batch is found"
+        df = pl.read_csv(ORDER_ITEMS_CSV, infer_schema=False)
+        report = validate_frames('order_items', iter([df.head(2), df.tail(1), df.head(1)]))
+        self.assertEqual(report['rows'], 4)
+        self.assertEqual(report['duplicate_keys'], 1)
+
+    def test_typed_frame(self):
+        "Test that a frame already in the model's types is checked the same way"
+        df = pl.read_csv(ORDER_ITEMS_CSV, try_parse_dates=True)
+        report = validate_frames('order_items', [df])
+        self.assertTrue(report['valid'], report['errors'])
+        self.assertEqual(report['columns']['price']['type_errors'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
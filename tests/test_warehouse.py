@@ -0,0 +1,474 @@
+import sys
+import os
+import unittest
+from unittest.mock import patch
+from datetime import datetime
+import polars as pl
+
+# Adding the project root directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database import (FactTable, Top_Sellers, Sellers, Customers, Orders, Order_Items,
+                          Order_Payments, Products, Product_Category, get_raw_connection, read_table)
+from src.keys import decode_keys, encoded_columns
+from src.processing import transform__df, process_fact_table
+from src.warehouse import (build_fact_table_sql, build_fact_table_incremental, build_fact_table_streaming,
+                           build_top_sellers, rollback_table, empty_dimension_tables, get_watermarks,
+                           check_integrity, read_fact_table_sources, export_fact_table_sources,
+                           FACT_TABLE_WATERMARK_SOURCES)
+from tests import DuckDBTestCase, bulk_insert_df
+
+
+def sample_tables():
+    # a small star schema where one order item points at a product without a category
+    # translation, so the inner joins have something to drop
+    orders = pl.DataFrame({
+        "order_id": ["o1", "o2", "o3"],
+        "customer_id": ["c1", "c2", "c3"],
+        "order_status": ["delivered", "shipped", "delivered"],
+        "order_purchase_timestamp": [datetime(2018, 1, 1), datetime(2018, 1, 2), datetime(2018, 1, 3)],
+        "order_approved_at": [datetime(2018, 1, 1), datetime(2018, 1, 2), datetime(2018, 1, 3)],
+        "order_delivered_carrier_date": [datetime(2018, 1, 2), datetime(2018, 1, 3), datetime(2018, 1, 4)],
+        "order_delivered_customer_date": [datetime(2018, 1, 5), datetime(2018, 1, 6), datetime(2018, 1, 7)],
+        "order_estimated_delivery_date": [datetime(2018, 1, 9), datetime(2018, 1, 9), datetime(2018, 1, 9)],
+    })
+    order_items = pl.DataFrame({
+        "order_id": ["o1", "o1", "o2", "o3"],
+        "order_item_id": [1, 2, 1, 1],
+        "product_id": ["p1", "p2", "p1", "p3"],
+        "seller_id": ["s1", "s2", "s1", "s2"],
+        "shipping_limit_date": [datetime(2018, 1, 2)] * 4,
+        "price": [10.0, 20.0, 30.0, 40.0],
+        "freight_value": [1.0, 2.0, 3.0, 4.0],
+    })
+    customers = pl.DataFrame({
+        "customer_id": ["c1", "c2", "c3"],
+        "customer_unique_id": ["u1", "u2", "u3"],
+        "customer_zip_code_prefix": [1000, 2000, 3000],
+        "customer_city": ["sao paulo", "rio de janeiro", "curitiba"],
+        "customer_state": ["SP", "RJ", "PR"],
+    })
+    order_payments = pl.DataFrame({
+        "order_id": ["o1", "o2", "o3"],
+        "payment_sequential": [1, 1, 1],
+        "payment_type": ["credit_card", "boleto", "voucher"],
+        "payment_installments": [1, 2, 3],
+        "payment_value": [33.0, 33.0, 44.0],
+    })
+    products = pl.DataFrame({
+        "product_id": ["p1", "p2", "p3"],
+        "product_category_name": ["beleza_saude", "esporte_lazer", "sem_traducao"],
+        "product_name_lenght": ["10", "20", "30"],
+        "product_description_lenght": ["100", "200", "300"],
+        "product_photos_qty": ["1", "2", "3"],
+        "product_weight_g": [100, 200, 300],
+        "product_length_cm": [10, 20, 30],
+        "product_height_cm": [10, 20, 30],
+        "product_width_cm": [10, 20, 30],
+    })
+    sellers = pl.DataFrame({
+        "seller_id": ["s1", "s2"],
+        "seller_zip_code_prefix": [4000, 5000],
+        "seller_city": ["campinas", "santos"],
+        "seller_state": ["SP", "SP"],
+    })
+    product_category = pl.DataFrame({
+        "product_category_name": ["beleza_saude", "esporte_lazer"],
+        "product_category_name_english": ["health_beauty", "sports_leisure"],
+    })
+    return {
+        Orders: orders, Order_Items: order_items, Customers: customers,
+        Order_Payments: order_payments, Products: products, Sellers: sellers,
+        Product_Category: product_category,
+    }
+
+
+class WarehouseTestCase(DuckDBTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tables = sample_tables()
+
+    def load_tables(self):
+        for model, df in self.tables.items():
+            bulk_insert_df(self.session, model, transform__df(df))
+
+    def fact_ids(self):
+        # fact table id by (order_id, order_item_id), the order keys decoded
+        fact = decode_keys(get_raw_connection(self.session),
+                           read_table(self.session, FactTable, columns=['id', 'order_key', 'order_item_id']))
+        return {(order_id, order_item_id): fact_id for fact_id, order_id, order_item_id in fact.rows()}
+
+
+class TestBuildFactTableSQL(WarehouseTestCase):
+
+    def test_matches_polars_build(self):
+        "The sql build should produce the same rows as processing.process_fact_table"
+        self.load_tables()
+        result = build_fact_table_sql(self.session)
+
+        polars_fact = process_fact_table([
+            self.tables[Orders], self.tables[Order_Items], self.tables[Customers],
+            self.tables[Order_Payments], self.tables[Products], self.tables[Sellers],
+            self.tables[Product_Category]])
+        sql_fact = decode_keys(get_raw_connection(self.session), pl.from_arrow(
+            get_raw_connection(self.session).execute("SELECT * FROM fact_table ORDER BY id").arrow()))
+
+        self.assertEqual(result['new_count'], len(polars_fact))
+        self.assertEqual(result['existing_count'], 0)
+        key = ["order_id", "order_item_id", "seller_city", "product_category_name_english"]
+        self.assertListEqual(sql_fact.select(key).rows(), polars_fact.select(key).rows())
+
+    def test_duplicate_order_items(self):
+        "A repeated order item should leave one fact row, the last one loaded, like the polars build"
+        self.tables[Order_Items] = pl.concat([self.tables[Order_Items],
+                                              self.tables[Order_Items].head(1).with_columns(price=pl.lit(15.0))])
+        self.load_tables()
+        result = build_fact_table_sql(self.session)
+
+        polars_fact = process_fact_table([transform__df(self.tables[model]) for model in [
+            Orders, Order_Items, Customers, Order_Payments, Products, Sellers, Product_Category]])
+        sql_fact = decode_keys(get_raw_connection(self.session), pl.from_arrow(
+            get_raw_connection(self.session).execute("SELECT * FROM fact_table ORDER BY id").arrow()))
+
+        self.assertEqual(result['new_count'], 3)
+        self.assertListEqual(sql_fact['id'].to_list(), [1, 2, 3])
+        key = ["id", "order_id", "order_item_id", "price"]
+        self.assertListEqual(sql_fact.select(key).rows(), polars_fact.select(key).rows())
+        self.assertEqual(self.fact_ids()[('o1', 1)], 2)
+
+    def test_rebuild_counts_existing(self):
+        "A second build should find every row already present and insert nothing"
+        self.load_tables()
+        build_fact_table_sql(self.session)
+        result = build_fact_table_sql(self.session)
+
+        self.assertEqual(result['new_count'], 0)
+        self.assertEqual(result['existing_count'], 3)
+        self.assertEqual(self.session.query(FactTable).count(), 3)
+
+    def test_empty_dimension_tables(self):
+        "Empty source tables should be reported before building"
+        self.assertIn('orders', empty_dimension_tables(get_raw_connection(self.session)))
+        self.load_tables()
+        self.assertListEqual(empty_dimension_tables(get_raw_connection(self.session)), [])
+
+
+class TestBuildFactTableStreaming(WarehouseTestCase):
+
+    def fact_rows(self):
+        return get_raw_connection(self.session).execute("SELECT * FROM fact_table ORDER BY id").fetchall()
+
+    def test_matches_sql_build(self):
+        "The streaming build should write the rows and ids of the sql build"
+        self.load_tables()
+        result = build_fact_table_streaming(self.session, work_dir=self.tmp_dir.name)
+        streaming_rows = self.fact_rows()
+        get_raw_connection(self.session).execute("DELETE FROM fact_table")
+        self.session.commit()
+        build_fact_table_sql(self.session)
+
+        self.assertEqual(result['new_count'], 3)
+        self.assertEqual(len(result['preview']), 3)
+        self.assertListEqual(streaming_rows, self.fact_rows())
+        self.assertDictEqual(result['watermarks'], {source: 1 for source in FACT_TABLE_WATERMARK_SOURCES})
+
+    def test_duplicate_order_items(self):
+        "A repeated order item should be kept once, as in the sql build"
+        self.tables[Order_Items] = pl.concat([self.tables[Order_Items],
+                                              self.tables[Order_Items].head(1).with_columns(price=pl.lit(15.0))])
+        self.load_tables()
+        result = build_fact_table_streaming(self.session, work_dir=self.tmp_dir.name)
+        streaming_rows = self.fact_rows()
+        get_raw_connection(self.session).execute("DELETE FROM fact_table")
+        self.session.commit()
+        build_fact_table_sql(self.session)
+
+        self.assertEqual(result['new_count'], 3)
+        self.assertListEqual(streaming_rows, self.fact_rows())
+
+    def test_rebuild_counts_existing(self):
+        "A second build should insert nothing and leave no files behind"
+        self.load_tables()
+        work_dir = os.path.join(self.tmp_dir.name, 'work')
+        os.makedirs(work_dir)
+        build_fact_table_streaming(self.session, work_dir=work_dir)
+        result = build_fact_table_streaming(self.session, work_dir=work_dir)
+
+        self.assertEqual(result['new_count'], 0)
+        self.assertEqual(result['existing_count'], 3)
+        self.assertListEqual(os.listdir(work_dir), [])
+
+    def test_duplicate_dimension_rows(self):
+        "A customer loaded twice should leave the same fact rows, the later customer row's, in every engine"
+        self.tables[Customers] = pl.concat([self.tables[Customers],
+                                            self.tables[Customers].head(1).with_columns(customer_city=pl.lit('santos'))])
+        self.load_tables()
+        build_fact_table_streaming(self.session, work_dir=self.tmp_dir.name)
+        streaming_rows = self.fact_rows()
+        build_fact_table_sql(self.session)
+        sql_rows = self.fact_rows()
+        polars_fact = process_fact_table(read_fact_table_sources(self.session)[0])
+
+        self.assertEqual(len(sql_rows), 3)
+        self.assertListEqual(streaming_rows, sql_rows)
+        self.assertListEqual(polars_fact.select(FactTable.__table__.columns.keys()).rows(), sql_rows)
+        cities = read_table(self.session, FactTable, columns=['order_item_id', 'customer_city'])
+        self.assertIn((1, 'santos'), cities.rows())
+
+    def test_exports_only_the_joined_columns(self):
+        "Only the tables and columns the lazy join reads should be written to parquet"
+        self.load_tables()
+        scans = export_fact_table_sources(get_raw_connection(self.session), self.tmp_dir.name)
+
+        self.assertEqual(len(scans), 6)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir.name, 'order_payments.parquet')))
+        self.assertListEqual(scans[0].collect_schema().names()[:2], ['id', 'order_key'])
+        self.assertListEqual(scans[3].collect_schema().names(), ['id', 'product_key', 'product_category_name'])
+
+
+class TestReadFactTableSources(WarehouseTestCase):
+
+    def test_matches_sequential_reads(self):
+        "The parallel reads should return the frames of reading each table in turn"
+        self.load_tables()
+        frames, fetch_seconds = read_fact_table_sources(self.session, workers=3)
+
+        self.assertListEqual(list(fetch_seconds), [model.__tablename__ for model in self.tables])
+        for model, df in zip(self.tables, frames):
+            self.assertTrue(df.equals(read_table(self.session, model, columns=encoded_columns(model))),
+                            model.__tablename__)
+        self.assertEqual(len(frames[1]), 4)
+
+    def test_empty_tables(self):
+        frames, _ = read_fact_table_sources(self.session)
+        self.assertTrue(all(df.is_empty() for df in frames))
+
+
+class TestRebuildSwap(WarehouseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.load_tables()
+        build_fact_table_sql(self.session)
+
+    def table_names(self):
+        return sorted(name for name, in get_raw_connection(self.session).execute(
+            "SELECT table_name FROM duckdb_tables() WHERE table_name LIKE 'fact_table%'").fetchall())
+
+    def test_readers_see_the_live_table(self):
+        "A reader should keep the previous fact table until the rebuild is committed"
+        reader = get_raw_connection(self.session).duplicate()
+        self.addCleanup(reader.close)
+        get_raw_connection(self.session).execute("DELETE FROM order_items WHERE order_item_id = 2")
+        with patch.object(self.session, 'commit') as mock_commit:
+            result = build_fact_table_sql(self.session)
+            mock_commit.assert_called_once()
+            self.assertEqual(result['built_count'], 2)
+            self.assertEqual(reader.execute("SELECT count(*) FROM fact_table").fetchone()[0], 3)
+        self.session.commit()
+        self.assertEqual(reader.execute("SELECT count(*) FROM fact_table").fetchone()[0], 2)
+        self.assertListEqual(self.table_names(), ['fact_table', 'fact_table_previous'])
+
+    def test_failed_rebuild_keeps_the_live_table(self):
+        "A rebuild that fails before the swap should leave fact_table and no staging table behind"
+        with patch('src.warehouse.publish_staging_table', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                build_fact_table_sql(self.session)
+        self.assertEqual(self.session.query(FactTable).count(), 3)
+        self.assertListEqual(self.table_names(), ['fact_table', 'fact_table_previous'])
+
+    def test_rollback(self):
+        "Rolling back should swap the previous version in, and rolling back again undo it"
+        get_raw_connection(self.session).execute("DELETE FROM order_items WHERE order_item_id = 2")
+        build_fact_table_sql(self.session)
+        self.assertEqual(self.session.query(FactTable).count(), 2)
+
+        result = rollback_table(self.session, FactTable)
+        self.assertDictEqual(result, {'table': 'fact_table', 'rows': 3, 'previous_rows': 2})
+        self.assertEqual(self.session.query(FactTable).count(), 3)
+        self.assertDictEqual(get_watermarks(get_raw_connection(self.session), 'fact_table'),
+                             {source: 0 for source in FACT_TABLE_WATERMARK_SOURCES})
+        rollback_table(self.session, FactTable)
+        self.assertEqual(self.session.query(FactTable).count(), 2)
+
+    def test_nothing_to_roll_back(self):
+        "A table that was never rebuilt has no previous version"
+        with self.assertRaises(ValueError):
+            rollback_table(self.session, Top_Sellers)
+
+    def test_top_sellers_replaced(self):
+        "A second ranking should replace the top sellers, not add to them"
+        build_top_sellers(self.session)
+        get_raw_connection(self.session).execute("UPDATE fact_table SET price = price * 10 WHERE seller_key = 2")
+        self.session.commit()
+        result = build_top_sellers(self.session)
+        self.assertEqual(result['existing_count'], 2)
+        top_sellers = read_table(self.session, Top_Sellers).sort('id')
+        self.assertListEqual(top_sellers['total_sales'].to_list(), [200.0, 40.0])
+
+
+class TestCheckIntegrity(WarehouseTestCase):
+
+    def test_orphans_counted(self):
+        "Test that keys missing from the referenced table are counted with samples"
+        self.tables[Order_Items] = self.tables[Order_Items].with_columns(
+            pl.when(pl.col("order_item_id") == 2).then(pl.lit("s9")).otherwise(pl.col("seller_id")).alias("seller_id"))
+        self.load_tables()
+        report = check_integrity(get_raw_connection(self.session))
+
+        sellers = report['relationships']['order_items.seller_id']
+        self.assertEqual(sellers['references'], 'sellers.seller_id')
+        self.assertEqual(sellers['rows'], 4)
+        self.assertEqual(sellers['orphan_rows'], 1)
+        self.assertListEqual(sellers['sample_keys'], ['s9'])
+        categories = report['relationships']['products.product_category_name']
+        self.assertEqual(categories['orphan_rows'], 1)
+        self.assertListEqual(categories['sample_keys'], ['sem_traducao'])
+        self.assertEqual(report['relationships']['order_items.order_id']['orphan_rows'], 0)
+        self.assertEqual(report['orphan_rows'], 2)
+
+    def test_dropped_order_items_match_the_build(self):
+        "Test that the order items reported as dropped are the ones missing from the fact table"
+        self.tables[Orders] = self.tables[Orders].with_columns(
+            pl.when(pl.col("order_id") == "o2").then(pl.lit("c9")).otherwise(pl.col("customer_id")).alias("customer_id"))
+        self.load_tables()
+        report = check_integrity(get_raw_connection(self.session))
+        result = build_fact_table_sql(self.session)
+        self.assertEqual(report['order_items_dropped'], 2)
+        self.assertEqual(report['order_items_dropped'], len(self.tables[Order_Items]) - result['built_count'])
+
+    def test_null_keys(self):
+        self.tables[Products] = self.tables[Products].with_columns(
+            pl.when(pl.col("product_id") == "p3").then(None).otherwise(pl.col("product_category_name"))
+            .alias("product_category_name"))
+        self.load_tables()
+        categories = check_integrity(get_raw_connection(self.session))['relationships']['products.product_category_name']
+        self.assertEqual(categories['orphan_rows'], 1)
+        self.assertEqual(categories['null_keys'], 1)
+        self.assertListEqual(categories['sample_keys'], [])
+
+
+class TestBuildFactTableIncremental(WarehouseTestCase):
+
+    def add_order(self, order_id, offset):
+        # a new order for an existing customer with one item, loaded after the first build
+        orders = self.tables[Orders].head(1).with_columns(pl.lit(order_id).alias("order_id"))
+        order_items = self.tables[Order_Items].head(1).with_columns(pl.lit(order_id).alias("order_id"))
+        bulk_insert_df(self.session, Orders, transform__df(orders, offset=offset))
+        bulk_insert_df(self.session, Order_Items, transform__df(order_items, offset=offset))
+
+    def test_first_run_builds_everything(self):
+        "Without a watermark the incremental build covers all loaded rows"
+        self.load_tables()
+        result = build_fact_table_incremental(self.session)
+
+        self.assertEqual(result['new_count'], 3)
+        self.assertEqual(result['updated_count'], 0)
+        self.assertEqual(get_watermarks(get_raw_connection(self.session), 'fact_table'),
+                         {source: 1 for source in FACT_TABLE_WATERMARK_SOURCES})
+
+    def test_only_new_orders_are_joined(self):
+        "A second run only touches the order that arrived after the watermark"
+        self.load_tables()
+        build_fact_table_incremental(self.session)
+        ids_before = self.fact_ids()
+
+        self.add_order("o4", offset=100)
+        result = build_fact_table_incremental(self.session)
+
+        self.assertEqual(result['delta_count'], 1)
+        self.assertEqual(result['new_count'], 1)
+        preview = decode_keys(get_raw_connection(self.session), result['preview'])
+        self.assertListEqual(preview['order_id'].to_list(), ["o4"])
+        ids_after = self.fact_ids()
+        #ids of the rows built earlier do not move
+        for key, fact_id in ids_before.items():
+            self.assertEqual(ids_after[key], fact_id)
+        self.assertEqual(ids_after[("o4", 1)], 4)
+
+    def test_upserted_order_is_updated(self):
+        "An order upserted with a new status after a build is folded in again, in place"
+        self.load_tables()
+        build_fact_table_incremental(self.session)
+        ids_before = self.fact_ids()
+
+        orders = self.tables[Orders].filter(pl.col("order_id") == "o1").with_columns(
+            pl.lit("canceled").alias("order_status"))
+        bulk_insert_df(self.session, Orders, transform__df(orders, offset=100), mode='upsert')
+        result = build_fact_table_incremental(self.session)
+
+        self.assertEqual(result['delta_count'], 2)
+        self.assertEqual(result['new_count'], 0)
+        self.assertEqual(result['updated_count'], 2)
+        fact = decode_keys(get_raw_connection(self.session),
+                           read_table(self.session, FactTable, columns=['order_key', 'order_status']))
+        self.assertListEqual(fact.filter(pl.col("order_id") == "o1")['order_status'].to_list(),
+                             ["canceled", "canceled"])
+        self.assertEqual(self.fact_ids(), ids_before)
+
+    def test_upserted_customer_is_updated(self):
+        "A customer upserted with a new city updates the fact rows of its orders"
+        self.load_tables()
+        build_fact_table_incremental(self.session)
+
+        customers = self.tables[Customers].filter(pl.col("customer_id") == "c1").with_columns(
+            pl.lit("santos").alias("customer_city"))
+        bulk_insert_df(self.session, Customers, transform__df(customers, offset=100), mode='upsert')
+        result = build_fact_table_incremental(self.session)
+
+        self.assertEqual(result['delta_count'], 2)
+        self.assertEqual(result['updated_count'], 2)
+        cities = get_raw_connection(self.session).execute(
+            "SELECT DISTINCT customer_city FROM fact_table WHERE customer_key = "
+            "(SELECT customer_key FROM customers WHERE customer_id = 'c1')").fetchall()
+        self.assertListEqual(cities, [("santos",)])
+
+    def test_late_dimension_row(self):
+        "A category translation loaded after the build brings in the order item it was missing"
+        self.load_tables()
+        build_fact_table_incremental(self.session)
+        self.assertEqual(self.session.query(FactTable).count(), 3)
+
+        category = pl.DataFrame({"product_category_name": ["sem_traducao"],
+                                 "product_category_name_english": ["untranslated"]})
+        bulk_insert_df(self.session, Product_Category, transform__df(category, offset=100))
+        result = build_fact_table_incremental(self.session)
+
+        self.assertEqual(result['delta_count'], 1)
+        self.assertEqual(result['new_count'], 1)
+        preview = decode_keys(get_raw_connection(self.session), result['preview'])
+        self.assertListEqual(preview['order_id'].to_list(), ["o3"])
+
+    def test_unchanged_upsert_is_not_folded_in(self):
+        "Upserting rows that are already loaded as they are leaves nothing for the next run"
+        self.load_tables()
+        build_fact_table_incremental(self.session)
+        bulk_insert_df(self.session, Orders, transform__df(self.tables[Orders], offset=100), mode='upsert')
+        result = build_fact_table_incremental(self.session)
+
+        self.assertEqual(result['delta_count'], 0)
+
+    def test_nothing_new(self):
+        "Running again without new data writes nothing"
+        self.load_tables()
+        build_fact_table_incremental(self.session)
+        result = build_fact_table_incremental(self.session)
+
+        self.assertEqual(result['delta_count'], 0)
+        self.assertEqual(result['new_count'], 0)
+        self.assertEqual(self.session.query(FactTable).count(), 3)
+
+    def test_after_full_build(self):
+        "A full build records its watermark so the next incremental run starts from there"
+        self.load_tables()
+        build_fact_table_sql(self.session)
+        self.add_order("o4", offset=100)
+        result = build_fact_table_incremental(self.session)
+
+        self.assertEqual(result['delta_count'], 1)
+        self.assertEqual(self.session.query(FactTable).count(), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()